@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, Text, ForeignKey, LargeBinary
+from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, Text, ForeignKey, LargeBinary, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -38,6 +38,12 @@ class MissingPersonCase(Base):
     matches = relationship("Match", back_populates="case")
     location_history = relationship("LocationHistory", back_populates="case")
     
+    __table_args__ = (
+        # Keyset pagination, optionally filtered by status
+        Index("ix_missing_person_cases_created_at_id", "created_at", "id"),
+        Index("ix_missing_person_cases_is_found_created_at", "is_found", "created_at"),
+    )
+    
     def set_aadhaar(self, aadhaar_number):
         """Hash and store Aadhaar number"""
         if aadhaar_number:
@@ -54,9 +60,47 @@ class Sighting(Base):
     location_name = Column(String)
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
     processed = Column(Boolean, default=False)
+    matched_at = Column(DateTime(timezone=True))  # Cases changed after this have not been compared yet
+    content_hash = Column(String(64), index=True)  # SHA-256 of the uploaded file
+    duplicate_of = Column(Integer, ForeignKey("sightings.id"), index=True)  # Earlier sighting with the same media
     
     # Relationships
     matches = relationship("Match", back_populates="sighting")
+    faces = relationship("SightingFace", back_populates="sighting", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index("ix_sightings_uploaded_at_id", "uploaded_at", "id"),
+    )
+
+class SightingFingerprint(Base):
+    __tablename__ = "sighting_fingerprints"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    sighting_id = Column(Integer, ForeignKey("sightings.id"), unique=True, nullable=False)
+    file_type = Column(String, nullable=False)
+    perceptual_hash = Column(String, nullable=False)  # Comma separated 64-bit dHashes in hex, one per keyframe
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class SightingFace(Base):
+    __tablename__ = "sighting_faces"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    sighting_id = Column(Integer, ForeignKey("sightings.id"), index=True, nullable=False)
+    frame_index = Column(Integer, default=0)  # 0 for images
+    face_index = Column(Integer, default=0)
+    box_top = Column(Integer)
+    box_right = Column(Integer)
+    box_bottom = Column(Integer)
+    box_left = Column(Integer)
+    crop_path = Column(String)  # Crop pack, or a standalone image for faces stored before packs
+    crop_offset = Column(Integer)  # Byte range of the crop in the pack
+    crop_length = Column(Integer)
+    embedding = Column(LargeBinary)  # Packed face embedding
+    quality = Column(Float)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    sighting = relationship("Sighting", back_populates="faces")
 
 class Match(Base):
     __tablename__ = "matches"
@@ -65,7 +109,9 @@ class Match(Base):
     case_id = Column(Integer, ForeignKey("missing_person_cases.id"))
     sighting_id = Column(Integer, ForeignKey("sightings.id"))
     confidence_score = Column(Float, nullable=False)
-    matched_face_path = Column(String)  # Path to extracted face image
+    matched_face_path = Column(String)  # Standalone face image, or the crop pack when not materialized
+    matched_face_offset = Column(Integer)  # Byte range of the crop when matched_face_path is a pack
+    matched_face_length = Column(Integer)
     verified = Column(Boolean, default=False)
     verified_by = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -74,6 +120,13 @@ class Match(Base):
     case = relationship("MissingPersonCase", back_populates="matches")
     sighting = relationship("Sighting", back_populates="matches")
     verified_by_user = relationship("User")
+    
+    __table_args__ = (
+        Index("ix_matches_created_at_id", "created_at", "id"),
+        Index("ix_matches_verified_created_at", "verified", "created_at"),
+        # One match per case and sighting, also the ON CONFLICT target of match upserts
+        Index("ix_matches_case_id_sighting_id", "case_id", "sighting_id", unique=True),
+    )
 
 class LocationHistory(Base):
     __tablename__ = "location_history"
@@ -87,4 +140,67 @@ class LocationHistory(Base):
     confidence_score = Column(Float)  # From the match that created this location
     
     # Relationships
-    case = relationship("MissingPersonCase", back_populates="location_history")
\ No newline at end of file
+    case = relationship("MissingPersonCase", back_populates="location_history")
+
+class ProcessingJob(Base):
+    __tablename__ = "processing_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    sighting_id = Column(Integer, ForeignKey("sightings.id"), index=True, nullable=False)
+    status = Column(String, nullable=False, default="pending", index=True)  # pending, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    locked_by = Column(String)  # Worker holding the lease
+    lease_expires_at = Column(DateTime(timezone=True))
+    available_at = Column(DateTime(timezone=True), server_default=func.now())  # Retry backoff
+    last_error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    
+    # Relationships
+    sighting = relationship("Sighting")
+
+class OutboundEmail(Base):
+    __tablename__ = "email_outbox"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    to_emails = Column(Text, nullable=False)  # JSON list of recipients
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    attachments = Column(Text)  # JSON list of [path, filename] pairs
+    status = Column(String, nullable=False, default="pending", index=True)  # pending, sending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now())
+    locked_by = Column(String)
+    lease_expires_at = Column(DateTime(timezone=True))
+    last_error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True))
+
+class CaseAlertState(Base):
+    __tablename__ = "case_alert_states"
+    
+    case_id = Column(Integer, ForeignKey("missing_person_cases.id"), primary_key=True)
+    last_alert_at = Column(DateTime(timezone=True))
+    last_alert_confidence = Column(Float)  # Best confidence already alerted immediately
+    digest_due_at = Column(DateTime(timezone=True), index=True)  # Set while matches are waiting for a digest
+
+class PendingAlert(Base):
+    __tablename__ = "pending_alerts"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    case_id = Column(Integer, ForeignKey("missing_person_cases.id"), index=True, nullable=False)
+    sighting_id = Column(Integer, ForeignKey("sightings.id"))
+    confidence_score = Column(Float, nullable=False)
+    face_path = Column(String)
+    location = Column(String)
+    seen_at = Column(String)  # Sighting time as shown in the alert
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class StatCounter(Base):
+    __tablename__ = "stat_counters"
+    
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
\ No newline at end of file
@@ -0,0 +1,73 @@
+from sqlalchemy import and_, case, delete, exists, inspect, or_, text
+from sqlalchemy.engine import Engine
+from .database import Base
+from . import models
+
+# Columns added to tables that databases created by earlier versions already
+# have; create_all only creates missing tables, so these are added here
+ADDED_COLUMNS = [
+    (models.Sighting, "matched_at"),
+    (models.Sighting, "content_hash"),
+    (models.Sighting, "duplicate_of"),
+    (models.SightingFace, "crop_offset"),
+    (models.SightingFace, "crop_length"),
+    (models.Match, "matched_face_offset"),
+    (models.Match, "matched_face_length"),
+]
+
+def upgrade_schema(engine: Engine):
+    """Create missing tables, add missing columns and create missing indexes"""
+    Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        for model, name in ADDED_COLUMNS:
+            table = model.__table__
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            if name in existing:
+                continue
+
+            column = table.columns[name]
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+            for foreign_key in column.foreign_keys:
+                ddl += f" REFERENCES {foreign_key.column.table.name}({foreign_key.column.name})"
+            connection.execute(text(ddl))
+            print(f"Added column {table.name}.{name}")
+
+    with engine.begin() as connection:
+        indexes = {index["name"] for index in inspect(connection).get_indexes(models.Match.__tablename__)}
+        if "ix_matches_case_id_sighting_id" not in indexes:
+            removed = _remove_duplicate_matches(connection)
+            if removed:
+                print(f"Removed {removed} duplicate matches")
+
+    # Indexes added to existing tables are not created by create_all
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def _remove_duplicate_matches(connection) -> int:
+    """Keep one match per (case, sighting) so the unique index can be created.
+
+    The verified match wins, then the most confident, then the oldest.
+    """
+    matches = models.Match.__table__
+    other = matches.alias("other")
+
+    def rank(table):
+        return case((table.c.verified == True, 1), else_=0)
+
+    better = exists().where(
+        other.c.case_id == matches.c.case_id,
+        other.c.sighting_id == matches.c.sighting_id,
+        or_(
+            rank(other) > rank(matches),
+            and_(rank(other) == rank(matches), other.c.confidence_score > matches.c.confidence_score),
+            and_(
+                rank(other) == rank(matches),
+                other.c.confidence_score == matches.c.confidence_score,
+                other.c.id < matches.c.id
+            )
+        )
+    )
+    return connection.execute(delete(matches).where(better)).rowcount
@@ -63,6 +63,7 @@ class Sighting(BaseModel):
     location_name: Optional[str]
     uploaded_at: datetime
     processed: bool
+    duplicate_of: Optional[int] = None
     
     class Config:
         from_attributes = True
@@ -74,6 +75,8 @@ class Match(BaseModel):
     sighting_id: int
     confidence_score: float
     matched_face_path: Optional[str]
+    matched_face_offset: Optional[int] = None
+    matched_face_length: Optional[int] = None
     verified: bool
     created_at: datetime
     case: MissingPersonCase
@@ -82,6 +85,21 @@ class Match(BaseModel):
     class Config:
         from_attributes = True
 
+class MatchSummary(BaseModel):
+    id: int
+    case_id: int
+    sighting_id: int
+    confidence_score: float
+    verified: bool
+    created_at: datetime
+    case_name: str
+    location_name: Optional[str]
+    latitude: Optional[float]
+    longitude: Optional[float]
+    
+    class Config:
+        from_attributes = True
+
 class MatchUpdate(BaseModel):
     verified: bool
 
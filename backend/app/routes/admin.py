@@ -1,61 +1,82 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func, select
+from typing import List, Optional, Union
+import json
 
-from ..models.database import get_db
+from ..models.database import SessionLocal, get_async_db, get_db
 from ..models.models import User, MissingPersonCase, Sighting, Match, LocationHistory
 from ..models.schemas import (
     MissingPersonCase as MissingPersonCaseSchema,
     Match as MatchSchema,
+    MatchSummary,
     MatchUpdate,
     AdminStats,
     LocationHistory as LocationHistorySchema
 )
 from ..utils.auth import get_admin_user
 from ..utils.email_service import EmailService
+from ..utils.pagination import paginate
+from ..services.case_index import case_index
+from ..services.background_tasks import background_service
+from ..services.alert_coalescer import alert_coalescer
+from ..services.stats import stats_service
+from ..services.enrolment_executor import enrolment_executor
+from ..services.storage import storage
+from ..services.crop_pack import crop_packs
 
 router = APIRouter()
 email_service = EmailService()
 
 @router.get("/stats", response_model=AdminStats)
-async def get_admin_stats(
+def get_admin_stats(
+    refresh: bool = False,
     admin_user: User = Depends(get_admin_user),
     db: Session = Depends(get_db)
 ):
-    total_cases = db.query(MissingPersonCase).count()
-    active_cases = db.query(MissingPersonCase).filter(MissingPersonCase.is_found == False).count()
-    found_cases = db.query(MissingPersonCase).filter(MissingPersonCase.is_found == True).count()
-    total_sightings = db.query(Sighting).count()
-    total_matches = db.query(Match).count()
-    pending_matches = db.query(Match).filter(Match.verified == False).count()
+    # Counters are kept up to date by the write paths, refresh recounts them exactly
+    counters = stats_service.recount(db) if refresh else stats_service.get(db)
     
     return AdminStats(
-        total_cases=total_cases,
-        active_cases=active_cases,
-        found_cases=found_cases,
-        total_sightings=total_sightings,
-        total_matches=total_matches,
-        pending_matches=pending_matches
+        total_cases=counters["total_cases"],
+        active_cases=counters["total_cases"] - counters["found_cases"],
+        found_cases=counters["found_cases"],
+        total_sightings=counters["total_sightings"],
+        total_matches=counters["total_matches"],
+        pending_matches=counters["total_matches"] - counters["verified_matches"]
     )
 
+@router.get("/metrics/enrolment")
+async def get_enrolment_metrics(admin_user: User = Depends(get_admin_user)):
+    # Queue and run times are in seconds, over the most recent enrolments
+    return enrolment_executor.metrics()
+
 @router.get("/cases", response_model=List[MissingPersonCaseSchema])
 async def get_all_cases(
-    skip: int = 0,
-    limit: int = 100,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    is_found: Optional[bool] = None,
     admin_user: User = Depends(get_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    cases = db.query(MissingPersonCase).offset(skip).limit(limit).all()
+    stmt = select(MissingPersonCase)
+    
+    if is_found is not None:
+        stmt = stmt.where(MissingPersonCase.is_found == is_found)
+    
+    cases = await paginate(db, stmt, MissingPersonCase.created_at, MissingPersonCase.id, cursor, limit, response)
     return cases
 
 @router.get("/cases/{case_id}", response_model=MissingPersonCaseSchema)
 async def get_case_details(
     case_id: int,
     admin_user: User = Depends(get_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    case = db.query(MissingPersonCase).filter(MissingPersonCase.id == case_id).first()
+    case = await db.get(MissingPersonCase, case_id)
     if not case:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -64,7 +85,7 @@ async def get_case_details(
     return case
 
 @router.put("/cases/{case_id}/found")
-async def mark_person_found(
+def mark_person_found(
     case_id: int,
     admin_user: User = Depends(get_admin_user),
     db: Session = Depends(get_db)
@@ -84,8 +105,12 @@ async def mark_person_found(
     
     # Mark as found
     case.is_found = True
+    stats_service.increment(db, found_cases=1)
     db.commit()
     
+    # Found persons are no longer matched against sightings
+    case_index.remove(case.id)
+    
     # Send notification emails
     to_emails = []
     if case.email:
@@ -98,24 +123,56 @@ async def mark_person_found(
     
     return {"message": f"{case.name} has been marked as found"}
 
-@router.get("/matches", response_model=List[MatchSchema])
+@router.get("/matches", response_model=Union[List[MatchSchema], List[MatchSummary]])
 async def get_all_matches(
-    skip: int = 0,
-    limit: int = 100,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
     verified: bool = None,
+    fields: Optional[str] = Query(None, pattern="^summary$"),
     admin_user: User = Depends(get_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(Match)
+    if fields == "summary":
+        # Flat rows from one joined query, without the nested case and sighting
+        stmt = select(
+            Match.id,
+            Match.case_id,
+            Match.sighting_id,
+            Match.confidence_score,
+            Match.verified,
+            Match.created_at,
+            MissingPersonCase.name.label("case_name"),
+            Sighting.location_name,
+            Sighting.latitude,
+            Sighting.longitude
+        ).join(MissingPersonCase, Match.case_id == MissingPersonCase.id).join(
+            Sighting, Match.sighting_id == Sighting.id
+        )
+    else:
+        # Load the nested case and sighting with the page instead of one query per match
+        stmt = select(Match).options(joinedload(Match.case), joinedload(Match.sighting))
     
     if verified is not None:
-        query = query.filter(Match.verified == verified)
+        stmt = stmt.where(Match.verified == verified)
     
-    matches = query.offset(skip).limit(limit).all()
+    matches = await paginate(db, stmt, Match.created_at, Match.id, cursor, limit, response)
     return matches
 
+@router.get("/crops")
+def get_face_crop(
+    pack: str,
+    offset: int = Query(..., ge=0),
+    length: int = Query(..., ge=1),
+    admin_user: User = Depends(get_admin_user)
+):
+    # Face crops are addressed by (pack, offset, length) from a sighting face or match
+    data = crop_packs.read_crop(pack, offset, length)
+    # Packs are never rewritten, a crop address always returns the same image
+    return Response(content=data, media_type="image/jpeg", headers={"Cache-Control": "private, max-age=86400"})
+
 @router.put("/matches/{match_id}", response_model=MatchSchema)
-async def update_match(
+def update_match(
     match_id: int,
     match_update: MatchUpdate,
     admin_user: User = Depends(get_admin_user),
@@ -128,6 +185,7 @@ async def update_match(
             detail="Match not found"
         )
     
+    stats_service.increment(db, verified_matches=int(bool(match_update.verified)) - int(bool(match.verified)))
     match.verified = match_update.verified
     match.verified_by = admin_user.id
     db.commit()
@@ -139,10 +197,10 @@ async def update_match(
 async def get_case_location_history(
     case_id: int,
     admin_user: User = Depends(get_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Verify case exists
-    case = db.query(MissingPersonCase).filter(MissingPersonCase.id == case_id).first()
+    case = await db.get(MissingPersonCase, case_id)
     if not case:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -150,14 +208,15 @@ async def get_case_location_history(
         )
     
     # Get location history
-    locations = db.query(LocationHistory).filter(
+    result = await db.execute(select(LocationHistory).where(
         LocationHistory.case_id == case_id
-    ).order_by(LocationHistory.timestamp.desc()).all()
+    ).order_by(LocationHistory.timestamp.desc()))
+    locations = result.scalars().all()
     
     return locations
 
 @router.delete("/cases/{case_id}")
-async def delete_case(
+def delete_case(
     case_id: int,
     admin_user: User = Depends(get_admin_user),
     db: Session = Depends(get_db)
@@ -171,15 +230,46 @@ async def delete_case(
     
     # Delete associated records first
     db.query(LocationHistory).filter(LocationHistory.case_id == case_id).delete()
-    db.query(Match).filter(Match.case_id == case_id).delete()
+    verified_matches = db.query(Match).filter(Match.case_id == case_id, Match.verified == True).count()
+    deleted_matches = db.query(Match).filter(Match.case_id == case_id).delete()
+    stats_service.increment(
+        db,
+        total_cases=-1,
+        found_cases=-1 if case.is_found else 0,
+        total_matches=-deleted_matches,
+        verified_matches=-verified_matches
+    )
+    alert_coalescer.forget_case(db, case_id)
     
-    # Delete photo file
-    import os
-    if os.path.exists(case.photo_path):
-        os.remove(case.photo_path)
+    # Delete photo file, identical photos of other cases share it
+    shared = db.query(MissingPersonCase.id).filter(
+        MissingPersonCase.photo_path == case.photo_path,
+        MissingPersonCase.id != case.id
+    ).first()
+    if not shared:
+        storage.remove(case.photo_path)
     
     # Delete case
     db.delete(case)
     db.commit()
     
-    return {"message": "Case deleted successfully"}
\ No newline at end of file
+    case_index.remove(case_id)
+    
+    return {"message": "Case deleted successfully"}
+
+@router.post("/sightings/reprocess")
+def reprocess_all_sightings(
+    batch_size: int = 200,
+    admin_user: User = Depends(get_admin_user)
+):
+    """Rematch every processed sighting against new cases, streaming progress as JSON lines"""
+    def progress():
+        # The response outlives the request, so the sweep gets its own session
+        db = SessionLocal()
+        try:
+            for update in background_service.sweep_sightings(db, batch_size=max(1, min(batch_size, 1000))):
+                yield json.dumps(update) + "\n"
+        finally:
+            db.close()
+    
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
\ No newline at end of file
@@ -1,16 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
-import os
-import shutil
-from datetime import datetime
 
-from ..models.database import get_db
+from ..models.database import get_async_db, get_db
 from ..models.models import User, MissingPersonCase
 from ..models.schemas import MissingPersonCaseCreate, MissingPersonCase as MissingPersonCaseSchema
 from ..utils.auth import get_current_user
 from ..utils.face_recognition import FaceRecognitionService
 from ..utils.email_service import EmailService
+from ..services.case_index import case_index
+from ..services.background_tasks import background_service
+from ..services.alert_coalescer import alert_coalescer
+from ..services.stats import stats_service
+from ..services.enrolment_executor import enrolment_executor
+from ..services.upload_store import StoredUpload, upload_store
+from ..services.storage import storage
 
 router = APIRouter()
 face_service = FaceRecognitionService()
@@ -34,23 +40,42 @@ async def create_missing_person_case(
             detail="Only image files are allowed"
         )
     
-    # Create case directory
-    case_dir = os.path.join("uploads", "cases")
-    os.makedirs(case_dir, exist_ok=True)
+    # Refuse before storing the photo when the enrolment queue is full
+    enrolment_executor.ensure_capacity()
     
-    # Save uploaded photo
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    photo_filename = f"{timestamp}_{photo.filename}"
-    photo_path = os.path.join(case_dir, photo_filename)
+    # Stream the photo to disk under its content hash
+    stored = await upload_store.save(photo, "cases", "image")
     
-    with open(photo_path, "wb") as buffer:
-        shutil.copyfileobj(photo.file, buffer)
+    # Face encoding and matching block, keep them off the event loop
+    try:
+        return await enrolment_executor.run(
+            _enrol_case, db, stored, current_user.id, name, address, aadhaar_number, email, phone
+        )
+    except HTTPException as e:
+        # The queue filled up while the photo was uploading
+        if e.status_code == status.HTTP_503_SERVICE_UNAVAILABLE and not stored.duplicate:
+            storage.remove(stored.path)
+        raise
+
+def _enrol_case(
+    db: Session,
+    stored: StoredUpload,
+    created_by: int,
+    name: str,
+    address: Optional[str],
+    aadhaar_number: Optional[str],
+    email: Optional[str],
+    phone: Optional[str]
+) -> MissingPersonCase:
+    """Encode the face in the stored photo and create the case (runs on the enrolment pool)"""
+    photo_path = stored.path
     
     # Extract face encoding
     face_encoding = face_service.extract_face_encoding(photo_path)
     if face_encoding is None:
-        # Clean up uploaded file
-        os.remove(photo_path)
+        # Clean up uploaded file, unless the same photo was stored before
+        if not stored.duplicate:
+            storage.remove(photo_path)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No face detected in the uploaded photo. Please upload a clear photo with a visible face."
@@ -64,7 +89,7 @@ async def create_missing_person_case(
         phone=phone,
         photo_path=photo_path,
         face_embedding=face_service.serialize_encoding(face_encoding),
-        created_by=current_user.id
+        created_by=created_by
     )
     
     # Hash Aadhaar if provided
@@ -72,35 +97,52 @@ async def create_missing_person_case(
         db_case.set_aadhaar(aadhaar_number)
     
     db.add(db_case)
+    stats_service.increment(db, total_cases=1)
     db.commit()
     db.refresh(db_case)
     
+    # Make the new case matchable immediately
+    case_index.upsert(db_case.id, face_encoding)
+    
+    # Check the new case against every face already seen in earlier sightings
+    try:
+        matched = background_service.match_case_against_sightings(db, db_case, face_encoding)
+        if matched:
+            print(f"Case {db_case.id} matched {matched} earlier sightings")
+    except Exception as e:
+        print(f"Error matching case {db_case.id} against earlier sightings: {e}")
+        db.rollback()
+    
     # Send confirmation email
     if email:
         email_service.send_case_created_notification(email, name, db_case.id)
     
+    # Load the committed row here rather than on the event loop while serializing
+    db.refresh(db_case)
     return db_case
 
 @router.get("/", response_model=List[MissingPersonCaseSchema])
 async def get_user_cases(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    cases = db.query(MissingPersonCase).filter(
+    result = await db.execute(select(MissingPersonCase).where(
         MissingPersonCase.created_by == current_user.id
-    ).all()
+    ))
+    cases = result.scalars().all()
     return cases
 
 @router.get("/{case_id}", response_model=MissingPersonCaseSchema)
 async def get_case(
     case_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    case = db.query(MissingPersonCase).filter(
+    result = await db.execute(select(MissingPersonCase).where(
         MissingPersonCase.id == case_id,
         MissingPersonCase.created_by == current_user.id
-    ).first()
+    ))
+    case = result.scalars().first()
     
     if not case:
         raise HTTPException(
@@ -111,7 +153,7 @@ async def get_case(
     return case
 
 @router.put("/{case_id}", response_model=MissingPersonCaseSchema)
-async def update_case(
+def update_case(
     case_id: int,
     case_update: MissingPersonCaseCreate,
     current_user: User = Depends(get_current_user),
@@ -140,10 +182,12 @@ async def update_case(
     db.commit()
     db.refresh(case)
     
+    case_index.sync_case(case)
+    
     return case
 
 @router.delete("/{case_id}")
-async def delete_case(
+def delete_case(
     case_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -159,11 +203,19 @@ async def delete_case(
             detail="Case not found"
         )
     
-    # Delete photo file
-    if os.path.exists(case.photo_path):
-        os.remove(case.photo_path)
+    # Delete photo file, identical photos of other cases share it
+    shared = db.query(MissingPersonCase.id).filter(
+        MissingPersonCase.photo_path == case.photo_path,
+        MissingPersonCase.id != case.id
+    ).first()
+    if not shared:
+        storage.remove(case.photo_path)
     
+    alert_coalescer.forget_case(db, case_id)
+    stats_service.increment(db, total_cases=-1, found_cases=-1 if case.is_found else 0)
     db.delete(case)
     db.commit()
     
+    case_index.remove(case_id)
+    
     return {"message": "Case deleted successfully"}
\ No newline at end of file
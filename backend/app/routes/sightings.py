@@ -1,20 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
-import os
-import shutil
-from datetime import datetime
 
-from ..models.database import get_db
+from ..models.database import get_async_db, get_db
 from ..models.models import Sighting
 from ..models.schemas import SightingCreate, Sighting as SightingSchema
+from ..utils.pagination import paginate
+from ..services.job_queue import job_queue
 from ..services.background_tasks import background_service
+from ..services.stats import stats_service
+from ..services.upload_store import StoredUpload, upload_store
+from ..services.sighting_dedup import sighting_dedup
 
 router = APIRouter()
 
 @router.post("/", response_model=SightingSchema)
 async def upload_sighting(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     latitude: Optional[float] = Form(None),
     longitude: Optional[float] = Form(None),
@@ -29,55 +33,76 @@ async def upload_sighting(
             detail="Only image (JPEG, PNG) and video (MP4, AVI, MOV) files are allowed"
         )
     
+    # Refuse early rather than storing a file nobody will process soon
+    await run_in_threadpool(job_queue.ensure_capacity, db)
+    
     # Determine file type
     file_type = "image" if file.content_type.startswith('image/') else "video"
     
-    # Create sighting directory
-    sighting_dir = os.path.join("uploads", "sightings")
-    os.makedirs(sighting_dir, exist_ok=True)
-    
-    # Save uploaded file
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'jpg'
-    filename = f"sighting_{timestamp}.{file_extension}"
-    file_path = os.path.join(sighting_dir, filename)
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Stream the file to disk under its content hash
+    stored = await upload_store.save(file, "sightings", file_type)
     
+    return await run_in_threadpool(
+        _create_sighting, db, stored, file_type, latitude, longitude, location_name
+    )
+
+def _create_sighting(
+    db: Session,
+    stored: StoredUpload,
+    file_type: str,
+    latitude: Optional[float],
+    longitude: Optional[float],
+    location_name: Optional[str]
+) -> Sighting:
     # Create sighting record
     db_sighting = Sighting(
-        file_path=file_path,
+        file_path=stored.path,
         file_type=file_type,
         latitude=latitude,
         longitude=longitude,
-        location_name=location_name
+        location_name=location_name,
+        content_hash=stored.sha256
     )
     
+    # An identical file that was already processed needs no processing of its own
+    original_id = sighting_dedup.find_exact(db, stored.sha256) if stored.duplicate else None
+    if original_id is not None:
+        db_sighting.duplicate_of = original_id
+        db_sighting.processed = True
+        db_sighting.matched_at = func.now()
+    
     db.add(db_sighting)
+    db.flush()
+    
+    # The job is stored with the sighting, so it survives an API restart
+    if original_id is None:
+        job_queue.enqueue(db, db_sighting.id)
+    stats_service.increment(db, total_sightings=1)
     db.commit()
     db.refresh(db_sighting)
     
-    # Add background task to process the sighting
-    background_tasks.add_task(background_service.process_sighting, db_sighting.id)
+    # Hand the sighting over to the processing workers
+    if original_id is None:
+        job_queue.dispatch(db_sighting.id)
     
     return db_sighting
 
 @router.get("/", response_model=List[SightingSchema])
 async def get_sightings(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    sightings = db.query(Sighting).offset(skip).limit(limit).all()
+    sightings = await paginate(db, select(Sighting), Sighting.uploaded_at, Sighting.id, cursor, limit, response)
     return sightings
 
 @router.get("/{sighting_id}", response_model=SightingSchema)
 async def get_sighting(
     sighting_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    sighting = db.query(Sighting).filter(Sighting.id == sighting_id).first()
+    sighting = await db.get(Sighting, sighting_id)
     if not sighting:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -86,9 +111,9 @@ async def get_sighting(
     return sighting
 
 @router.post("/{sighting_id}/reprocess")
-async def reprocess_sighting(
+def reprocess_sighting(
     sighting_id: int,
-    background_tasks: BackgroundTasks,
+    full: bool = False,
     db: Session = Depends(get_db)
 ):
     sighting = db.query(Sighting).filter(Sighting.id == sighting_id).first()
@@ -98,11 +123,19 @@ async def reprocess_sighting(
             detail="Sighting not found"
         )
     
+    # Reuse the stored faces and only compare cases added or changed since the last pass
+    if not full and sighting.processed and sighting.matched_at is not None:
+        new_matches = background_service.rematch_sightings(db, [sighting])
+        return {"message": "Sighting rematched against new cases", "new_matches": new_matches}
+    
+    job_queue.ensure_capacity(db)
+    
     # Reset processed status
     sighting.processed = False
+    job_queue.enqueue(db, sighting_id)
     db.commit()
     
-    # Add background task to reprocess
-    background_tasks.add_task(background_service.process_sighting, sighting_id)
+    # Queue for reprocessing by the processing workers
+    job_queue.dispatch(sighting_id)
     
     return {"message": "Sighting queued for reprocessing"}
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""Measure API latency under concurrent load.
+
+Fires requests at a running API from `--concurrency` parallel clients,
+cycling through the given paths, and prints p50/p95/p99 latency per path.
+Run it before and after a change to compare how the API behaves when slow
+and fast requests share the event loop.
+
+With `--enrol photo.jpg` a burst of case registrations with that photo runs
+alongside (`--enrol-concurrency` parallel clients) for as long as the GET
+requests take, to check that enrolment does not stall other endpoints.
+
+Usage (from the backend directory, needs httpx):
+    python -m app.scripts.bench_concurrency --token <admin_token> \\
+        --path "/admin/matches?limit=500" --path /health [--concurrency 50] [--requests 2000] \\
+        [--enrol photo.jpg --enrol-concurrency 10]
+"""
+import argparse
+import asyncio
+import time
+from collections import defaultdict
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+ENROL_PATH = "POST /cases/"
+
+async def run(
+    url: str,
+    paths: list,
+    concurrency: int,
+    total: int,
+    token: str = None,
+    enrol_photo: str = None,
+    enrol_concurrency: int = 0
+) -> dict:
+    """Send `total` requests, returns latencies in seconds and error counts per path"""
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    counter = iter(range(total))
+    done = asyncio.Event()
+
+    async def client(http):
+        for i in counter:
+            path = paths[i % len(paths)]
+            start = time.perf_counter()
+            try:
+                response = await http.get(path)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies[path].append(time.perf_counter() - start)
+            else:
+                errors[path] += 1
+
+    async def enroller(http, photo: bytes):
+        # A "no face detected" rejection still did the full enrolment work
+        while not done.is_set():
+            start = time.perf_counter()
+            try:
+                response = await http.post(
+                    "/cases/",
+                    data={"name": "Benchmark"},
+                    files={"photo": ("photo.jpg", photo, "image/jpeg")}
+                )
+                ok = response.status_code < 500
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies[ENROL_PATH].append(time.perf_counter() - start)
+            else:
+                errors[ENROL_PATH] += 1
+
+    async def clients(http):
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+        done.set()
+
+    limits = httpx.Limits(max_connections=concurrency + enrol_concurrency)
+    async with httpx.AsyncClient(base_url=url, headers=headers, limits=limits, timeout=60) as http:
+        tasks = [clients(http)]
+        if enrol_photo and enrol_concurrency > 0:
+            with open(enrol_photo, "rb") as f:
+                photo = f.read()
+            tasks += [enroller(http, photo) for _ in range(enrol_concurrency)]
+        await asyncio.gather(*tasks)
+    return {"latencies": latencies, "errors": errors}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API latency under concurrent load")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--path", action="append", help="Path to request, repeat to mix endpoints")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--token", help="Bearer token for authenticated endpoints")
+    parser.add_argument("--enrol", help="Photo to register cases with while the GET requests run")
+    parser.add_argument("--enrol-concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    if not HTTPX_AVAILABLE:
+        print("httpx is required for the benchmark: pip install httpx")
+        return
+
+    paths = args.path or ["/health"]
+    start = time.perf_counter()
+    results = asyncio.run(run(
+        args.url, paths, args.concurrency, args.requests, args.token,
+        args.enrol, args.enrol_concurrency if args.enrol else 0
+    ))
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {args.requests / elapsed:.1f} req/s")
+    for path in paths + ([ENROL_PATH] if args.enrol else []):
+        values = results["latencies"][path]
+        if not values:
+            print(f"{path}: no successful requests, {results['errors'][path]} errors")
+            continue
+        print(
+            f"{path}: p50 {percentile(values, 0.50) * 1000:.1f} ms, "
+            f"p95 {percentile(values, 0.95) * 1000:.1f} ms, "
+            f"p99 {percentile(values, 0.99) * 1000:.1f} ms, "
+            f"{results['errors'][path]} errors"
+        )
+
+if __name__ == "__main__":
+    main()
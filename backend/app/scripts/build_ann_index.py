@@ -0,0 +1,24 @@
+"""Train the IVF case index offline and persist it for the API and workers.
+
+Usage (from the backend directory):
+    CASE_INDEX_MODE=ivf python -m app.scripts.build_ann_index
+"""
+from ..models.database import SessionLocal
+from ..services.case_index import case_index
+from ..services.ann_index import IVFCaseIndex
+
+def main():
+    if not isinstance(case_index, IVFCaseIndex):
+        print("CASE_INDEX_MODE is not 'ivf', nothing to build")
+        return
+
+    db = SessionLocal()
+    try:
+        case_index.rebuild(db)
+        case_index.save()
+        print(f"ANN index saved to {case_index.index_path} with {len(case_index)} cases")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
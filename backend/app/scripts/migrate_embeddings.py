@@ -0,0 +1,68 @@
+"""Rewrite legacy pickled case embeddings in the versioned binary format.
+
+Usage (from the backend directory):
+    python -m app.scripts.migrate_embeddings [--batch-size 500] [--dtype float32] [--dry-run]
+"""
+import argparse
+from ..models.database import SessionLocal
+from ..models.models import MissingPersonCase
+from ..utils.embedding_format import pack_embedding, is_packed_embedding, load_legacy_embedding
+
+# dlib encodings are always 128-d, anything else came from the OpenCV fallback
+DLIB_DIMENSION = 128
+
+def migrate_embeddings(batch_size: int = 500, dtype: str = "float32", dry_run: bool = False) -> dict:
+    """Convert every pickled face_embedding row, committing one batch at a time"""
+    stats = {"scanned": 0, "converted": 0, "skipped": 0, "failed": 0}
+    last_id = 0
+
+    db = SessionLocal()
+    try:
+        while True:
+            rows = db.query(MissingPersonCase.id, MissingPersonCase.face_embedding).filter(
+                MissingPersonCase.id > last_id,
+                MissingPersonCase.face_embedding.isnot(None)
+            ).order_by(MissingPersonCase.id).limit(batch_size).all()
+
+            if not rows:
+                break
+
+            updates = []
+            for case_id, face_embedding in rows:
+                stats["scanned"] += 1
+                if is_packed_embedding(face_embedding):
+                    stats["skipped"] += 1
+                    continue
+
+                try:
+                    encoding = load_legacy_embedding(face_embedding)
+                    backend = "dlib" if encoding.size == DLIB_DIMENSION else "opencv"
+                    updates.append({"id": case_id, "face_embedding": pack_embedding(encoding, backend, dtype)})
+                except Exception as e:
+                    print(f"Error converting embedding of case {case_id}: {e}")
+                    stats["failed"] += 1
+
+            if updates and not dry_run:
+                db.bulk_update_mappings(MissingPersonCase, updates)
+                db.commit()
+            stats["converted"] += len(updates)
+
+            last_id = rows[-1][0]
+            print(f"Processed cases up to id {last_id}: {stats}")
+    finally:
+        db.close()
+
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate pickled face embeddings to the binary format")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows converted per transaction")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32", help="Stored value type")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+
+    stats = migrate_embeddings(args.batch_size, args.dtype, args.dry_run)
+    print(f"Embedding migration finished: {stats}")
+
+if __name__ == "__main__":
+    main()
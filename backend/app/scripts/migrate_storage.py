@@ -0,0 +1,203 @@
+"""Move uploaded photos, sighting media and face crops into the sharded layout.
+
+Run it with the API and workers stopped. Every batch of rows is committed
+after its files are in place and the old files are only removed after the
+commit, so an interrupted run can simply be started again.
+
+Usage (from the backend directory):
+    python -m app.scripts.migrate_storage [--batch-size 500] [--dry-run]
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+from typing import Optional
+from ..models.database import SessionLocal
+from ..models.models import MissingPersonCase, Sighting, SightingFace, Match, PendingAlert, OutboundEmail
+from ..services.storage import storage
+
+# Uploads stored by content are already named after their SHA-256
+CONTENT_NAME = re.compile(r"^[0-9a-f]{64}$")
+
+def migrate_storage(batch_size: int = 500, dry_run: bool = False) -> dict:
+    """Migrate every stored file path, committing one batch of rows at a time"""
+    stats = {"scanned": 0, "moved": 0, "rewritten": 0, "missing": 0, "failed": 0}
+
+    db = SessionLocal()
+    try:
+        _migrate_uploads(db, MissingPersonCase, MissingPersonCase.photo_path, "cases", batch_size, dry_run, stats)
+        _migrate_uploads(db, Sighting, Sighting.file_path, "sightings", batch_size, dry_run, stats)
+        for column in (SightingFace.crop_path, Match.matched_face_path, PendingAlert.face_path):
+            _migrate_crops(db, column, batch_size, dry_run, stats)
+        _migrate_attachments(db, batch_size, dry_run, stats)
+    finally:
+        db.close()
+
+    return stats
+
+def _migrate_uploads(db, model, column, category: str, batch_size: int, dry_run: bool, stats: dict):
+    """Content-address uploads under uploads/<category>/<shard>/"""
+    last_id = 0
+    while True:
+        rows = db.query(model.id, column).filter(model.id > last_id).order_by(model.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        updates = []
+        sources = set()
+        for row_id, path in rows:
+            stats["scanned"] += 1
+            if not path or storage.is_sharded(path):
+                continue
+
+            try:
+                target, sha256 = _upload_target(path, category)
+                if target is None:
+                    print(f"Missing {category} file {path} (row {row_id})")
+                    stats["missing"] += 1
+                    continue
+                if not dry_run and os.path.exists(path) and not os.path.exists(target):
+                    storage.ensure_parent(target)
+                    _link(path, target)
+                    stats["moved"] += 1
+                sources.add(path)
+                update = {"id": row_id, column.key: target}
+                if model is Sighting:
+                    update["content_hash"] = sha256
+                updates.append(update)
+            except Exception as e:
+                print(f"Error migrating {category} file {path} (row {row_id}): {e}")
+                stats["failed"] += 1
+
+        if updates and not dry_run:
+            db.bulk_update_mappings(model, updates)
+            db.commit()
+            # Old names are only dropped once the rows point at the new ones
+            for path in sources:
+                if os.path.exists(path):
+                    os.remove(path)
+        stats["rewritten"] += len(updates)
+
+        last_id = rows[-1][0]
+        print(f"Processed {category} up to id {last_id}: {stats}")
+
+def _upload_target(path: str, category: str):
+    """(new path, sha256) of a legacy upload, (None, None) when the file is gone"""
+    stem, extension = os.path.splitext(os.path.basename(path))
+    if CONTENT_NAME.match(stem):
+        # Identical uploads share one file, later rows still find it under the new name
+        return storage.content_path(category, stem, extension.lower()), stem
+    if not os.path.exists(path):
+        return None, None
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    sha256 = digest.hexdigest()
+    return storage.content_path(category, sha256, extension.lower()), sha256
+
+def _migrate_crops(db, column, batch_size: int, dry_run: bool, stats: dict):
+    """Move crops out of uploads/sightings/sighting_<id>/ and rewrite `column`"""
+    model = column.class_
+    last_id = 0
+    while True:
+        rows = db.query(model.id, column).filter(
+            model.id > last_id,
+            column.isnot(None)
+        ).order_by(model.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        updates = []
+        for row_id, path in rows:
+            stats["scanned"] += 1
+            try:
+                target = _move_crop(path, dry_run, stats)
+                if target is not None:
+                    updates.append({"id": row_id, column.key: target})
+            except Exception as e:
+                print(f"Error migrating face crop {path} (row {row_id}): {e}")
+                stats["failed"] += 1
+
+        if updates and not dry_run:
+            db.bulk_update_mappings(model, updates)
+            db.commit()
+        stats["rewritten"] += len(updates)
+
+        last_id = rows[-1][0]
+        print(f"Processed {model.__tablename__} up to id {last_id}: {stats}")
+
+def _migrate_attachments(db, batch_size: int, dry_run: bool, stats: dict):
+    """Point unsent emails at the moved crops"""
+    last_id = 0
+    while True:
+        rows = db.query(OutboundEmail.id, OutboundEmail.attachments).filter(
+            OutboundEmail.id > last_id,
+            OutboundEmail.attachments.isnot(None),
+            OutboundEmail.status != "sent"
+        ).order_by(OutboundEmail.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        updates = []
+        for email_id, attachments in rows:
+            stats["scanned"] += 1
+            changed = False
+            pairs = json.loads(attachments)
+            for pair in pairs:
+                target = _move_crop(pair[0], dry_run, stats)
+                if target is not None:
+                    pair[0] = target
+                    changed = True
+            if changed:
+                updates.append({"id": email_id, "attachments": json.dumps(pairs)})
+
+        if updates and not dry_run:
+            db.bulk_update_mappings(OutboundEmail, updates)
+            db.commit()
+        stats["rewritten"] += len(updates)
+
+        last_id = rows[-1][0]
+        print(f"Processed email_outbox up to id {last_id}: {stats}")
+
+def _move_crop(path: Optional[str], dry_run: bool, stats: dict) -> Optional[str]:
+    """New path of a legacy crop, moving the file if it is still in the old place"""
+    target = storage.legacy_crop_target(path)
+    if target is None:
+        return None
+    if os.path.exists(path):
+        if not dry_run:
+            storage.ensure_parent(target)
+            os.replace(path, target)
+            _remove_empty_dir(os.path.dirname(path))
+        stats["moved"] += 1
+    elif not os.path.exists(target):
+        stats["missing"] += 1
+    return target
+
+def _link(source: str, target: str):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+def _remove_empty_dir(directory: str):
+    try:
+        os.rmdir(directory)
+    except OSError:
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Move stored files into the sharded upload layout")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows rewritten per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without moving or writing")
+    args = parser.parse_args()
+
+    stats = migrate_storage(args.batch_size, args.dry_run)
+    print(f"Storage migration finished: {stats}")
+
+if __name__ == "__main__":
+    main()
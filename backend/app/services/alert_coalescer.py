@@ -0,0 +1,209 @@
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from ..models.database import SessionLocal
+from ..models.models import MissingPersonCase, Sighting, CaseAlertState, PendingAlert
+from ..utils.email_service import EmailService
+
+class AlertCoalescer:
+    """Coalesce match alerts per case into digest emails.
+
+    The first match of a case, and any match whose confidence beats the best
+    one already alerted by at least `confidence_jump`, is alerted at once.
+    Other matches are stored as pending alerts and the case gets a digest
+    due `window` seconds later. When it is due, one email goes out with the
+    `top_n` best face crops and a summary of where the person was seen.
+    A window of 0 turns coalescing off and alerts every match.
+    """
+
+    def __init__(
+        self,
+        email_service: Optional[EmailService] = None,
+        window: Optional[float] = None,
+        top_n: Optional[int] = None,
+        confidence_jump: Optional[float] = None,
+        flush_interval: Optional[float] = None
+    ):
+        self.email_service = email_service or EmailService()
+        self.window = window if window is not None else float(os.getenv("ALERT_DIGEST_WINDOW", "900"))
+        self.top_n = top_n if top_n is not None else int(os.getenv("ALERT_DIGEST_TOP_N", "3"))
+        self.confidence_jump = confidence_jump if confidence_jump is not None else float(os.getenv("ALERT_CONFIDENCE_JUMP", "0.1"))
+        self.flush_interval = flush_interval if flush_interval is not None else float(os.getenv("ALERT_FLUSH_INTERVAL", "30"))
+        self._stop = threading.Event()
+        self._thread = None
+
+    def match_alert(self, case: MissingPersonCase, sighting: Sighting, confidence_score: float, face_path: str):
+        """Alert a match now or hold it for the case's next digest"""
+        to_emails = self._recipients(case)
+        if not to_emails:
+            return
+
+        location = self._location(sighting)
+        seen_at = sighting.uploaded_at.strftime("%Y-%m-%d %H:%M:%S")
+
+        if self.window <= 0:
+            self.email_service.send_match_alert(to_emails, case.name, confidence_score, location, seen_at, face_path)
+            return
+
+        db = SessionLocal()
+        try:
+            for _ in range(2):
+                try:
+                    immediate = self._record(db, case.id, sighting.id, confidence_score, face_path, location, seen_at)
+                    break
+                except IntegrityError:
+                    # Another process created the case's alert state first
+                    db.rollback()
+            else:
+                immediate = True
+        finally:
+            db.close()
+
+        if immediate:
+            self.email_service.send_match_alert(to_emails, case.name, confidence_score, location, seen_at, face_path)
+
+    def flush_due(self, db: Session) -> int:
+        """Send the digests that are due, returns how many were sent"""
+        now = datetime.now(timezone.utc)
+        due = db.query(CaseAlertState.case_id, CaseAlertState.digest_due_at).filter(
+            CaseAlertState.digest_due_at <= now
+        ).all()
+
+        sent = 0
+        for case_id, due_at in due:
+            # Claim the digest so only one process sends it
+            claimed = db.query(CaseAlertState).filter(
+                CaseAlertState.case_id == case_id,
+                CaseAlertState.digest_due_at == due_at
+            ).update({CaseAlertState.digest_due_at: None}, synchronize_session=False)
+            db.commit()
+            if not claimed:
+                continue
+
+            pending = db.query(PendingAlert).filter(PendingAlert.case_id == case_id).all()
+            case = db.query(MissingPersonCase).filter(MissingPersonCase.id == case_id).first()
+            to_emails = self._recipients(case) if case is not None and not case.is_found else []
+            if pending and to_emails:
+                self._send_digest(case, to_emails, pending)
+                sent += 1
+
+            db.query(PendingAlert).filter(
+                PendingAlert.id.in_([alert.id for alert in pending])
+            ).delete(synchronize_session=False)
+            db.commit()
+        return sent
+
+    def forget_case(self, db: Session, case_id: int):
+        """Drop a deleted case's alert state and undelivered alerts (caller commits)"""
+        db.query(PendingAlert).filter(PendingAlert.case_id == case_id).delete(synchronize_session=False)
+        db.query(CaseAlertState).filter(CaseAlertState.case_id == case_id).delete(synchronize_session=False)
+
+    def start(self):
+        """Start the background digest thread"""
+        if self._thread is not None or self.window <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="alert-digest")
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _record(
+        self,
+        db: Session,
+        case_id: int,
+        sighting_id: int,
+        confidence_score: float,
+        face_path: str,
+        location: str,
+        seen_at: str
+    ) -> bool:
+        """Update the case's alert state, returns True if the match should be alerted now"""
+        now = datetime.now(timezone.utc)
+        state = db.query(CaseAlertState).filter(CaseAlertState.case_id == case_id).first()
+
+        if state is None:
+            db.add(CaseAlertState(case_id=case_id, last_alert_at=now, last_alert_confidence=confidence_score))
+            db.commit()
+            return True
+
+        best = state.last_alert_confidence
+        if best is None or confidence_score >= best + self.confidence_jump:
+            state.last_alert_at = now
+            state.last_alert_confidence = confidence_score if best is None else max(best, confidence_score)
+            db.commit()
+            return True
+
+        db.add(PendingAlert(
+            case_id=case_id,
+            sighting_id=sighting_id,
+            confidence_score=confidence_score,
+            face_path=face_path,
+            location=location,
+            seen_at=seen_at
+        ))
+        if state.digest_due_at is None:
+            state.digest_due_at = now + timedelta(seconds=self.window)
+        db.commit()
+        return False
+
+    def _send_digest(self, case: MissingPersonCase, to_emails: List[str], pending: List[PendingAlert]):
+        ranked = sorted(pending, key=lambda alert: alert.confidence_score, reverse=True)
+        top_matches = [
+            {
+                "confidence_score": alert.confidence_score,
+                "location": alert.location,
+                "seen_at": alert.seen_at,
+                "face_path": alert.face_path
+            }
+            for alert in ranked[:self.top_n]
+        ]
+
+        counts = Counter(alert.location for alert in pending)
+        location_summary = [
+            f"{location}: {count} sighting{'s' if count > 1 else ''}"
+            for location, count in counts.most_common()
+        ]
+        times = sorted(alert.seen_at for alert in pending)
+        period = times[0] if times[0] == times[-1] else f"{times[0]} to {times[-1]}"
+
+        self.email_service.send_match_digest(to_emails, case.name, len(pending), top_matches, location_summary, period)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            db = SessionLocal()
+            try:
+                self.flush_due(db)
+            except Exception as e:
+                print(f"Error sending alert digests: {e}")
+                db.rollback()
+            finally:
+                db.close()
+
+    @staticmethod
+    def _recipients(case: MissingPersonCase) -> List[str]:
+        to_emails = []
+        if case.email:
+            to_emails.append(case.email)
+        if case.created_by_user and case.created_by_user.email:
+            to_emails.append(case.created_by_user.email)
+        return to_emails
+
+    @staticmethod
+    def _location(sighting: Sighting) -> str:
+        if sighting.location_name:
+            return sighting.location_name
+        if sighting.latitude and sighting.longitude:
+            return f"Lat: {sighting.latitude}, Lng: {sighting.longitude}"
+        return "Unknown location"
+
+# Global instance
+alert_coalescer = AlertCoalescer()
@@ -0,0 +1,276 @@
+import os
+from typing import List, Optional, Tuple
+from sqlalchemy.orm import Session
+from ..utils.face_recognition import FaceRecognitionService
+from .case_index import CaseEmbeddingIndex
+import numpy as np
+
+class IVFCaseIndex(CaseEmbeddingIndex):
+    """Approximate case index using an inverted file over k-means centroids.
+
+    Case embeddings are clustered into `nlist` coarse cells. A search only
+    scores the cases in the `nprobe` cells closest to each face, so raising
+    `nprobe` trades latency for recall. Shortlisted candidates are re-ranked
+    with the exact face metric, so every reported score is the same as
+    `compare_faces` would give. Below `min_train_size` cases the index falls
+    back to the exact brute-force scan of `CaseEmbeddingIndex`.
+
+    The trained index is persisted to `index_path` and reconciled against the
+    database on load, so cases opened or closed while the process was down
+    are picked up without retraining.
+    """
+
+    KMEANS_ITERATIONS = 10
+    TRAIN_SAMPLE_PER_LIST = 256
+    RETRAIN_GROWTH_FACTOR = 4
+
+    def __init__(
+        self,
+        index_path: str,
+        nlist: int = 0,
+        nprobe: int = 8,
+        min_train_size: int = 10000,
+        face_service: Optional[FaceRecognitionService] = None
+    ):
+        self.index_path = index_path
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self._centroids: Optional[np.ndarray] = None
+        self._trained_size = 0
+        self._lists: List[List[int]] = []
+        self._row_lists: List[int] = []
+        super().__init__(face_service)
+
+    def _load(self, db: Session):
+        """Start from the persisted index if there is one, else build from the database"""
+        if self.load():
+            self._reconcile(db)
+            self._loaded = True
+        else:
+            self.rebuild(db)
+
+    def rebuild(self, db: Session):
+        """Reload all active case embeddings and retrain if there are enough of them"""
+        with self._lock:
+            self._centroids = None
+            super().rebuild(db)
+            self._maybe_train()
+
+    def search(self, db: Session, face_encoding: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Score a face against the shortlisted cases, returns (case_ids, similarity_scores)"""
+        self.ensure_loaded(db)
+        with self._lock:
+            self._maybe_train()
+            rows = self._candidate_rows(np.atleast_2d(np.asarray(face_encoding, dtype=np.float32)))
+            if rows is None:
+                return super().search(db, face_encoding)
+
+            scores = self.face_service.compare_faces_many(self._embeddings[rows], face_encoding)
+            return self._case_ids[rows], scores
+
+    def search_batch(
+        self,
+        db: Session,
+        face_encodings: np.ndarray,
+        top_k: int = 5
+    ) -> Tuple[List[List[Tuple[int, float]]], List[Tuple[int, int, float]]]:
+        """Score all faces of a sighting against the union of their shortlisted cases"""
+        self.ensure_loaded(db)
+        face_encodings = np.atleast_2d(np.asarray(face_encodings, dtype=np.float32))
+        with self._lock:
+            self._maybe_train()
+            rows = self._candidate_rows(face_encodings)
+            if rows is None:
+                return super().search_batch(db, face_encodings, top_k=top_k)
+
+            return self.face_service.match_faces_batch(
+                face_encodings,
+                self._embeddings[rows],
+                self._case_ids[rows],
+                top_k=top_k
+            )
+
+    def save(self):
+        """Persist the index atomically to `index_path`"""
+        with self._lock:
+            directory = os.path.dirname(self.index_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    centroids=self._centroids if self._centroids is not None else np.empty((0, 0), dtype=np.float32),
+                    embeddings=self._embeddings[:self._size],
+                    case_ids=self._case_ids[:self._size],
+                    row_lists=np.asarray(self._row_lists, dtype=np.int32),
+                    trained_size=np.asarray(self._trained_size)
+                )
+            os.replace(tmp_path, self.index_path)
+
+    def load(self) -> bool:
+        """Load a persisted index, returns False if there is none or it is unreadable"""
+        if not os.path.exists(self.index_path):
+            return False
+
+        try:
+            with np.load(self.index_path) as data:
+                centroids = data["centroids"]
+                embeddings = data["embeddings"].astype(np.float32)
+                case_ids = data["case_ids"].astype(np.int64)
+                row_lists = data["row_lists"].tolist()
+                trained_size = int(data["trained_size"])
+        except Exception as e:
+            print(f"Error loading ANN index from {self.index_path}: {e}")
+            return False
+
+        with self._lock:
+            self._reset()
+            self._embeddings = embeddings
+            self._case_ids = case_ids
+            self._size = case_ids.shape[0]
+            self._rows = {int(case_id): row for row, case_id in enumerate(case_ids)}
+            self._centroids = centroids if centroids.size else None
+            self._trained_size = trained_size
+            self._row_lists = row_lists
+            self._lists = [[] for _ in range(0 if self._centroids is None else self._centroids.shape[0])]
+            for row, list_id in enumerate(row_lists):
+                if list_id >= 0:
+                    self._lists[list_id].append(row)
+        return True
+
+    def _reset(self):
+        super()._reset()
+        self._row_lists = []
+        self._lists = [[] for _ in range(0 if self._centroids is None else self._centroids.shape[0])]
+
+    def _upsert(self, case_id: int, encoding: np.ndarray):
+        row = self._rows.get(case_id)
+        super()._upsert(case_id, encoding)
+
+        if row is None:
+            row = self._rows[case_id]
+            self._row_lists.append(-1)
+        else:
+            self._unassign(row)
+        self._assign(row)
+
+    def _remove(self, case_id: int):
+        row = self._rows.get(case_id)
+        if row is None:
+            return
+
+        # Mirror the base class swap-with-last in the inverted lists
+        last = self._size - 1
+        self._unassign(row)
+        if row != last:
+            list_id = self._row_lists[last]
+            if list_id >= 0:
+                cell = self._lists[list_id]
+                cell[cell.index(last)] = row
+            self._row_lists[row] = list_id
+        self._row_lists.pop()
+
+        super()._remove(case_id)
+
+    def _assign(self, row: int):
+        if self._centroids is not None and self._centroids.shape[1] != self._embeddings.shape[1]:
+            self._centroids = None
+
+        if self._centroids is None:
+            self._row_lists[row] = -1
+            return
+
+        list_id = int(self._nearest_centroids(self._prepare(self._embeddings[row:row + 1]), 1)[0, 0])
+        self._lists[list_id].append(row)
+        self._row_lists[row] = list_id
+
+    def _unassign(self, row: int):
+        list_id = self._row_lists[row]
+        if list_id >= 0:
+            self._lists[list_id].remove(row)
+            self._row_lists[row] = -1
+
+    def _candidate_rows(self, face_encodings: np.ndarray) -> Optional[np.ndarray]:
+        """Rows in the cells probed by any of the faces, or None to scan exactly"""
+        if self._centroids is None or face_encodings.shape[1] != self._centroids.shape[1]:
+            return None
+
+        nprobe = min(self.nprobe, self._centroids.shape[0])
+        probed = np.unique(self._nearest_centroids(self._prepare(face_encodings), nprobe))
+        cells = [np.asarray(self._lists[list_id], dtype=np.int64) for list_id in probed]
+        return np.concatenate(cells) if cells else np.empty(0, dtype=np.int64)
+
+    def _maybe_train(self):
+        if self._size < self.min_train_size:
+            return
+        if self._centroids is None or self._size > self._trained_size * self.RETRAIN_GROWTH_FACTOR:
+            self._train()
+
+    def _train(self):
+        """Cluster the current embeddings and rebuild the inverted lists"""
+        size = self._size
+        nlist = self.nlist or max(1, int(4 * np.sqrt(size)))
+        nlist = min(nlist, size)
+
+        data = self._prepare(self._embeddings[:size])
+        rng = np.random.default_rng(0)
+        sample_size = min(size, nlist * self.TRAIN_SAMPLE_PER_LIST)
+        sample = data[rng.choice(size, sample_size, replace=False)]
+        self._centroids = self._kmeans(sample, nlist, rng)
+
+        assignments = np.concatenate([
+            self._nearest_centroids(data[start:start + 65536], 1)[:, 0]
+            for start in range(0, size, 65536)
+        ])
+        self._row_lists = assignments.tolist()
+        self._lists = [[] for _ in range(nlist)]
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(nlist + 1))
+        for list_id in range(nlist):
+            self._lists[list_id] = order[bounds[list_id]:bounds[list_id + 1]].tolist()
+
+        self._trained_size = size
+        print(f"Trained ANN case index: {size} cases in {nlist} lists")
+
+        try:
+            self.save()
+        except OSError as e:
+            print(f"Error saving ANN index to {self.index_path}: {e}")
+
+    def _kmeans(self, data: np.ndarray, nlist: int, rng: np.random.Generator) -> np.ndarray:
+        centroids = data[rng.choice(data.shape[0], nlist, replace=False)].copy()
+
+        for _ in range(self.KMEANS_ITERATIONS):
+            assignments = self._nearest_centroids(data, 1, centroids)[:, 0]
+            order = np.argsort(assignments, kind="stable")
+            counts = np.bincount(assignments, minlength=nlist)
+            nonempty = counts > 0
+
+            sums = np.add.reduceat(data[order], np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty], axis=0)
+            centroids[nonempty] = sums / counts[nonempty, None]
+
+            # Re-seed empty cells from random points so every list stays usable
+            empty = np.flatnonzero(~nonempty)
+            if empty.size:
+                centroids[empty] = data[rng.choice(data.shape[0], empty.size, replace=False)]
+
+        return centroids
+
+    def _nearest_centroids(self, data: np.ndarray, n: int, centroids: Optional[np.ndarray] = None) -> np.ndarray:
+        centroids = self._centroids if centroids is None else centroids
+        # ||x||^2 is constant per row, so it does not change the ranking
+        distances = np.einsum("ij,ij->i", centroids, centroids)[None, :] - 2 * (data @ centroids.T)
+        if n >= centroids.shape[0]:
+            return np.argsort(distances, axis=1)
+        return np.argpartition(distances, n - 1, axis=1)[:, :n]
+
+    def _prepare(self, data: np.ndarray) -> np.ndarray:
+        """Map embeddings into the space the backend's metric is euclidean in"""
+        data = np.asarray(data, dtype=np.float32)
+        if self.face_service.backend == "dlib":
+            return data
+        norms = np.linalg.norm(data, axis=1, keepdims=True)
+        return np.divide(data, norms, out=np.zeros_like(data), where=norms > 0)
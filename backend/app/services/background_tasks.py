@@ -1,17 +1,22 @@
-import os
-from typing import List
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import func, insert, or_
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 from ..models.database import SessionLocal
-from ..models.models import Sighting, MissingPersonCase, Match, LocationHistory
-from ..utils.face_recognition import FaceRecognitionService
-from ..utils.email_service import EmailService
+from ..models.models import Sighting, SightingFace, SightingFingerprint, MissingPersonCase, Match, LocationHistory
+from ..utils.face_recognition import FaceRecognitionService, DetectedFace
+from .case_index import case_index
+from .sighting_face_index import sighting_face_index
+from .alert_coalescer import alert_coalescer
+from .stats import stats_service
+from .sighting_dedup import sighting_dedup
+from .crop_pack import crop_packs
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
 
 class BackgroundTaskService:
     def __init__(self):
         self.face_service = FaceRecognitionService()
-        self.email_service = EmailService()
     
     def process_sighting(self, sighting_id: int):
         """Process a sighting and check for matches"""
@@ -22,90 +27,359 @@ class BackgroundTaskService:
             if not sighting:
                 return
             
-            # Create output directory for extracted faces
-            sighting_dir = os.path.join("uploads", "sightings", f"sighting_{sighting_id}")
-            os.makedirs(sighting_dir, exist_ok=True)
+            # Cases created while this runs are compared by the next incremental pass
+            watermark = self._watermark(db)
             
-            extracted_faces = []
+            # The same media was processed before, its faces and matches already cover this one
+            original_id, hashes = sighting_dedup.find_original(db, sighting)
+            if original_id is not None:
+                db.query(SightingFace).filter(SightingFace.sighting_id == sighting.id).delete(synchronize_session=False)
+                db.query(SightingFingerprint).filter(SightingFingerprint.sighting_id == sighting.id).delete(synchronize_session=False)
+                sighting.duplicate_of = original_id
+                sighting.processed = True
+                sighting.matched_at = watermark
+                db.commit()
+                self._prune_packs(db, sighting.id, None)
+                print(f"Sighting {sighting_id} duplicates sighting {original_id}, skipped detection")
+                return
+            
+            # Decode, detect and encode the sighting in a single pass
+            detected_faces = [
+                face for face in self.face_service.detect_and_encode(sighting.file_path, sighting.file_type)
+                if face.encoding is not None
+            ]
             
-            # Process based on file type
-            if sighting.file_type == "image":
-                extracted_faces = self.face_service.process_sighting_image(
-                    sighting.file_path, sighting_dir
-                )
-            elif sighting.file_type == "video":
-                extracted_faces = self.face_service.extract_faces_from_video(
-                    sighting.file_path, sighting_dir
-                )
+            # Keep every face so later cases can be matched without re-reading the media
+            stored_faces = self._store_faces(db, detected_faces, sighting)
             
-            # Check each extracted face against all active cases
-            for face_path in extracted_faces:
-                face_encoding = self.face_service.extract_face_encoding(face_path)
-                if face_encoding is not None:
-                    self._check_face_against_cases(db, face_encoding, sighting, face_path)
+            # Match every face against all active cases in one batch
+            new_matches = []
+            if detected_faces:
+                new_matches = self._check_faces_against_cases(db, detected_faces, stored_faces, sighting)
             
-            # Mark sighting as processed
+            # Faces, matches, locations and the processed flag go out in one transaction
+            sighting_dedup.remember(db, sighting, hashes)
+            sighting.duplicate_of = None
             sighting.processed = True
+            sighting.matched_at = watermark
             db.commit()
+            self._prune_packs(db, sighting.id, stored_faces[0].crop_path if stored_faces else None)
+            
+            # Only alert about matches that were actually stored
+            for case, similarity_score, face_path in new_matches:
+                self._send_match_alert(case, sighting, similarity_score, face_path)
             
         except Exception as e:
             print(f"Error processing sighting {sighting_id}: {e}")
             db.rollback()
+            # Let the job queue record the failure and retry
+            raise
         finally:
             db.close()
     
-    def _check_face_against_cases(
+    def _check_faces_against_cases(
         self, 
         db: Session, 
-        face_encoding: np.ndarray, 
-        sighting: Sighting, 
-        face_path: str
-    ):
-        """Check a face encoding against all active missing person cases"""
-        # Get all active cases (not found)
-        active_cases = db.query(MissingPersonCase).filter(
+        detected_faces: List[DetectedFace], 
+        stored_faces: List[SightingFace], 
+        sighting: Sighting
+    ) -> List[Tuple[MissingPersonCase, float, str]]:
+        """Check all faces of a sighting against all active missing person cases,
+        returns the new (case, score, face_path) matches added to the session"""
+        # Score every face against every active case with one matrix multiply
+        face_encodings = np.stack([face.encoding for face in detected_faces])
+        _, matched_pairs = case_index.search_batch(db, face_encodings)
+        if not matched_pairs:
+            return []
+        
+        # Load only the matched cases, re-checking they are still active
+        matched_cases = db.query(MissingPersonCase).filter(
+            MissingPersonCase.id.in_(list({case_id for _, case_id, _ in matched_pairs})),
+            MissingPersonCase.is_found == False
+        ).all()
+        cases_by_id = {case.id: case for case in matched_cases}
+        
+        candidates = [
+            (cases_by_id[case_id], sighting, similarity_score, stored_faces[face_index])
+            for face_index, case_id, similarity_score in matched_pairs
+            if case_id in cases_by_id
+        ]
+        return [
+            (case, similarity_score, face_path)
+            for case, _, similarity_score, face_path in self._write_matches(db, candidates)
+        ]
+    
+    def rematch_sightings(self, db: Session, sightings: List[Sighting]) -> int:
+        """Compare stored faces of processed sightings with the cases changed since
+        each sighting's watermark, returns the number of new matches"""
+        sightings = [sighting for sighting in sightings if sighting.matched_at is not None]
+        if not sightings:
+            return 0
+        
+        watermark = self._watermark(db)
+        
+        # One query and one decode for all cases any of these sightings has not seen
+        oldest = min(sighting.matched_at for sighting in sightings)
+        changed_cases = db.query(MissingPersonCase).filter(
             MissingPersonCase.is_found == False,
-            MissingPersonCase.face_embedding.isnot(None)
+            MissingPersonCase.face_embedding.isnot(None),
+            or_(MissingPersonCase.created_at >= oldest, MissingPersonCase.updated_at >= oldest)
         ).all()
         
-        for case in active_cases:
+        cases = []
+        case_encodings = []
+        for case in changed_cases:
             try:
-                # Deserialize stored face encoding
-                stored_encoding = self.face_service.deserialize_encoding(case.face_embedding)
-                
-                # Compare faces
-                similarity_score = self.face_service.compare_faces(stored_encoding, face_encoding)
-                
-                # Check if it's a match
-                if self.face_service.is_match(similarity_score):
-                    # Create match record
-                    match = Match(
-                        case_id=case.id,
-                        sighting_id=sighting.id,
-                        confidence_score=similarity_score,
-                        matched_face_path=face_path
-                    )
-                    db.add(match)
-                    
-                    # Add location to history if available
-                    if sighting.latitude and sighting.longitude:
-                        location_history = LocationHistory(
-                            case_id=case.id,
-                            latitude=sighting.latitude,
-                            longitude=sighting.longitude,
-                            location_name=sighting.location_name,
-                            confidence_score=similarity_score
-                        )
-                        db.add(location_history)
-                    
-                    db.commit()
-                    
-                    # Send email alert
-                    self._send_match_alert(case, sighting, similarity_score, face_path)
-                    
+                case_encodings.append(np.asarray(self.face_service.deserialize_encoding(case.face_embedding), dtype=np.float32).ravel())
+                cases.append(case)
             except Exception as e:
-                print(f"Error checking case {case.id}: {e}")
-                continue
+                print(f"Error loading embedding of case {case.id}: {e}")
+        
+        faces_by_sighting: Dict[int, List[SightingFace]] = {}
+        if cases:
+            faces = db.query(SightingFace).filter(
+                SightingFace.sighting_id.in_([sighting.id for sighting in sightings]),
+                SightingFace.embedding.isnot(None)
+            ).all()
+            for face in faces:
+                faces_by_sighting.setdefault(face.sighting_id, []).append(face)
+        
+        candidates = []
+        for sighting in sightings:
+            faces = faces_by_sighting.get(sighting.id)
+            columns = [
+                column for column, case in enumerate(cases)
+                if max(case.created_at, case.updated_at or case.created_at) >= sighting.matched_at
+            ]
+            if faces and columns:
+                face_encodings = np.stack([self.face_service.deserialize_encoding(face.embedding) for face in faces])
+                known_encodings = np.stack([case_encodings[column] for column in columns])
+                if face_encodings.shape[1] == known_encodings.shape[1]:
+                    _, matched_pairs = self.face_service.match_faces_batch(
+                        face_encodings, known_encodings, np.asarray(columns, dtype=np.int64)
+                    )
+                    candidates.extend(
+                        (cases[column], sighting, similarity_score, faces[face_index])
+                        for face_index, column, similarity_score in matched_pairs
+                    )
+            
+            sighting.matched_at = watermark
+        
+        alerts = self._write_matches(db, candidates)
+        db.commit()
+        
+        for case, sighting, similarity_score, face_path in alerts:
+            self._send_match_alert(case, sighting, similarity_score, face_path)
+        return len(alerts)
+    
+    def sweep_sightings(self, db: Session, batch_size: int = 200) -> Iterator[dict]:
+        """Incrementally rematch every processed sighting, yielding progress after each batch.
+        
+        Sightings processed before faces were stored have nothing to reuse and
+        are queued for full processing instead.
+        """
+        from .job_queue import job_queue
+        
+        total = db.query(func.count(Sighting.id)).filter(Sighting.processed == True).scalar()
+        progress = {"total": total, "done": 0, "new_matches": 0, "queued": 0}
+        last_id = 0
+        while True:
+            batch = db.query(Sighting).filter(
+                Sighting.processed == True,
+                Sighting.id > last_id
+            ).order_by(Sighting.id).limit(batch_size).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+            
+            for sighting in batch:
+                if sighting.matched_at is None:
+                    job_queue.enqueue(db, sighting.id)
+                    progress["queued"] += 1
+            db.commit()
+            
+            progress["new_matches"] += self.rematch_sightings(db, batch)
+            progress["done"] += len(batch)
+            yield dict(progress)
+    
+    def _write_matches(
+        self, 
+        db: Session, 
+        candidates: List[Tuple[MissingPersonCase, Sighting, float, SightingFace]]
+    ) -> List[Tuple[MissingPersonCase, Sighting, float, str]]:
+        """Store one match per (case, sighting) with bulk upserts, without committing.
+        
+        Rows are written with INSERT ... ON CONFLICT on the unique (case_id,
+        sighting_id) index, so enrolment and sighting workers matching the same
+        pair at once cannot create duplicates. Existing matches are only
+        updated when a better face turns up. Returns the newly matched (case,
+        sighting, score, face_path) tuples for alerting, face_path is None
+        when the crop was not materialized as a file.
+        """
+        best = {}
+        for candidate in candidates:
+            case, sighting, similarity_score, _ = candidate
+            key = (case.id, sighting.id)
+            if key not in best or similarity_score > best[key][2]:
+                best[key] = candidate
+        if not best:
+            return []
+        
+        # Skip pairs already matched with a face at least as good, so no crop is materialized for them
+        existing_scores = db.query(Match.case_id, Match.sighting_id, Match.confidence_score).filter(
+            Match.case_id.in_({case_id for case_id, _ in best}),
+            Match.sighting_id.in_({sighting_id for _, sighting_id in best})
+        ).all()
+        for case_id, sighting_id, confidence_score in existing_scores:
+            candidate = best.get((case_id, sighting_id))
+            if candidate is not None and candidate[2] <= confidence_score:
+                del best[(case_id, sighting_id)]
+        if not best:
+            return []
+        
+        rows = {
+            key: {
+                "case_id": case.id,
+                "sighting_id": sighting.id,
+                "confidence_score": similarity_score,
+                **self._match_face(face)
+            }
+            for key, (case, sighting, similarity_score, face) in best.items()
+        }
+        dialect_insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+        
+        # Rows that did not conflict are the new matches
+        stmt = dialect_insert(Match).on_conflict_do_nothing(index_elements=["case_id", "sighting_id"])
+        inserted = set(db.execute(stmt.returning(Match.case_id, Match.sighting_id), list(rows.values())).all())
+        
+        existing_rows = [row for key, row in rows.items() if key not in inserted]
+        if existing_rows:
+            # Keep the best face seen for this case
+            stmt = dialect_insert(Match)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["case_id", "sighting_id"],
+                set_={
+                    column: stmt.excluded[column]
+                    for column in ("confidence_score", "matched_face_path", "matched_face_offset", "matched_face_length")
+                },
+                where=Match.confidence_score < stmt.excluded.confidence_score
+            )
+            db.execute(stmt, existing_rows)
+        
+        new_matches = [candidate for key, candidate in best.items() if key in inserted]
+        if not new_matches:
+            return []
+        
+        # Add locations to history if available
+        locations = [
+            {
+                "case_id": case.id,
+                "latitude": sighting.latitude,
+                "longitude": sighting.longitude,
+                "location_name": sighting.location_name,
+                "timestamp": sighting.uploaded_at,
+                "confidence_score": similarity_score
+            }
+            for case, sighting, similarity_score, _ in new_matches
+            if sighting.latitude and sighting.longitude
+        ]
+        if locations:
+            db.execute(insert(LocationHistory), locations)
+        
+        stats_service.increment(db, total_matches=len(new_matches))
+        
+        alerts = []
+        for case, sighting, similarity_score, _ in new_matches:
+            row = rows[(case.id, sighting.id)]
+            alerts.append((case, sighting, similarity_score, row["matched_face_path"] if row["matched_face_offset"] is None else None))
+        return alerts
+    
+    def _match_face(self, face: SightingFace) -> dict:
+        """Match columns locating the face crop, a standalone file when MATCH_CROP_FILES is on"""
+        if crop_packs.match_files:
+            try:
+                path = crop_packs.materialize(face)
+                if path:
+                    return {"matched_face_path": path, "matched_face_offset": None, "matched_face_length": None}
+            except OSError as e:
+                print(f"Error materializing face crop of sighting {face.sighting_id}: {e}")
+        return {"matched_face_path": face.crop_path, "matched_face_offset": face.crop_offset, "matched_face_length": face.crop_length}
+    
+    def _prune_packs(self, db: Session, sighting_id: int, keep: Optional[str]):
+        try:
+            crop_packs.prune(db, sighting_id, keep)
+        except Exception as e:
+            print(f"Error removing old crop packs of sighting {sighting_id}: {e}")
+    
+    def _watermark(self, db: Session) -> datetime:
+        # Database clock, like created_at/updated_at, less a margin for second-resolution clocks
+        return db.query(func.now()).scalar() - timedelta(seconds=1)
+    
+    def _store_faces(self, db: Session, detected_faces: List[DetectedFace], sighting: Sighting) -> List[SightingFace]:
+        """Save the crop and embedding of every detected face, replacing earlier results.
+        
+        The crops of this run go to a new pack file, packs of earlier runs are
+        pruned once the new faces are committed.
+        """
+        db.query(SightingFace).filter(SightingFace.sighting_id == sighting.id).delete(synchronize_session=False)
+        if not detected_faces:
+            return []
+        
+        pack = crop_packs.open_pack(sighting.id)
+        stored_faces = []
+        try:
+            for face in detected_faces:
+                offset, length = pack.append(face.frame_index, face.face_index, self.face_service.encode_crop_jpeg(face))
+                
+                top, right, bottom, left = face.box
+                stored_faces.append(SightingFace(
+                    sighting_id=sighting.id,
+                    frame_index=face.frame_index,
+                    face_index=face.face_index,
+                    box_top=top,
+                    box_right=right,
+                    box_bottom=bottom,
+                    box_left=left,
+                    crop_path=pack.pack_path,
+                    crop_offset=offset,
+                    crop_length=length,
+                    embedding=self.face_service.serialize_encoding(face.encoding),
+                    quality=face.quality
+                ))
+            pack.close()
+        except BaseException:
+            pack.abort()
+            raise
+        
+        db.add_all(stored_faces)
+        return stored_faces
+    
+    def match_case_against_sightings(self, db: Session, case: MissingPersonCase, face_encoding: np.ndarray) -> int:
+        """Match a new case against every stored sighting face, returns the number of matches"""
+        face_ids, sighting_ids, scores = sighting_face_index.search(db, face_encoding)
+        if face_ids.size == 0:
+            return 0
+        
+        faces = {
+            face.id: face for face in db.query(SightingFace).filter(SightingFace.id.in_(face_ids.tolist()))
+        }
+        sightings = {
+            sighting.id: sighting for sighting in db.query(Sighting).filter(Sighting.id.in_(sighting_ids.tolist()))
+        }
+        
+        candidates = []
+        for face_id, sighting_id, similarity_score in zip(face_ids.tolist(), sighting_ids.tolist(), scores.tolist()):
+            face = faces.get(face_id)
+            sighting = sightings.get(sighting_id)
+            if face is not None and sighting is not None:
+                candidates.append((case, sighting, similarity_score, face))
+        
+        new_matches = self._write_matches(db, candidates)
+        db.commit()
+        
+        for _, sighting, similarity_score, face_path in new_matches:
+            self._send_match_alert(case, sighting, similarity_score, face_path)
+        return len(new_matches)
     
     def _send_match_alert(
         self, 
@@ -114,33 +388,9 @@ class BackgroundTaskService:
         confidence_score: float, 
         face_path: str
     ):
-        """Send email alert for a match"""
+        """Send email alert for a match, coalesced per case"""
         try:
-            # Prepare email recipients
-            to_emails = []
-            if case.email:
-                to_emails.append(case.email)
-            if case.created_by_user and case.created_by_user.email:
-                to_emails.append(case.created_by_user.email)
-            
-            # Prepare location info
-            location = "Unknown location"
-            if sighting.location_name:
-                location = sighting.location_name
-            elif sighting.latitude and sighting.longitude:
-                location = f"Lat: {sighting.latitude}, Lng: {sighting.longitude}"
-            
-            # Send alert
-            if to_emails:
-                self.email_service.send_match_alert(
-                    to_emails=to_emails,
-                    missing_person_name=case.name,
-                    confidence_score=confidence_score,
-                    location=location,
-                    timestamp=sighting.uploaded_at.strftime("%Y-%m-%d %H:%M:%S"),
-                    matched_image_path=face_path
-                )
-                
+            alert_coalescer.match_alert(case, sighting, confidence_score, face_path)
         except Exception as e:
             print(f"Error sending match alert: {e}")
 
@@ -0,0 +1,217 @@
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from ..models.models import MissingPersonCase
+from ..utils.face_recognition import FaceRecognitionService
+from .embedding_store import SharedEmbeddingStore
+import numpy as np
+
+class CaseEmbeddingIndex:
+    """Process-wide index of active case embeddings for vectorized matching.
+
+    Embeddings are kept in one contiguous float32 matrix with a parallel array
+    of case ids, so a face is scored against every active case in a single
+    call. The index is loaded lazily from the database on first search and is
+    then kept in sync by the routes that change the set of active cases.
+    """
+
+    def __init__(self, face_service: Optional[FaceRecognitionService] = None):
+        self.face_service = face_service or FaceRecognitionService()
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._signature_seen = None
+        self._embeddings = np.empty((0, 0), dtype=np.float32)
+        self._case_ids = np.empty(0, dtype=np.int64)
+        self._rows: Dict[int, int] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def ensure_loaded(self, db: Session):
+        """Load the index on first use and pick up case changes made by other processes"""
+        signature = self._signature(db)
+        with self._lock:
+            if not self._loaded:
+                self._load(db)
+            elif signature != self._signature_seen:
+                self._reconcile(db)
+            self._signature_seen = signature
+
+    def _load(self, db: Session):
+        self.rebuild(db)
+
+    def _signature(self, db: Session) -> tuple:
+        """Cheap fingerprint of the active case set (count, newest id, latest update)"""
+        return tuple(db.query(
+            func.count(MissingPersonCase.id),
+            func.max(MissingPersonCase.id),
+            func.max(MissingPersonCase.updated_at)
+        ).filter(
+            MissingPersonCase.is_found == False,
+            MissingPersonCase.face_embedding.isnot(None)
+        ).one())
+
+    def _reconcile(self, db: Session):
+        """Apply case changes the index has not seen, without reloading everything"""
+        active_ids = {
+            case_id for (case_id,) in db.query(MissingPersonCase.id).filter(
+                MissingPersonCase.is_found == False,
+                MissingPersonCase.face_embedding.isnot(None)
+            )
+        }
+
+        for case_id in set(self._rows) - active_ids:
+            self._remove(case_id)
+
+        missing_ids = sorted(active_ids - set(self._rows))
+        for start in range(0, len(missing_ids), 500):
+            rows = db.query(MissingPersonCase.id, MissingPersonCase.face_embedding).filter(
+                MissingPersonCase.id.in_(missing_ids[start:start + 500])
+            ).all()
+            for case_id, face_embedding in rows:
+                try:
+                    self._upsert(case_id, self.face_service.deserialize_encoding(face_embedding))
+                except Exception as e:
+                    print(f"Error indexing case {case_id}: {e}")
+
+    def rebuild(self, db: Session):
+        """Reload all active case embeddings from the database"""
+        rows = db.query(MissingPersonCase.id, MissingPersonCase.face_embedding).filter(
+            MissingPersonCase.is_found == False,
+            MissingPersonCase.face_embedding.isnot(None)
+        ).all()
+
+        with self._lock:
+            self._reset()
+            for case_id, face_embedding in rows:
+                try:
+                    encoding = self.face_service.deserialize_encoding(face_embedding)
+                    self._upsert(case_id, encoding)
+                except Exception as e:
+                    print(f"Error indexing case {case_id}: {e}")
+            self._loaded = True
+
+    def upsert(self, case_id: int, encoding: np.ndarray):
+        """Add or replace the embedding of an active case"""
+        with self._lock:
+            if self._loaded:
+                self._upsert(case_id, encoding)
+
+    def remove(self, case_id: int):
+        """Drop a case from the index (found or deleted)"""
+        with self._lock:
+            if self._loaded:
+                self._remove(case_id)
+
+    def sync_case(self, case: MissingPersonCase):
+        """Bring the index in line with the current state of a case row"""
+        if case.is_found or case.face_embedding is None:
+            self.remove(case.id)
+        else:
+            self.upsert(case.id, self.face_service.deserialize_encoding(case.face_embedding))
+
+    def search(self, db: Session, face_encoding: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Score a face against all active cases, returns (case_ids, similarity_scores)"""
+        self.ensure_loaded(db)
+        with self._lock:
+            if self._size == 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            if np.asarray(face_encoding).shape[-1] != self._embeddings.shape[1]:
+                print("Face encoding dimension does not match the case index")
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+            scores = self.face_service.compare_faces_many(self._embeddings[:self._size], face_encoding)
+            return self._case_ids[:self._size].copy(), scores
+
+    def search_batch(
+        self,
+        db: Session,
+        face_encodings: np.ndarray,
+        top_k: int = 5
+    ) -> Tuple[List[List[Tuple[int, float]]], List[Tuple[int, int, float]]]:
+        """Score all faces of a sighting against all active cases with one matrix multiply"""
+        self.ensure_loaded(db)
+        face_encodings = np.atleast_2d(np.asarray(face_encodings, dtype=np.float32))
+        with self._lock:
+            if self._size == 0 or face_encodings.shape[1] != self._embeddings.shape[1]:
+                if self._size > 0:
+                    print("Face encoding dimension does not match the case index")
+                return [[] for _ in range(face_encodings.shape[0])], []
+
+            return self.face_service.match_faces_batch(
+                face_encodings,
+                self._embeddings[:self._size],
+                self._case_ids[:self._size],
+                top_k=top_k
+            )
+
+    def _reset(self):
+        self._embeddings = np.empty((0, 0), dtype=np.float32)
+        self._case_ids = np.empty(0, dtype=np.int64)
+        self._rows = {}
+        self._size = 0
+
+    def _upsert(self, case_id: int, encoding: np.ndarray):
+        encoding = np.asarray(encoding, dtype=np.float32).ravel()
+
+        if self._size == 0 and self._embeddings.shape[1] != encoding.shape[0]:
+            self._embeddings = np.empty((0, encoding.shape[0]), dtype=np.float32)
+        elif encoding.shape[0] != self._embeddings.shape[1]:
+            raise ValueError(
+                f"Embedding dimension {encoding.shape[0]} does not match index dimension {self._embeddings.shape[1]}"
+            )
+
+        row = self._rows.get(case_id)
+        if row is None:
+            # Grow capacity geometrically so appends stay amortised O(1)
+            if self._size == self._embeddings.shape[0]:
+                capacity = max(16, self._embeddings.shape[0] * 2)
+                embeddings = np.empty((capacity, encoding.shape[0]), dtype=np.float32)
+                embeddings[:self._size] = self._embeddings[:self._size]
+                case_ids = np.empty(capacity, dtype=np.int64)
+                case_ids[:self._size] = self._case_ids[:self._size]
+                self._embeddings, self._case_ids = embeddings, case_ids
+
+            row = self._size
+            self._size += 1
+            self._rows[case_id] = row
+            self._case_ids[row] = case_id
+
+        self._embeddings[row] = encoding
+
+    def _remove(self, case_id: int):
+        row = self._rows.pop(case_id, None)
+        if row is None:
+            return
+
+        # Move the last row into the freed slot to keep the matrix contiguous
+        last = self._size - 1
+        if row != last:
+            moved_id = int(self._case_ids[last])
+            self._embeddings[row] = self._embeddings[last]
+            self._case_ids[row] = moved_id
+            self._rows[moved_id] = row
+        self._size -= 1
+
+def create_case_index():
+    """Build the case index selected by CASE_INDEX_MODE (memory, mmap or ivf)"""
+    mode = os.getenv("CASE_INDEX_MODE", "memory")
+    if mode == "mmap":
+        return SharedEmbeddingStore(os.getenv("EMBEDDING_STORE_DIR", "embedding_store"))
+    if mode == "ivf":
+        from .ann_index import IVFCaseIndex
+        return IVFCaseIndex(
+            index_path=os.getenv("ANN_INDEX_PATH", os.path.join("embedding_store", "ivf_index.npz")),
+            nlist=int(os.getenv("ANN_NLIST", "0")),
+            nprobe=int(os.getenv("ANN_NPROBE", "8")),
+            min_train_size=int(os.getenv("ANN_MIN_TRAIN_SIZE", "10000"))
+        )
+    if mode != "memory":
+        print(f"Unknown CASE_INDEX_MODE '{mode}', using in-memory case index")
+    return CaseEmbeddingIndex()
+
+# Global instance
+case_index = create_case_index()
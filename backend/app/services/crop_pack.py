@@ -0,0 +1,129 @@
+import glob
+import os
+import uuid
+from typing import Optional, Tuple
+import numpy as np
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+from ..models.models import Match, SightingFace
+from .storage import StorageLayout, storage as default_storage
+
+# One index row per crop: frame_index, face_index, offset, length
+INDEX_DTYPE = np.dtype("<i8")
+INDEX_COLUMNS = 4
+
+class CropPackWriter:
+    """Appends the face crops of one processing run to a single pack file"""
+
+    def __init__(self, pack_path: str):
+        self.pack_path = pack_path
+        self._file = open(pack_path, "wb")
+        self._entries = []
+        self._offset = 0
+
+    def append(self, frame_index: int, face_index: int, data: bytes) -> Tuple[int, int]:
+        """Write an encoded crop, returns its (offset, length) in the pack"""
+        offset = self._offset
+        self._file.write(data)
+        self._offset += len(data)
+        self._entries.append((frame_index, face_index, offset, len(data)))
+        return offset, len(data)
+
+    def close(self):
+        self._file.close()
+        index = np.asarray(self._entries, dtype=INDEX_DTYPE).reshape(-1, INDEX_COLUMNS)
+        index_path = index_path_for(self.pack_path)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            index.tofile(f)
+        os.replace(tmp_path, index_path)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.pack_path):
+            os.remove(self.pack_path)
+
+class CropPackStore:
+    """Face crops of a sighting stored in one append-only pack file.
+
+    Each processing run writes its JPEG crops back to back into
+    crops-<token>.pack in the sighting's directory, next to crops-<token>.idx
+    listing (frame, face, offset, length) for every crop. A crop is addressed
+    by (pack, offset, length), kept in SightingFace.crop_path, crop_offset and
+    crop_length, so a video with thousands of faces costs two files instead
+    of thousands.
+
+    Crops that become a Match are copied to a standalone JPEG when
+    MATCH_CROP_FILES is on (the default), for email attachments; otherwise
+    the match keeps the pack address and has no attachment.
+    """
+
+    def __init__(self, layout: Optional[StorageLayout] = None, match_files: Optional[bool] = None):
+        self.layout = layout or default_storage
+        self.match_files = match_files if match_files is not None else os.getenv("MATCH_CROP_FILES", "true").lower() == "true"
+
+    def open_pack(self, sighting_id: int) -> CropPackWriter:
+        """Start a new pack for a processing run of the sighting"""
+        directory = self.layout.sighting_dir(sighting_id)
+        os.makedirs(directory, exist_ok=True)
+        return CropPackWriter(os.path.join(directory, f"crops-{uuid.uuid4().hex[:12]}.pack"))
+
+    def read(self, pack_path: str, offset: int, length: int) -> bytes:
+        with open(pack_path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def read_crop(self, pack_path: str, offset: int, length: int) -> bytes:
+        """Bytes of one crop, refusing anything that is not a crop listed in a pack index"""
+        real_path = os.path.realpath(pack_path)
+        faces_root = os.path.realpath(os.path.join(self.layout.root, "faces"))
+        if not real_path.endswith(".pack") or os.path.commonpath([real_path, faces_root]) != faces_root:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Not a crop pack")
+
+        index_path = index_path_for(real_path)
+        if not os.path.exists(index_path):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Crop pack not found")
+        index = np.fromfile(index_path, dtype=INDEX_DTYPE).reshape(-1, INDEX_COLUMNS)
+        if not np.any((index[:, 2] == offset) & (index[:, 3] == length)):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Crop not found")
+        return self.read(real_path, offset, length)
+
+    def materialize(self, face: SightingFace) -> Optional[str]:
+        """Standalone image file of a face crop, written once per crop"""
+        if face.crop_offset is None:
+            # Crops stored before pack files are already standalone
+            return face.crop_path
+        if not face.crop_path:
+            return None
+
+        stem, _ = os.path.splitext(face.crop_path)
+        path = f"{stem}-{face.crop_offset}.jpg"
+        if not os.path.exists(path):
+            data = self.read(face.crop_path, face.crop_offset, face.crop_length)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return path
+
+    def prune(self, db: Session, sighting_id: int, keep: Optional[str] = None):
+        """Remove packs of earlier runs of a sighting that no face or match refers to"""
+        directory = self.layout.sighting_dir(sighting_id)
+        packs = set(glob.glob(os.path.join(directory, "crops-*.pack"))) - {keep}
+        if not packs:
+            return
+        in_use = {
+            path for (path,) in db.query(Match.matched_face_path).filter(Match.matched_face_path.in_(packs))
+        } | {
+            path for (path,) in db.query(SightingFace.crop_path).filter(SightingFace.crop_path.in_(packs)).distinct()
+        }
+        for pack_path in packs - in_use:
+            for path in (pack_path, index_path_for(pack_path)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+def index_path_for(pack_path: str) -> str:
+    return os.path.splitext(pack_path)[0] + ".idx"
+
+# Global instance
+crop_packs = CropPackStore()
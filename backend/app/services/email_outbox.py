@@ -0,0 +1,268 @@
+import json
+import os
+import queue
+import smtplib
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from ..models.database import SessionLocal
+from ..models.models import OutboundEmail
+from ..utils.email_service import EmailService
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+class SMTPConnectionPool:
+    """Pool of authenticated SMTP connections kept open between batches.
+
+    Connections idle for longer than `max_idle` seconds are checked with NOOP
+    before reuse, and a connection that fails while sending is dropped
+    instead of being returned to the pool.
+    """
+
+    def __init__(self, email_service: EmailService, size: int = 2, max_idle: float = 60):
+        self.email_service = email_service
+        self.size = size
+        self.max_idle = max_idle
+        self._idle = queue.LifoQueue()
+
+    @contextmanager
+    def connection(self):
+        server = self._acquire()
+        try:
+            yield server
+        except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError):
+            self._discard(server)
+            raise
+        else:
+            self._release(server)
+
+    def close_all(self):
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(server, quit=True)
+
+    def _acquire(self) -> smtplib.SMTP:
+        while True:
+            try:
+                server, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self.email_service.connect()
+
+            if time.monotonic() - last_used < self.max_idle:
+                return server
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._discard(server)
+
+    def _release(self, server: smtplib.SMTP):
+        if self._idle.qsize() >= self.size:
+            self._discard(server, quit=True)
+        else:
+            self._idle.put((server, time.monotonic()))
+
+    @staticmethod
+    def _discard(server: smtplib.SMTP, quit: bool = False):
+        try:
+            if quit:
+                server.quit()
+            else:
+                server.close()
+        except (smtplib.SMTPException, OSError):
+            pass
+
+class EmailOutbox:
+    """Persistent outbox of notification emails with a background sender.
+
+    `enqueue` only writes a row to `email_outbox`. The sender thread claims
+    due rows in batches (leased like processing jobs, so several API and
+    worker processes can run senders side by side), delivers each batch
+    over `EMAIL_SENDERS` pooled SMTP connections and retries failures with
+    exponential backoff until `EMAIL_MAX_ATTEMPTS` is reached.
+    """
+
+    def __init__(
+        self,
+        email_service: Optional[EmailService] = None,
+        batch_size: Optional[int] = None,
+        senders: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        retry_backoff: Optional[float] = None,
+        poll_interval: Optional[float] = None,
+        lease_seconds: Optional[int] = None
+    ):
+        self.email_service = email_service or EmailService()
+        self.batch_size = batch_size if batch_size is not None else int(os.getenv("EMAIL_BATCH_SIZE", "20"))
+        self.senders = senders if senders is not None else int(os.getenv("EMAIL_SENDERS", "2"))
+        self.max_attempts = max_attempts if max_attempts is not None else int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+        self.retry_backoff = retry_backoff if retry_backoff is not None else float(os.getenv("EMAIL_RETRY_BACKOFF", "60"))
+        self.poll_interval = poll_interval if poll_interval is not None else float(os.getenv("EMAIL_POLL_INTERVAL", "5"))
+        self.lease_seconds = lease_seconds if lease_seconds is not None else int(os.getenv("EMAIL_LEASE_SECONDS", "300"))
+        self.pool = SMTPConnectionPool(self.email_service, size=self.senders)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enqueue(
+        self,
+        to_emails: List[str],
+        subject: str,
+        body: str,
+        attachments: Optional[List[Tuple[str, str]]] = None
+    ) -> int:
+        """Store an email for delivery, returns its outbox id"""
+        db = SessionLocal()
+        try:
+            email = OutboundEmail(
+                to_emails=json.dumps(list(to_emails)),
+                subject=subject,
+                body=body,
+                attachments=json.dumps([list(attachment) for attachment in attachments]) if attachments else None,
+                status=PENDING,
+                attempts=0,
+                max_attempts=self.max_attempts,
+                next_attempt_at=datetime.now(timezone.utc)
+            )
+            db.add(email)
+            db.commit()
+            email_id = email.id
+        finally:
+            db.close()
+
+        # Deliver promptly when this process runs a sender
+        self._wake.set()
+        return email_id
+
+    def start(self):
+        """Start the background sender thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="email-sender")
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.pool.close_all()
+
+    def send_pending(self, sender_id: str) -> int:
+        """Claim and deliver one batch of due emails, returns how many were claimed"""
+        db = SessionLocal()
+        try:
+            emails = self.claim_batch(db, sender_id)
+            if not emails:
+                return 0
+
+            # Each sender thread pushes its share of the batch through one pooled connection
+            chunks = [emails[i::self.senders] for i in range(min(self.senders, len(emails)))]
+            with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+                results = list(executor.map(self._deliver, chunks))
+
+            now = datetime.now(timezone.utc)
+            for chunk, errors in zip(chunks, results):
+                for email, error in zip(chunk, errors):
+                    email.locked_by = None
+                    email.lease_expires_at = None
+                    if error is None:
+                        email.status = SENT
+                        email.sent_at = now
+                        email.last_error = None
+                    elif email.attempts >= email.max_attempts:
+                        print(f"Giving up on email {email.id} after {email.attempts} attempts: {error}")
+                        email.status = FAILED
+                        email.last_error = error
+                    else:
+                        email.status = PENDING
+                        email.last_error = error
+                        email.next_attempt_at = now + timedelta(seconds=self.retry_backoff * 2 ** (email.attempts - 1))
+            db.commit()
+            return len(emails)
+        finally:
+            db.close()
+
+    def claim_batch(self, db: Session, sender_id: str) -> List[OutboundEmail]:
+        """Lease up to `batch_size` due emails"""
+        now = datetime.now(timezone.utc)
+        values = {
+            OutboundEmail.status: SENDING,
+            OutboundEmail.locked_by: sender_id,
+            OutboundEmail.lease_expires_at: now + timedelta(seconds=self.lease_seconds),
+            OutboundEmail.attempts: OutboundEmail.attempts + 1
+        }
+        due = and_(
+            OutboundEmail.attempts < OutboundEmail.max_attempts,
+            or_(
+                and_(OutboundEmail.status == PENDING, OutboundEmail.next_attempt_at <= now),
+                and_(OutboundEmail.status == SENDING, OutboundEmail.lease_expires_at < now)
+            )
+        )
+
+        query = db.query(OutboundEmail.id).filter(due).order_by(OutboundEmail.id).limit(self.batch_size)
+        if db.bind.dialect.name == "postgresql":
+            query = query.with_for_update(skip_locked=True)
+        candidates = [email_id for (email_id,) in query.all()]
+        if not candidates:
+            db.rollback()
+            return []
+
+        # The due condition is re-checked, so a row taken by another sender is skipped
+        db.query(OutboundEmail).filter(OutboundEmail.id.in_(candidates), due).update(values, synchronize_session=False)
+        db.commit()
+        return db.query(OutboundEmail).filter(
+            OutboundEmail.id.in_(candidates),
+            OutboundEmail.locked_by == sender_id,
+            OutboundEmail.status == SENDING
+        ).order_by(OutboundEmail.id).all()
+
+    def _deliver(self, emails: List[OutboundEmail]) -> List[Optional[str]]:
+        """Send emails over one pooled connection, returns an error (or None) per email"""
+        errors = []
+        for email in emails:
+            try:
+                message = self.email_service.build_message(
+                    json.loads(email.to_emails),
+                    email.subject,
+                    email.body,
+                    [tuple(attachment) for attachment in json.loads(email.attachments or "[]")]
+                )
+                with self.pool.connection() as server:
+                    server.sendmail(self.email_service.from_email, json.loads(email.to_emails), message.as_string())
+                errors.append(None)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+        return errors
+
+    def _run(self):
+        sender_id = f"email-{socket.gethostname()}-{os.getpid()}"
+        while not self._stop.is_set():
+            try:
+                claimed = self.send_pending(sender_id)
+            except Exception as e:
+                print(f"Error sending queued emails: {e}")
+                claimed = 0
+
+            # Keep draining while batches come back full
+            if claimed < self.batch_size:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+# Global instance
+email_outbox = EmailOutbox()
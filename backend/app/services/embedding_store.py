@@ -0,0 +1,412 @@
+import json
+import os
+from datetime import datetime
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from ..models.models import MissingPersonCase
+from ..utils.face_recognition import FaceRecognitionService
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialised within one process
+    fcntl = None
+
+class SharedEmbeddingStore:
+    """Memory-mapped case embedding store shared by all worker processes.
+
+    The store directory holds one generation of `.npy` files (an N x D float32
+    embedding matrix, a case id array and an active flag array) plus a small
+    JSON manifest naming the current generation and the number of committed
+    rows. Readers map the files read-only, so every worker shares one copy
+    through the page cache, and re-map whenever the manifest changes.
+
+    Writers take an exclusive file lock. Appends write the new row past the
+    committed size and then atomically replace the manifest, tombstones clear
+    a single active byte, and growth or compaction writes a new generation
+    before switching the manifest to it. The previous generation is kept on
+    disk so a reader that has just read the manifest can still map it.
+
+    The manifest also records the signature (count, newest id, latest update)
+    of the active cases it was last reconciled with, so changes made while no
+    API process was running, or by a process using another CASE_INDEX_MODE,
+    are picked up on the next search.
+    """
+
+    MANIFEST_NAME = "manifest.json"
+    LOCK_NAME = "store.lock"
+    MIN_CAPACITY = 1024
+
+    def __init__(self, directory: str, face_service: Optional[FaceRecognitionService] = None):
+        self.directory = directory
+        self.face_service = face_service or FaceRecognitionService()
+        self._lock = threading.RLock()
+        self._manifest = None
+        self._manifest_stamp = None
+        self._embeddings = None
+        self._case_ids = None
+        self._active = None
+
+    def __len__(self) -> int:
+        manifest = self._refresh()
+        if manifest is None:
+            return 0
+        return int(np.count_nonzero(self._active[:manifest["size"]]))
+
+    def ensure_loaded(self, db: Session):
+        """Build the store on first use and pick up case changes it has not seen"""
+        signature = self._signature(db)
+        manifest = self._refresh()
+        if manifest is not None and manifest.get("signature") == signature:
+            return
+        with self._write_lock():
+            manifest = self._read_manifest()
+            if manifest is None:
+                self._build(db, signature)
+            elif manifest.get("signature") != signature:
+                self._reconcile(db, manifest, signature)
+
+    def rebuild(self, db: Session):
+        """Rewrite the store from the active cases in the database"""
+        signature = self._signature(db)
+        with self._write_lock():
+            self._build(db, signature)
+
+    def upsert(self, case_id: int, encoding: np.ndarray):
+        """Append a case embedding, tombstoning any previous row of the case"""
+        with self._write_lock():
+            self._upsert(case_id, encoding)
+
+    def remove(self, case_id: int):
+        """Tombstone a case (found or deleted)"""
+        with self._write_lock():
+            self._remove(case_id)
+
+    def sync_case(self, case: MissingPersonCase):
+        """Bring the store in line with the current state of a case row"""
+        if case.is_found or case.face_embedding is None:
+            self.remove(case.id)
+        else:
+            self.upsert(case.id, self.face_service.deserialize_encoding(case.face_embedding))
+
+    def search(self, db: Session, face_encoding: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Score a face against all active cases, returns (case_ids, similarity_scores)"""
+        self.ensure_loaded(db)
+        with self._lock:
+            size, embeddings, case_ids, active = self._snapshot()
+            if size == 0 or np.asarray(face_encoding).shape[-1] != embeddings.shape[1]:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+            scores = self.face_service.compare_faces_many(embeddings[:size], face_encoding)
+            live = active[:size].astype(bool)
+            return np.asarray(case_ids[:size])[live], scores[live]
+
+    def search_batch(
+        self,
+        db: Session,
+        face_encodings: np.ndarray,
+        top_k: int = 5
+    ) -> Tuple[List[List[Tuple[int, float]]], List[Tuple[int, int, float]]]:
+        """Score all faces of a sighting against all active cases with one matrix multiply"""
+        self.ensure_loaded(db)
+        face_encodings = np.atleast_2d(np.asarray(face_encodings, dtype=np.float32))
+        with self._lock:
+            size, embeddings, case_ids, active = self._snapshot()
+            if size == 0 or face_encodings.shape[1] != embeddings.shape[1]:
+                return [[] for _ in range(face_encodings.shape[0])], []
+
+            return self.face_service.match_faces_batch(
+                face_encodings,
+                embeddings[:size],
+                case_ids[:size],
+                top_k=top_k,
+                known_mask=active[:size].astype(bool)
+            )
+
+    def _snapshot(self):
+        manifest = self._refresh()
+        if manifest is None:
+            return 0, None, None, None
+        return manifest["size"], self._embeddings, self._case_ids, self._active
+
+    def _refresh(self) -> Optional[dict]:
+        """Re-map the store if another process has published a new manifest"""
+        path = os.path.join(self.directory, self.MANIFEST_NAME)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if stamp != self._manifest_stamp:
+                for attempt in range(3):
+                    manifest = self._read_manifest()
+                    if manifest is None:
+                        return None
+                    if self._manifest is not None and manifest["generation"] == self._manifest["generation"]:
+                        break
+                    try:
+                        self._embeddings, self._case_ids, self._active = self._open(manifest, "r")
+                        break
+                    except FileNotFoundError:
+                        # Writers switched generations twice since the manifest was read
+                        if attempt == 2:
+                            raise
+                self._manifest = manifest
+                self._manifest_stamp = stamp
+            return self._manifest
+
+    def _signature(self, db: Session) -> list:
+        """Cheap fingerprint of the active case set, in the form stored in the manifest"""
+        count, max_id, max_updated_at = db.query(
+            func.count(MissingPersonCase.id),
+            func.max(MissingPersonCase.id),
+            func.max(MissingPersonCase.updated_at)
+        ).filter(
+            MissingPersonCase.is_found == False,
+            MissingPersonCase.face_embedding.isnot(None)
+        ).one()
+        if max_updated_at is not None and not isinstance(max_updated_at, str):
+            max_updated_at = max_updated_at.isoformat()
+        return [count, max_id, max_updated_at]
+
+    def _reconcile(self, db: Session, manifest: dict, signature: list):
+        """Apply case changes the store has not seen, without rewriting it"""
+        active_ids = {
+            case_id for (case_id,) in db.query(MissingPersonCase.id).filter(
+                MissingPersonCase.is_found == False,
+                MissingPersonCase.face_embedding.isnot(None)
+            )
+        }
+        _, case_ids, active = self._open(manifest, "r")
+        size = manifest["size"]
+        stored_ids = set(np.asarray(case_ids[:size])[active[:size].astype(bool)].tolist())
+        del case_ids, active
+
+        for case_id in stored_ids - active_ids:
+            self._remove(case_id)
+
+        # Cases updated since the last reconciled signature may carry a new embedding
+        stale_ids = active_ids - stored_ids
+        previous = manifest.get("signature")
+        if previous is None:
+            # Written before signatures were recorded, embeddings may be out of date
+            stale_ids = set(active_ids)
+        else:
+            updated = MissingPersonCase.updated_at.isnot(None)
+            if previous[2] is not None:
+                updated = MissingPersonCase.updated_at >= datetime.fromisoformat(previous[2])
+            stale_ids.update(
+                case_id for (case_id,) in db.query(MissingPersonCase.id).filter(
+                    MissingPersonCase.is_found == False,
+                    MissingPersonCase.face_embedding.isnot(None),
+                    updated
+                )
+            )
+
+        stale_ids = sorted(stale_ids)
+        for start in range(0, len(stale_ids), 500):
+            rows = db.query(MissingPersonCase.id, MissingPersonCase.face_embedding).filter(
+                MissingPersonCase.id.in_(stale_ids[start:start + 500])
+            ).all()
+            for case_id, face_embedding in rows:
+                try:
+                    self._upsert(case_id, self.face_service.deserialize_encoding(face_embedding))
+                except Exception as e:
+                    print(f"Error indexing case {case_id}: {e}")
+
+        manifest = self._read_manifest()
+        manifest["signature"] = signature
+        self._write_manifest(manifest)
+
+    def _upsert(self, case_id: int, encoding: np.ndarray):
+        encoding = np.asarray(encoding, dtype=np.float32).ravel()
+        manifest = self._read_manifest()
+        if manifest is None:
+            return
+        if manifest["dimension"] and encoding.shape[0] != manifest["dimension"]:
+            raise ValueError(
+                f"Embedding dimension {encoding.shape[0]} does not match store dimension {manifest['dimension']}"
+            )
+
+        embeddings, case_ids, active = self._open(manifest, "r+")
+        manifest["tombstones"] += self._tombstone(case_ids, active, manifest["size"], case_id)
+
+        if manifest["size"] == manifest["capacity"] or not manifest["dimension"]:
+            del embeddings, case_ids, active
+            manifest = self._compact(manifest, encoding.shape[0])
+            embeddings, case_ids, active = self._open(manifest, "r+")
+
+        # Write the row beyond the committed size, then publish it via the manifest
+        row = manifest["size"]
+        embeddings[row] = encoding
+        case_ids[row] = case_id
+        active[row] = 1
+        for array in (embeddings, case_ids, active):
+            array.flush()
+
+        manifest["size"] = row + 1
+        self._write_manifest(manifest)
+
+    def _remove(self, case_id: int):
+        manifest = self._read_manifest()
+        if manifest is None:
+            return
+
+        _, case_ids, active = self._open(manifest, "r+")
+        tombstoned = self._tombstone(case_ids, active, manifest["size"], case_id)
+        if not tombstoned:
+            return
+        active.flush()
+
+        manifest["tombstones"] += tombstoned
+        if manifest["tombstones"] * 2 > manifest["size"]:
+            del case_ids, active
+            self._compact(manifest, manifest["dimension"])
+        else:
+            self._write_manifest(manifest)
+
+    def _build(self, db: Session, signature: Optional[list] = None):
+        rows = db.query(MissingPersonCase.id, MissingPersonCase.face_embedding).filter(
+            MissingPersonCase.is_found == False,
+            MissingPersonCase.face_embedding.isnot(None)
+        ).all()
+
+        case_ids = []
+        encodings = []
+        for case_id, face_embedding in rows:
+            try:
+                encoding = np.asarray(self.face_service.deserialize_encoding(face_embedding), dtype=np.float32).ravel()
+                if encodings and encoding.shape[0] != encodings[0].shape[0]:
+                    raise ValueError("embedding dimension differs from the other cases")
+                case_ids.append(case_id)
+                encodings.append(encoding)
+            except Exception as e:
+                print(f"Error indexing case {case_id}: {e}")
+
+        dimension = encodings[0].shape[0] if encodings else 0
+        previous = self._read_manifest()
+        self._write_generation(
+            generation=previous["generation"] + 1 if previous else 1,
+            dimension=dimension,
+            embeddings=np.stack(encodings) if encodings else np.empty((0, dimension), dtype=np.float32),
+            case_ids=np.asarray(case_ids, dtype=np.int64),
+            signature=signature
+        )
+
+    def _compact(self, manifest: dict, dimension: int) -> dict:
+        """Copy the live rows into a new, larger generation"""
+        embeddings, case_ids, active = self._open(manifest, "r")
+        live = active[:manifest["size"]].astype(bool)
+        if manifest["dimension"]:
+            live_embeddings = np.asarray(embeddings[:manifest["size"]][live])
+        else:
+            live_embeddings = np.empty((0, dimension), dtype=np.float32)
+        live_ids = np.asarray(case_ids[:manifest["size"]][live])
+        del embeddings, case_ids, active
+
+        return self._write_generation(
+            manifest["generation"] + 1, dimension, live_embeddings, live_ids, manifest.get("signature")
+        )
+
+    def _write_generation(
+        self,
+        generation: int,
+        dimension: int,
+        embeddings: np.ndarray,
+        case_ids: np.ndarray,
+        signature: Optional[list] = None
+    ) -> dict:
+        size = case_ids.shape[0]
+        capacity = max(self.MIN_CAPACITY, size * 2)
+        manifest = {
+            "version": 1,
+            "generation": generation,
+            "dimension": int(dimension),
+            "size": int(size),
+            "capacity": int(capacity),
+            "tombstones": 0,
+            "signature": signature
+        }
+
+        new_embeddings, new_case_ids, new_active = self._open(manifest, "w+")
+        new_embeddings[:size] = embeddings
+        new_case_ids[:size] = case_ids
+        new_active[:size] = 1
+        for array in (new_embeddings, new_case_ids, new_active):
+            array.flush()
+        del new_embeddings, new_case_ids, new_active
+
+        self._write_manifest(manifest)
+        self._remove_stale_generations(generation)
+        return manifest
+
+    def _open(self, manifest: dict, mode: str):
+        capacity = manifest["capacity"]
+        dimension = max(1, manifest["dimension"])
+        paths = self._generation_paths(manifest["generation"])
+        if mode == "w+":
+            return (
+                np.lib.format.open_memmap(paths[0], mode="w+", dtype=np.float32, shape=(capacity, dimension)),
+                np.lib.format.open_memmap(paths[1], mode="w+", dtype=np.int64, shape=(capacity,)),
+                np.lib.format.open_memmap(paths[2], mode="w+", dtype=np.uint8, shape=(capacity,))
+            )
+        return tuple(np.load(path, mmap_mode=mode) for path in paths)
+
+    def _generation_paths(self, generation: int) -> Tuple[str, str, str]:
+        return tuple(
+            os.path.join(self.directory, f"{name}-{generation}.npy")
+            for name in ("embeddings", "case_ids", "active")
+        )
+
+    def _remove_stale_generations(self, current_generation: int):
+        # Readers that still map an older generation keep it alive until they re-map,
+        # the previous generation stays for readers that read the manifest before the switch
+        current = set(self._generation_paths(current_generation))
+        current.update(self._generation_paths(current_generation - 1))
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if filename.endswith(".npy") and path not in current:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _tombstone(case_ids: np.ndarray, active: np.ndarray, size: int, case_id: int) -> int:
+        rows = np.flatnonzero((case_ids[:size] == case_id) & (active[:size] == 1))
+        active[rows] = 0
+        return int(rows.size)
+
+    def _read_manifest(self) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.directory, self.MANIFEST_NAME)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self, manifest: dict):
+        path = os.path.join(self.directory, self.MANIFEST_NAME)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @contextmanager
+    def _write_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            with open(os.path.join(self.directory, self.LOCK_NAME), "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
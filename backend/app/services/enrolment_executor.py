@@ -0,0 +1,122 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from fastapi import HTTPException, status
+
+class CaseEnrolmentExecutor:
+    """Bounded thread pool for the blocking part of case enrolment.
+
+    Face encoding of the stored photo and the retroactive match against
+    stored sighting faces run on `ENROLMENT_WORKERS` threads instead of the
+    event loop (dlib, OpenCV and numpy release the GIL while they work). Once
+    ENROLMENT_QUEUE_DEPTH enrolments are queued or running, new ones are
+    refused with HTTP 503 and a Retry-After header; call `ensure_capacity`
+    before storing the upload to refuse them early.
+
+    Queue and run times of recent enrolments are kept for `metrics`.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_queue_depth: Optional[int] = None,
+        retry_after: Optional[int] = None,
+        sample_size: int = 1000
+    ):
+        self.workers = workers if workers is not None else int(os.getenv("ENROLMENT_WORKERS", "2"))
+        self.max_queue_depth = max_queue_depth if max_queue_depth is not None else int(os.getenv("ENROLMENT_QUEUE_DEPTH", "20"))
+        self.retry_after = retry_after if retry_after is not None else int(os.getenv("ENROLMENT_RETRY_AFTER", "10"))
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._queue_times = deque(maxlen=sample_size)
+        self._run_times = deque(maxlen=sample_size)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, self.workers), thread_name_prefix="enrolment")
+
+    def ensure_capacity(self):
+        """Raise HTTP 503 if the queue is full (does not reserve a slot)"""
+        with self._lock:
+            if self._pending >= self.max_queue_depth:
+                self._rejected += 1
+                raise self._saturated()
+
+    async def run(self, fn: Callable, *args):
+        """Run `fn(*args)` on the pool and wait for its result without blocking the event loop"""
+        with self._lock:
+            if self._pending >= self.max_queue_depth:
+                self._rejected += 1
+                raise self._saturated()
+            self._pending += 1
+
+        try:
+            future = self._pool.submit(self._timed, time.monotonic(), fn, *args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        return await asyncio.wrap_future(future)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            queue_times = sorted(self._queue_times)
+            run_times = sorted(self._run_times)
+            return {
+                "workers": self.workers,
+                "max_queue_depth": self.max_queue_depth,
+                "queued": self._pending - self._running,
+                "running": self._running,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "queue_time_p50": _percentile(queue_times, 0.50),
+                "queue_time_p95": _percentile(queue_times, 0.95),
+                "queue_time_max": queue_times[-1] if queue_times else 0.0,
+                "run_time_p50": _percentile(run_times, 0.50),
+                "run_time_p95": _percentile(run_times, 0.95)
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+    def _saturated(self) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many cases are being registered, please retry later",
+            headers={"Retry-After": str(self.retry_after)}
+        )
+
+    def _timed(self, queued_at: float, fn: Callable, *args):
+        started = time.monotonic()
+        with self._lock:
+            self._running += 1
+            self._queue_times.append(started - queued_at)
+
+        failed = True
+        try:
+            result = fn(*args)
+            failed = False
+            return result
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._pending -= 1
+                self._run_times.append(time.monotonic() - started)
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+
+def _percentile(ordered, fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+# Global instance
+enrolment_executor = CaseEnrolmentExecutor()
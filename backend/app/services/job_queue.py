@@ -0,0 +1,283 @@
+import os
+import threading
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+from fastapi import HTTPException, status
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from ..models.database import SessionLocal
+from ..models.models import ProcessingJob, Sighting
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+class SightingJobQueue:
+    """Durable sighting processing queue stored in the `processing_jobs` table.
+
+    Every uploaded sighting gets a job row in the same transaction as the
+    sighting itself. A worker claims a job by taking a lease on it: on
+    PostgreSQL the candidate row is locked with FOR UPDATE SKIP LOCKED, on
+    other databases (SQLite) the claim is a conditional UPDATE that only
+    succeeds for the first worker. Running workers renew their lease; a job
+    whose lease expires (the worker crashed or was killed) becomes claimable
+    again. Failed jobs are retried with exponential backoff until
+    `max_attempts` is reached.
+
+    With SIGHTING_DISPATCH=executor (default) the API also hands new jobs to
+    its own `processing_executor`. With SIGHTING_DISPATCH=worker it only
+    writes the job rows and standalone `python -m app.worker` processes pick
+    them up.
+    """
+
+    def __init__(
+        self,
+        dispatch_mode: Optional[str] = None,
+        lease_seconds: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        retry_backoff: Optional[float] = None
+    ):
+        self.dispatch_mode = (dispatch_mode or os.getenv("SIGHTING_DISPATCH", "executor")).lower()
+        self.lease_seconds = lease_seconds if lease_seconds is not None else int(os.getenv("JOB_LEASE_SECONDS", "300"))
+        self.max_attempts = max_attempts if max_attempts is not None else int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+        self.retry_backoff = retry_backoff if retry_backoff is not None else float(os.getenv("JOB_RETRY_BACKOFF", "30"))
+        self._dispatcher = None
+        self._stop = threading.Event()
+
+    def enqueue(self, db: Session, sighting_id: int) -> ProcessingJob:
+        """Add a job for a sighting to the session, reusing an unfinished one"""
+        job = db.query(ProcessingJob).filter(
+            ProcessingJob.sighting_id == sighting_id,
+            ProcessingJob.status.in_([PENDING, RUNNING])
+        ).first()
+        if job is not None:
+            return job
+
+        job = ProcessingJob(
+            sighting_id=sighting_id,
+            status=PENDING,
+            attempts=0,
+            max_attempts=self.max_attempts,
+            available_at=datetime.now(timezone.utc)
+        )
+        db.add(job)
+        return job
+
+    def ensure_capacity(self, db: Session):
+        """Raise HTTP 503 if the processing backlog is full"""
+        from .processing_executor import processing_executor
+
+        if self.dispatch_mode == "executor":
+            processing_executor.ensure_capacity()
+            return
+
+        backlog = db.query(ProcessingJob).filter(ProcessingJob.status.in_([PENDING, RUNNING])).count()
+        if backlog >= processing_executor.max_queue_depth:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Sighting processing queue is full, please retry later",
+                headers={"Retry-After": str(processing_executor.retry_after)}
+            )
+
+    def dispatch(self, sighting_id: int):
+        """Start processing a committed job right away when the API runs the workers"""
+        if self.dispatch_mode != "executor":
+            return
+        from .processing_executor import processing_executor
+        try:
+            processing_executor.submit(sighting_id)
+        except HTTPException as e:
+            if e.status_code != status.HTTP_503_SERVICE_UNAVAILABLE:
+                raise
+            # The pool filled up since ensure_capacity, the job is committed and the dispatcher picks it up
+            print(f"Processing pool is full, sighting {sighting_id} waits for the dispatcher")
+
+    def recover(self, db: Session) -> int:
+        """Queue sightings left behind by a previous API process, returns how many were dispatched"""
+        # Sightings uploaded before the job table existed
+        orphans = db.query(Sighting.id).filter(
+            Sighting.processed == False,
+            ~Sighting.id.in_(db.query(ProcessingJob.sighting_id))
+        ).all()
+        for (sighting_id,) in orphans:
+            self.enqueue(db, sighting_id)
+        self._fail_exhausted(db)
+        db.commit()
+
+        return self.dispatch_pending(db)
+
+    def dispatch_pending(self, db: Session) -> int:
+        """Hand claimable jobs (new, due for retry or with an expired lease) to the executor"""
+        if self.dispatch_mode != "executor":
+            return 0
+
+        from .processing_executor import processing_executor
+        dispatched = 0
+        for (sighting_id,) in self._claimable(db, ProcessingJob.sighting_id).all():
+            if not processing_executor.has_capacity():
+                break
+            if processing_executor.submit(sighting_id):
+                dispatched += 1
+        return dispatched
+
+    def start_dispatcher(self, poll_interval: Optional[float] = None):
+        """Periodically re-dispatch retries and expired leases in executor mode"""
+        if self.dispatch_mode != "executor" or self._dispatcher is not None:
+            return
+        poll_interval = poll_interval if poll_interval is not None else float(os.getenv("JOB_POLL_INTERVAL", "15"))
+        self._stop.clear()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, args=(poll_interval,), daemon=True, name="job-dispatcher")
+        self._dispatcher.start()
+
+    def stop_dispatcher(self):
+        if self._dispatcher is not None:
+            self._stop.set()
+            self._dispatcher.join()
+            self._dispatcher = None
+
+    def _dispatch_loop(self, poll_interval: float):
+        while not self._stop.wait(poll_interval):
+            db = SessionLocal()
+            try:
+                self.dispatch_pending(db)
+            except Exception as e:
+                print(f"Error dispatching processing jobs: {e}")
+            finally:
+                db.close()
+
+    def claim(self, db: Session, worker_id: str, sighting_id: Optional[int] = None) -> Optional[ProcessingJob]:
+        """Lease the next claimable job (optionally of one sighting), or None"""
+        now = datetime.now(timezone.utc)
+        values = {
+            ProcessingJob.status: RUNNING,
+            ProcessingJob.locked_by: worker_id,
+            ProcessingJob.lease_expires_at: now + timedelta(seconds=self.lease_seconds),
+            ProcessingJob.started_at: now,
+            ProcessingJob.attempts: ProcessingJob.attempts + 1
+        }
+
+        if db.bind.dialect.name == "postgresql":
+            query = self._claimable(db, ProcessingJob, now, sighting_id)
+            job = query.with_for_update(skip_locked=True).first()
+            if job is None:
+                db.rollback()
+                return None
+            db.query(ProcessingJob).filter(ProcessingJob.id == job.id).update(values, synchronize_session=False)
+            db.commit()
+            db.refresh(job)
+            return job
+
+        # Without row locks, claim with a compare-and-set on the claimable state
+        candidates = [job_id for (job_id,) in self._claimable(db, ProcessingJob.id, now, sighting_id).limit(5).all()]
+        for job_id in candidates:
+            claimed = db.query(ProcessingJob).filter(ProcessingJob.id == job_id, self._claimable_criteria(now)).update(
+                values, synchronize_session=False
+            )
+            db.commit()
+            if claimed:
+                return db.query(ProcessingJob).filter(ProcessingJob.id == job_id).first()
+        return None
+
+    def heartbeat(self, db: Session, job: ProcessingJob, worker_id: str) -> bool:
+        """Extend the lease of a running job, returns False if it was lost"""
+        renewed = db.query(ProcessingJob).filter(
+            ProcessingJob.id == job.id,
+            ProcessingJob.status == RUNNING,
+            ProcessingJob.locked_by == worker_id
+        ).update(
+            {ProcessingJob.lease_expires_at: datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)},
+            synchronize_session=False
+        )
+        db.commit()
+        return bool(renewed)
+
+    def complete(self, db: Session, job: ProcessingJob):
+        job.status = DONE
+        job.finished_at = datetime.now(timezone.utc)
+        job.lease_expires_at = None
+        job.last_error = None
+        db.commit()
+
+    def fail(self, db: Session, job: ProcessingJob, error: str):
+        """Record a failed attempt and schedule a retry if attempts remain"""
+        now = datetime.now(timezone.utc)
+        job.last_error = error
+        job.lease_expires_at = None
+        if job.attempts >= job.max_attempts:
+            job.status = FAILED
+            job.finished_at = now
+        else:
+            job.status = PENDING
+            job.available_at = now + timedelta(seconds=self.retry_backoff * 2 ** (job.attempts - 1))
+        db.commit()
+
+    def run_next(self, worker_id: str, process: Callable[[int], None], sighting_id: Optional[int] = None) -> bool:
+        """Claim one job, process it and record the outcome, returns False if there was none"""
+        db = SessionLocal()
+        try:
+            job = self.claim(db, worker_id, sighting_id)
+            if job is None:
+                return False
+
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=self._heartbeat_loop, args=(job, worker_id, stop), daemon=True)
+            heartbeat.start()
+            try:
+                process(job.sighting_id)
+            except Exception as e:
+                print(f"Job {job.id} for sighting {job.sighting_id} failed (attempt {job.attempts}): {e}")
+                db.rollback()
+                self.fail(db, job, traceback.format_exc())
+            else:
+                self.complete(db, job)
+            finally:
+                stop.set()
+                heartbeat.join()
+            return True
+        finally:
+            db.close()
+
+    def _heartbeat_loop(self, job: ProcessingJob, worker_id: str, stop: threading.Event):
+        # Renew well before expiry so a slow video never loses its lease
+        while not stop.wait(max(1.0, self.lease_seconds / 3)):
+            db = SessionLocal()
+            try:
+                if not self.heartbeat(db, job, worker_id):
+                    print(f"Lost the lease on job {job.id}")
+                    return
+            except Exception as e:
+                print(f"Error renewing lease on job {job.id}: {e}")
+            finally:
+                db.close()
+
+    def _claimable(self, db: Session, entity, now: Optional[datetime] = None, sighting_id: Optional[int] = None):
+        query = db.query(entity).filter(self._claimable_criteria(now or datetime.now(timezone.utc)))
+        if sighting_id is not None:
+            query = query.filter(ProcessingJob.sighting_id == sighting_id)
+        return query.order_by(ProcessingJob.id)
+
+    @staticmethod
+    def _claimable_criteria(now: datetime):
+        return and_(
+            ProcessingJob.attempts < ProcessingJob.max_attempts,
+            or_(
+                and_(ProcessingJob.status == PENDING, ProcessingJob.available_at <= now),
+                and_(ProcessingJob.status == RUNNING, ProcessingJob.lease_expires_at < now)
+            )
+        )
+
+    def _fail_exhausted(self, db: Session):
+        # Jobs whose worker died on their last attempt would otherwise stay running forever
+        db.query(ProcessingJob).filter(
+            ProcessingJob.status == RUNNING,
+            ProcessingJob.lease_expires_at < datetime.now(timezone.utc),
+            ProcessingJob.attempts >= ProcessingJob.max_attempts
+        ).update(
+            {ProcessingJob.status: FAILED, ProcessingJob.finished_at: datetime.now(timezone.utc)},
+            synchronize_session=False
+        )
+
+# Global instance
+job_queue = SightingJobQueue()
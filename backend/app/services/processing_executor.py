@@ -0,0 +1,143 @@
+import multiprocessing
+import os
+import socket
+import threading
+from concurrent.futures import BrokenExecutor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+from fastapi import HTTPException, status
+from ..models.database import SessionLocal, engine
+
+class SightingProcessingExecutor:
+    """Bounded executor that runs sighting processing outside the web process.
+
+    With SIGHTING_WORKERS > 0 sightings are processed in a pool of worker
+    processes, each holding its own warmed-up BackgroundTaskService. With 0
+    they run on a single background thread in the API process. The API only
+    submits sighting ids; once SIGHTING_QUEUE_DEPTH sightings are queued or
+    running, new submissions are refused with HTTP 503 and a Retry-After header.
+
+    Workers process a sighting by claiming its row in the durable job queue,
+    so a sighting lost with a crashed process is picked up again later.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_queue_depth: Optional[int] = None, retry_after: Optional[int] = None):
+        self.workers = workers if workers is not None else int(os.getenv("SIGHTING_WORKERS", "2"))
+        self.max_queue_depth = max_queue_depth if max_queue_depth is not None else int(os.getenv("SIGHTING_QUEUE_DEPTH", "100"))
+        self.retry_after = retry_after if retry_after is not None else int(os.getenv("SIGHTING_RETRY_AFTER", "30"))
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._in_flight = set()
+        self._pool = None
+
+    @property
+    def queue_depth(self) -> int:
+        return self._pending
+
+    def has_capacity(self) -> bool:
+        return self._pending < self.max_queue_depth
+
+    def ensure_capacity(self):
+        """Raise HTTP 503 if the queue is full"""
+        if not self.has_capacity():
+            raise self._saturated()
+
+    def submit(self, sighting_id: int) -> bool:
+        """Queue a sighting for processing, returns False if it is already queued"""
+        with self._lock:
+            if sighting_id in self._in_flight:
+                return False
+            if self._pending >= self.max_queue_depth:
+                raise self._saturated()
+            self._pending += 1
+            self._in_flight.add(sighting_id)
+            pool = self._get_pool()
+
+        try:
+            try:
+                future = pool.submit(_process_sighting, sighting_id)
+            except BrokenExecutor:
+                # A worker died (e.g. OOM on a huge video), start a fresh pool
+                print("Sighting processing pool is broken, restarting it")
+                with self._lock:
+                    if self._pool is pool:
+                        self._pool = None
+                    pool = self._get_pool()
+                future = pool.submit(_process_sighting, sighting_id)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+                self._in_flight.discard(sighting_id)
+            raise
+        future.add_done_callback(lambda f: self._on_done(sighting_id, f))
+        return True
+
+    def shutdown(self, wait: bool = True):
+        # Shut down outside the lock, the done callbacks of running sightings take it
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.workers > 0:
+                # The API process already runs threads, so workers must not be forked from it
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker
+                )
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sighting")
+        return self._pool
+
+    def _on_done(self, sighting_id: int, future: Future):
+        with self._lock:
+            self._pending -= 1
+            self._in_flight.discard(sighting_id)
+        if future.exception() is not None:
+            print(f"Error processing sighting {sighting_id} in executor: {future.exception()}")
+
+    def _saturated(self) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Sighting processing queue is full, please retry later",
+            headers={"Retry-After": str(self.retry_after)}
+        )
+
+# Per-worker-process state, set up by _init_worker
+_worker_service = None
+
+def _init_worker():
+    """Warm up a worker process: fresh DB connections, face models and case index"""
+    global _worker_service
+    from .background_tasks import BackgroundTaskService
+    from .case_index import case_index
+
+    # Connections inherited from the parent must not be shared with it
+    engine.dispose(close=False)
+
+    _worker_service = BackgroundTaskService()
+    db = SessionLocal()
+    try:
+        case_index.ensure_loaded(db)
+    except Exception as e:
+        print(f"Error warming up case index in sighting worker: {e}")
+    finally:
+        db.close()
+
+def _process_sighting(sighting_id: int):
+    from .job_queue import job_queue
+
+    if _worker_service is None:
+        # Thread mode runs in the API process and shares its service
+        from .background_tasks import background_service
+        service = background_service
+    else:
+        service = _worker_service
+
+    # Another process may already hold this sighting's job, then there is nothing to do
+    job_queue.run_next(f"executor-{socket.gethostname()}-{os.getpid()}", service.process_sighting, sighting_id=sighting_id)
+
+# Global instance
+processing_executor = SightingProcessingExecutor()
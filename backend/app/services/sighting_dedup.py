@@ -0,0 +1,169 @@
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from ..models.models import Sighting, SightingFingerprint
+from ..utils import perceptual_hash
+import numpy as np
+
+class SightingDeduplicator:
+    """Recognises sightings whose media was already processed.
+
+    An upload with the same SHA-256 as a processed sighting is an exact
+    duplicate. Otherwise the image, or `keyframes` frames spread over a
+    video, is reduced to 64-bit dHashes and compared with the fingerprints
+    of every processed sighting; when each keyframe is within
+    `threshold` bits of the same keyframe of an earlier sighting of the same
+    type, the media is a near duplicate (re-encoded, resized, re-uploaded).
+
+    SIGHTING_DEDUP=exact (default) only checks file hashes, off disables
+    both. Perceptual matching is opt-in: frames of the same scene from a
+    fixed camera can be only a few bits apart with different people in
+    them, and a near duplicate skips face detection.
+
+    Fingerprints are only ever appended (a reprocessed sighting gets a new
+    row), so like the sighting face index the in-memory matrices catch up by
+    loading newer rows, and are rebuilt when rows were replaced.
+    """
+
+    BATCH_SIZE = 5000
+
+    def __init__(self, mode: Optional[str] = None, threshold: Optional[int] = None, keyframes: Optional[int] = None):
+        self.mode = mode or os.getenv("SIGHTING_DEDUP", "exact")
+        self.threshold = threshold if threshold is not None else int(os.getenv("DEDUP_HAMMING_THRESHOLD", "6"))
+        self.keyframes = keyframes if keyframes is not None else int(os.getenv("DEDUP_VIDEO_KEYFRAMES", "5"))
+        self._lock = threading.RLock()
+        self._reset()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("exact", "perceptual")
+
+    def find_exact(self, db: Session, content_hash: Optional[str], exclude_id: Optional[int] = None) -> Optional[int]:
+        """Id of the first processed sighting of a file with this SHA-256"""
+        if not self.enabled or not content_hash:
+            return None
+        query = db.query(Sighting.id).filter(
+            Sighting.content_hash == content_hash,
+            Sighting.processed == True,
+            Sighting.duplicate_of.is_(None)
+        )
+        if exclude_id is not None:
+            query = query.filter(Sighting.id != exclude_id)
+        row = query.order_by(Sighting.id).first()
+        return row[0] if row else None
+
+    def find_original(self, db: Session, sighting: Sighting) -> Tuple[Optional[int], List[int]]:
+        """Earlier sighting with the same or nearly the same media.
+
+        Returns (original_id or None, the sighting's perceptual hashes); the
+        hashes are empty when they were not needed or could not be computed.
+        """
+        original_id = self.find_exact(db, sighting.content_hash, exclude_id=sighting.id)
+        if original_id is not None or self.mode != "perceptual":
+            return original_id, []
+
+        try:
+            hashes = perceptual_hash.media_hashes(sighting.file_path, sighting.file_type, self.keyframes)
+        except Exception as e:
+            print(f"Error fingerprinting sighting {sighting.id}: {e}")
+            return None, []
+        if not hashes:
+            return None, []
+        return self.search(db, sighting.file_type, hashes, exclude_id=sighting.id), hashes
+
+    def remember(self, db: Session, sighting: Sighting, hashes: List[int]):
+        """Store the fingerprint of a processed original sighting (caller commits)"""
+        db.query(SightingFingerprint).filter(SightingFingerprint.sighting_id == sighting.id).delete(synchronize_session=False)
+        if hashes:
+            db.add(SightingFingerprint(
+                sighting_id=sighting.id,
+                file_type=sighting.file_type,
+                perceptual_hash=perceptual_hash.to_hex(hashes)
+            ))
+
+    def search(self, db: Session, file_type: str, hashes: List[int], exclude_id: Optional[int] = None) -> Optional[int]:
+        """Closest fingerprinted sighting with every keyframe within the threshold"""
+        self.ensure_loaded(db)
+        query = np.asarray(hashes, dtype=np.uint64)
+        with self._lock:
+            group = self._groups.get((file_type, len(hashes)))
+            if group is None or group["size"] == 0:
+                return None
+            size = group["size"]
+            matrix = group["hashes"][:size]
+            sighting_ids = group["sighting_ids"][:size]
+
+            # Hamming distance of each keyframe, a sighting is as far as its worst keyframe
+            differing = (matrix ^ query).view(np.uint8).reshape(size, len(hashes), 8)
+            distances = perceptual_hash.POPCOUNT[differing].sum(axis=2, dtype=np.int32).max(axis=1)
+            if exclude_id is not None:
+                distances[sighting_ids == exclude_id] = np.iinfo(np.int32).max
+
+            best = int(np.argmin(distances))
+            if distances[best] > self.threshold:
+                return None
+            return int(sighting_ids[best])
+
+    def ensure_loaded(self, db: Session):
+        """Load fingerprints stored since the last call, reloading if any were replaced"""
+        count, max_id = db.query(func.count(SightingFingerprint.id), func.max(SightingFingerprint.id)).one()
+
+        with self._lock:
+            if count == self._seen and (max_id or 0) == self._last_id:
+                return
+            if count < self._seen:
+                self._reset()
+
+            self._load_after(db, self._last_id)
+            if self._seen != count:
+                self._reset()
+                self._load_after(db, 0)
+
+    def _load_after(self, db: Session, last_id: int):
+        while True:
+            rows = db.query(
+                SightingFingerprint.id,
+                SightingFingerprint.sighting_id,
+                SightingFingerprint.file_type,
+                SightingFingerprint.perceptual_hash
+            ).filter(SightingFingerprint.id > last_id).order_by(SightingFingerprint.id).limit(self.BATCH_SIZE).all()
+            if not rows:
+                return
+
+            for _, sighting_id, file_type, text in rows:
+                self._seen += 1
+                try:
+                    self._append(sighting_id, file_type, perceptual_hash.from_hex(text))
+                except ValueError as e:
+                    print(f"Error indexing fingerprint of sighting {sighting_id}: {e}")
+            last_id = rows[-1][0]
+            self._last_id = last_id
+
+    def _append(self, sighting_id: int, file_type: str, hashes: List[int]):
+        key = (file_type, len(hashes))
+        group = self._groups.get(key)
+        if group is None:
+            group = {"hashes": np.empty((0, len(hashes)), dtype=np.uint64), "sighting_ids": np.empty(0, dtype=np.int64), "size": 0}
+            self._groups[key] = group
+
+        size = group["size"]
+        if size == group["hashes"].shape[0]:
+            capacity = max(1024, size * 2)
+            grown = np.empty((capacity, len(hashes)), dtype=np.uint64)
+            grown[:size] = group["hashes"][:size]
+            group["hashes"] = grown
+            group["sighting_ids"] = np.resize(group["sighting_ids"], capacity)
+
+        group["hashes"][size] = hashes
+        group["sighting_ids"][size] = sighting_id
+        group["size"] = size + 1
+
+    def _reset(self):
+        self._groups: Dict[Tuple[str, int], dict] = {}
+        self._seen = 0
+        self._last_id = 0
+
+# Global instance
+sighting_dedup = SightingDeduplicator()
@@ -0,0 +1,117 @@
+import threading
+from typing import Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from ..models.models import SightingFace
+from ..utils.face_recognition import FaceRecognitionService
+import numpy as np
+
+class SightingFaceIndex:
+    """Process-wide matrix of every stored sighting face, for retroactive matching.
+
+    Sighting processing only ever appends faces, so the index catches up by
+    loading the rows newer than the last one it has seen. If faces were
+    removed (a sighting was reprocessed) the row count no longer adds up and
+    the index is reloaded from scratch.
+    """
+
+    BATCH_SIZE = 5000
+
+    def __init__(self, face_service: Optional[FaceRecognitionService] = None):
+        self.face_service = face_service or FaceRecognitionService()
+        self._lock = threading.RLock()
+        self._reset()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def ensure_loaded(self, db: Session):
+        """Load faces stored since the last call, reloading if any were removed"""
+        count, max_id = db.query(func.count(SightingFace.id), func.max(SightingFace.id)).filter(
+            SightingFace.embedding.isnot(None)
+        ).one()
+
+        with self._lock:
+            if count == self._seen and (max_id or 0) == self._last_id:
+                return
+            if count < self._seen:
+                self._reset()
+
+            self._load_after(db, self._last_id)
+            if self._seen != count:
+                # Faces below the watermark were deleted in the meantime
+                self._reset()
+                self._load_after(db, 0)
+
+    def search(self, db: Session, case_encoding: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Score a case embedding against all stored faces.
+
+        Returns (face_ids, sighting_ids, similarity_scores) of the faces above
+        the match threshold, keeping only the best face of each sighting.
+        """
+        self.ensure_loaded(db)
+        case_encoding = np.asarray(case_encoding, dtype=np.float32).ravel()
+        with self._lock:
+            if self._size == 0 or case_encoding.shape[0] != self._embeddings.shape[1]:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+            scores = self.face_service.compare_faces_many(self._embeddings[:self._size], case_encoding)
+            rows = np.flatnonzero(scores >= self.face_service.threshold)
+            face_ids = self._face_ids[rows]
+            sighting_ids = self._sighting_ids[rows]
+            scores = scores[rows]
+
+        # Best face per sighting: sort by score, keep the first row of each sighting
+        order = np.argsort(-scores, kind="stable")
+        _, first = np.unique(sighting_ids[order], return_index=True)
+        best = order[first]
+        return face_ids[best], sighting_ids[best], scores[best]
+
+    def _load_after(self, db: Session, last_id: int):
+        while True:
+            rows = db.query(SightingFace.id, SightingFace.sighting_id, SightingFace.embedding).filter(
+                SightingFace.id > last_id,
+                SightingFace.embedding.isnot(None)
+            ).order_by(SightingFace.id).limit(self.BATCH_SIZE).all()
+            if not rows:
+                return
+
+            for face_id, sighting_id, embedding in rows:
+                self._seen += 1
+                try:
+                    self._append(face_id, sighting_id, self.face_service.deserialize_encoding(embedding))
+                except Exception as e:
+                    print(f"Error indexing sighting face {face_id}: {e}")
+            last_id = rows[-1][0]
+            self._last_id = last_id
+
+    def _append(self, face_id: int, sighting_id: int, encoding: np.ndarray):
+        encoding = np.asarray(encoding, dtype=np.float32).ravel()
+        if self._size == 0 and self._embeddings.shape[1] != encoding.shape[0]:
+            self._embeddings = np.empty((0, encoding.shape[0]), dtype=np.float32)
+        elif encoding.shape[0] != self._embeddings.shape[1]:
+            raise ValueError(f"Embedding dimension {encoding.shape[0]} does not match index dimension {self._embeddings.shape[1]}")
+
+        if self._size == self._embeddings.shape[0]:
+            capacity = max(1024, self._size * 2)
+            embeddings = np.empty((capacity, encoding.shape[0]), dtype=np.float32)
+            embeddings[:self._size] = self._embeddings[:self._size]
+            self._embeddings = embeddings
+            self._face_ids = np.resize(self._face_ids, capacity)
+            self._sighting_ids = np.resize(self._sighting_ids, capacity)
+
+        self._embeddings[self._size] = encoding
+        self._face_ids[self._size] = face_id
+        self._sighting_ids[self._size] = sighting_id
+        self._size += 1
+
+    def _reset(self):
+        self._embeddings = np.empty((0, 0), dtype=np.float32)
+        self._face_ids = np.empty(0, dtype=np.int64)
+        self._sighting_ids = np.empty(0, dtype=np.int64)
+        self._size = 0
+        self._seen = 0
+        self._last_id = 0
+
+# Global instance
+sighting_face_index = SightingFaceIndex()
@@ -0,0 +1,76 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+from sqlalchemy import case, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from ..models.models import MissingPersonCase, Sighting, Match, StatCounter
+
+COUNTERS = ("total_cases", "found_cases", "total_sightings", "total_matches", "verified_matches")
+
+class StatsService:
+    """Admin dashboard counters.
+
+    The counters live in the `stat_counters` table and are adjusted with
+    `increment` in the same transactions that create, close or delete the
+    rows they count, so reading them is a single small query. That read is
+    cached in-process for `cache_ttl` seconds. `recount` rebuilds them from
+    the data tables with one aggregate query, and is used to seed the table.
+    """
+
+    def __init__(self, cache_ttl: Optional[float] = None):
+        self.cache_ttl = cache_ttl if cache_ttl is not None else float(os.getenv("STATS_CACHE_TTL", "5"))
+        self._lock = threading.Lock()
+        self._cached: Optional[Dict[str, int]] = None
+        self._cached_at = 0.0
+
+    def get(self, db: Session) -> Dict[str, int]:
+        """Current counters, served from the cache while it is fresh"""
+        with self._lock:
+            if self._cached is not None and time.monotonic() - self._cached_at < self.cache_ttl:
+                return dict(self._cached)
+
+        counters = dict(db.query(StatCounter.name, StatCounter.value).filter(StatCounter.name.in_(COUNTERS)).all())
+        if len(counters) < len(COUNTERS):
+            counters = self.recount(db)
+
+        with self._lock:
+            self._cached = counters
+            self._cached_at = time.monotonic()
+        return dict(counters)
+
+    def recount(self, db: Session) -> Dict[str, int]:
+        """Count everything with one aggregate query and store the result"""
+        row = db.query(
+            select(func.count(MissingPersonCase.id)).scalar_subquery(),
+            select(func.coalesce(func.sum(case((MissingPersonCase.is_found == True, 1), else_=0)), 0)).scalar_subquery(),
+            select(func.count(Sighting.id)).scalar_subquery(),
+            select(func.count(Match.id)).scalar_subquery(),
+            select(func.coalesce(func.sum(case((Match.verified == True, 1), else_=0)), 0)).scalar_subquery()
+        ).one()
+        counters = {name: int(value) for name, value in zip(COUNTERS, row)}
+
+        try:
+            for name, value in counters.items():
+                db.merge(StatCounter(name=name, value=value))
+            db.commit()
+        except IntegrityError:
+            # Another process seeded the table at the same time
+            db.rollback()
+
+        with self._lock:
+            self._cached = None
+        return counters
+
+    def increment(self, db: Session, **deltas: int):
+        """Adjust counters inside the caller's transaction (the caller commits)"""
+        for name, delta in deltas.items():
+            if delta:
+                db.query(StatCounter).filter(StatCounter.name == name).update(
+                    {StatCounter.value: StatCounter.value + delta},
+                    synchronize_session=False
+                )
+
+# Global instance
+stats_service = StatsService()
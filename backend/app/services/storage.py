@@ -0,0 +1,78 @@
+import hashlib
+import os
+import re
+from typing import Optional
+
+# Crop directories written before the sharded layout: uploads/sightings/sighting_<id>/<file>
+LEGACY_CROP_PATTERN = re.compile(r"^sightings/sighting_(\d+)/([^/]+)$")
+
+class StorageLayout:
+    """Resolves where uploaded and generated files live under uploads/.
+
+    Files are spread over two levels of 256 directories named after the
+    leading hex digits of their key, e.g. uploads/cases/ab/cd/abcd…e1.jpg,
+    so no directory grows past a few thousand entries even with millions of
+    files. Uploads are keyed by their SHA-256; the face crops of a sighting
+    go to uploads/faces/<shard>/sighting_<id>/, sharded by a hash of the id
+    so consecutive sightings do not all land in the same directory.
+
+    Stored paths stay relative to the backend directory, they are served
+    as-is by the /uploads static mount.
+    """
+
+    def __init__(self, root: str = "uploads", levels: int = 2, width: int = 2):
+        self.root = root
+        self.levels = levels
+        self.width = width
+
+    def shard(self, key: str) -> str:
+        """Fan-out directories for a hex key, 'abcdef…' -> 'ab/cd'"""
+        return os.path.join(*(key[i * self.width:(i + 1) * self.width] for i in range(self.levels)))
+
+    def content_path(self, category: str, sha256: str, extension: str) -> str:
+        """Path of an uploaded file of `category` ('cases' or 'sightings')"""
+        return os.path.join(self.root, category, self.shard(sha256), sha256 + extension)
+
+    def temp_path(self, category: str, name: str) -> str:
+        """Path for a file being written, on the same filesystem as its final place"""
+        directory = os.path.join(self.root, category, "tmp")
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, name)
+
+    def sighting_dir(self, sighting_id: int) -> str:
+        """Directory holding the face crops of a sighting"""
+        key = hashlib.sha256(str(sighting_id).encode()).hexdigest()
+        return os.path.join(self.root, "faces", self.shard(key), f"sighting_{sighting_id}")
+
+    def face_crop_path(self, sighting_id: int, filename: str) -> str:
+        return os.path.join(self.sighting_dir(sighting_id), filename)
+
+    def is_sharded(self, path: str) -> bool:
+        """Whether `path` already follows this layout"""
+        parts = os.path.relpath(path, self.root).split(os.sep)
+        if len(parts) == self.levels + 2 and parts[0] in ("cases", "sightings"):
+            shards, name = parts[1:-1], parts[-1]
+            return all(len(shard) == self.width for shard in shards) and name.startswith("".join(shards))
+        if len(parts) == self.levels + 3 and parts[0] == "faces":
+            return parts[-2].startswith("sighting_")
+        return False
+
+    def legacy_crop_target(self, path: Optional[str]) -> Optional[str]:
+        """New path of a crop written under uploads/sightings/sighting_<id>/, None for other paths"""
+        if not path:
+            return None
+        found = LEGACY_CROP_PATTERN.match(os.path.relpath(path, self.root).replace(os.sep, "/"))
+        if not found:
+            return None
+        return self.face_crop_path(int(found.group(1)), found.group(2))
+
+    def ensure_parent(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def remove(self, path: Optional[str]):
+        """Delete a stored file if it exists"""
+        if path and os.path.exists(path):
+            os.remove(path)
+
+# Global instance
+storage = StorageLayout()
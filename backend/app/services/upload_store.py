@@ -0,0 +1,111 @@
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+import aiofiles
+from fastapi import HTTPException, UploadFile, status
+from .storage import StorageLayout, storage as default_storage
+
+# Extensions for the content types the upload routes accept
+CONTENT_TYPE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg",
+    "image/png": ".png",
+    "video/mp4": ".mp4",
+    "video/avi": ".avi",
+    "video/mov": ".mov"
+}
+
+@dataclass
+class StoredUpload:
+    path: str
+    sha256: str
+    size: int
+    duplicate: bool  # The same content was already stored
+
+class UploadStore:
+    """Stores uploaded files under content-addressed names.
+
+    The upload is streamed to a temporary file in chunks while its SHA-256
+    is computed, and is refused with HTTP 413 as soon as it exceeds the
+    limit for its type. The file is then renamed to `<sha256><ext>` in its
+    shard directory (see StorageLayout), so two uploads never overwrite each
+    other and uploading the same content again is detected by the name
+    already existing.
+    """
+
+    def __init__(
+        self,
+        layout: Optional[StorageLayout] = None,
+        chunk_size: Optional[int] = None,
+        max_image_bytes: Optional[int] = None,
+        max_video_bytes: Optional[int] = None
+    ):
+        self.layout = layout or default_storage
+        self.chunk_size = chunk_size if chunk_size is not None else int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
+        self.max_image_bytes = max_image_bytes if max_image_bytes is not None else int(os.getenv("UPLOAD_MAX_IMAGE_MB", "10")) * 1024 * 1024
+        self.max_video_bytes = max_video_bytes if max_video_bytes is not None else int(os.getenv("UPLOAD_MAX_VIDEO_MB", "200")) * 1024 * 1024
+
+    async def save(self, upload: UploadFile, category: str, file_type: str) -> StoredUpload:
+        """Stream `upload` into uploads/<category>/<shard>/, file_type is 'image' or 'video'"""
+        limit = self.max_video_bytes if file_type == "video" else self.max_image_bytes
+
+        # Multipart bodies are spooled before the route runs, refuse oversized ones without copying
+        if upload.size is not None and upload.size > limit:
+            raise self._too_large(file_type, limit)
+
+        temp_path = self.layout.temp_path(category, f".upload-{uuid.uuid4().hex}.part")
+
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(temp_path, "wb") as out:
+                while True:
+                    chunk = await upload.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > limit:
+                        raise self._too_large(file_type, limit)
+                    digest.update(chunk)
+                    await out.write(chunk)
+
+            if size == 0:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="The uploaded file is empty"
+                )
+
+            sha256 = digest.hexdigest()
+            path = self.layout.content_path(category, sha256, self._extension(upload))
+            duplicate = os.path.exists(path)
+            if duplicate:
+                os.remove(temp_path)
+            else:
+                self.layout.ensure_parent(path)
+                os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return StoredUpload(path=path, sha256=sha256, size=size, duplicate=duplicate)
+
+    @staticmethod
+    def _extension(upload: UploadFile) -> str:
+        extension = CONTENT_TYPE_EXTENSIONS.get(upload.content_type)
+        if extension:
+            return extension
+        _, extension = os.path.splitext(upload.filename or "")
+        return extension.lower() if extension[1:].isalnum() else ".jpg"
+
+    @staticmethod
+    def _too_large(file_type: str, limit: int) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"The {file_type} is larger than the {limit // (1024 * 1024)}MB limit"
+        )
+
+# Global instance
+upload_store = UploadStore()
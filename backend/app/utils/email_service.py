@@ -3,19 +3,28 @@ import os
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.image import MIMEImage
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
 
 class EmailService:
+    """Builds notification emails and queues them in the outbox.
+
+    Messages are written to the `email_outbox` table and delivered by the
+    background sender in `app.services.email_outbox`, so callers never wait
+    on SMTP.
+    """
+
     def __init__(self):
         self.smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
         self.smtp_port = int(os.getenv("SMTP_PORT", "587"))
         self.username = os.getenv("SMTP_USERNAME")
         self.password = os.getenv("SMTP_PASSWORD")
         self.from_email = os.getenv("FROM_EMAIL")
-    
+        self.use_tls = os.getenv("SMTP_USE_TLS", "true").lower() == "true"
+        self.timeout = float(os.getenv("SMTP_TIMEOUT", "30"))
+
     def send_match_alert(
         self,
         to_emails: List[str],
@@ -25,131 +34,167 @@ class EmailService:
         timestamp: str,
         matched_image_path: Optional[str] = None
     ) -> bool:
-        """Send email alert when a match is found"""
-        try:
-            msg = MIMEMultipart()
-            msg['From'] = self.from_email
-            msg['To'] = ', '.join(to_emails)
-            msg['Subject'] = f"ALERT: Possible sighting of {missing_person_name}"
-            
-            # Email body
-            body = f"""
+        """Queue an email alert when a match is found"""
+        subject = f"ALERT: Possible sighting of {missing_person_name}"
+
+        # Email body
+        body = f"""
             MISSING PERSON ALERT
-            
+
             A possible match has been found for: {missing_person_name}
-            
+
             Details:
             - Confidence Score: {confidence_score:.2%}
             - Location: {location}
             - Time: {timestamp}
-            
+
             Please verify this match as soon as possible.
-            
+
             This is an automated alert from the Missing Person Detection System.
             """
-            
-            msg.attach(MIMEText(body, 'plain'))
-            
-            # Attach matched image if available
-            if matched_image_path and os.path.exists(matched_image_path):
-                with open(matched_image_path, 'rb') as f:
-                    img_data = f.read()
-                    image = MIMEImage(img_data)
-                    image.add_header('Content-Disposition', 'attachment', filename='matched_face.jpg')
-                    msg.attach(image)
-            
-            # Send email
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()
-            server.login(self.username, self.password)
-            text = msg.as_string()
-            server.sendmail(self.from_email, to_emails, text)
-            server.quit()
-            
-            return True
-            
-        except Exception as e:
-            print(f"Error sending email: {e}")
-            return False
-    
+
+        attachments = [(matched_image_path, 'matched_face.jpg')] if matched_image_path else None
+        return self.queue_email(to_emails, subject, body, attachments)
+
+    def send_match_digest(
+        self,
+        to_emails: List[str],
+        missing_person_name: str,
+        match_count: int,
+        top_matches: List[dict],
+        location_summary: List[str],
+        period: str
+    ) -> bool:
+        """Queue one email summarising several matches of a case"""
+        subject = f"ALERT: {match_count} possible sightings of {missing_person_name}"
+
+        best_lines = "\n".join(
+            f"            - {match['confidence_score']:.2%} at {match['location']} ({match['seen_at']})"
+            for match in top_matches
+        )
+        location_lines = "\n".join(f"            - {line}" for line in location_summary)
+
+        body = f"""
+            MISSING PERSON ALERT DIGEST
+
+            {match_count} possible matches have been found for: {missing_person_name}
+            Period: {period}
+
+            Best matches (face images attached):
+{best_lines}
+
+            Locations:
+{location_lines}
+
+            Please verify these matches as soon as possible.
+
+            This is an automated alert from the Missing Person Detection System.
+            """
+
+        attachments = [
+            (match['face_path'], f"matched_face_{rank}.jpg")
+            for rank, match in enumerate(top_matches, start=1)
+            if match['face_path']
+        ]
+        return self.queue_email(to_emails, subject, body, attachments)
+
     def send_case_created_notification(
         self,
         to_email: str,
         missing_person_name: str,
         case_id: int
     ) -> bool:
-        """Send notification when a new case is created"""
-        try:
-            msg = MIMEMultipart()
-            msg['From'] = self.from_email
-            msg['To'] = to_email
-            msg['Subject'] = f"Missing Person Case Created: {missing_person_name}"
-            
-            body = f"""
+        """Queue a notification when a new case is created"""
+        subject = f"Missing Person Case Created: {missing_person_name}"
+
+        body = f"""
             Missing Person Case Created
-            
+
             A new missing person case has been created:
-            
+
             Name: {missing_person_name}
             Case ID: {case_id}
-            
+
             The system will now monitor for potential matches and send alerts if any are found.
-            
+
             Thank you for using the Missing Person Detection System.
             """
-            
-            msg.attach(MIMEText(body, 'plain'))
-            
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()
-            server.login(self.username, self.password)
-            text = msg.as_string()
-            server.sendmail(self.from_email, [to_email], text)
-            server.quit()
-            
-            return True
-            
-        except Exception as e:
-            print(f"Error sending email: {e}")
-            return False
-    
+
+        return self.queue_email([to_email], subject, body)
+
     def send_person_found_notification(
         self,
         to_emails: List[str],
         missing_person_name: str,
         case_id: int
     ) -> bool:
-        """Send notification when a person is marked as found"""
-        try:
-            msg = MIMEMultipart()
-            msg['From'] = self.from_email
-            msg['To'] = ', '.join(to_emails)
-            msg['Subject'] = f"GOOD NEWS: {missing_person_name} has been found!"
-            
-            body = f"""
+        """Queue a notification when a person is marked as found"""
+        subject = f"GOOD NEWS: {missing_person_name} has been found!"
+
+        body = f"""
             MISSING PERSON FOUND
-            
+
             Great news! {missing_person_name} has been marked as found.
-            
+
             Case ID: {case_id}
             Status: Found
-            
+
             The case has been closed and face matching has been disabled.
-            
+
             Thank you for using the Missing Person Detection System.
             """
-            
-            msg.attach(MIMEText(body, 'plain'))
-            
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()
-            server.login(self.username, self.password)
-            text = msg.as_string()
-            server.sendmail(self.from_email, to_emails, text)
-            server.quit()
-            
+
+        return self.queue_email(to_emails, subject, body)
+
+    def queue_email(
+        self,
+        to_emails: List[str],
+        subject: str,
+        body: str,
+        attachments: Optional[List[Tuple[str, str]]] = None
+    ) -> bool:
+        """Store an email in the outbox for the background sender"""
+        from ..services.email_outbox import email_outbox
+
+        try:
+            email_outbox.enqueue(to_emails, subject, body, attachments)
             return True
-            
         except Exception as e:
-            print(f"Error sending email: {e}")
-            return False
\ No newline at end of file
+            print(f"Error queueing email: {e}")
+            return False
+
+    def build_message(
+        self,
+        to_emails: List[str],
+        subject: str,
+        body: str,
+        attachments: Optional[List[Tuple[str, str]]] = None
+    ) -> MIMEMultipart:
+        msg = MIMEMultipart()
+        msg['From'] = self.from_email
+        msg['To'] = ', '.join(to_emails)
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'plain'))
+
+        # Attach images that are still available
+        for attachment_path, attachment_name in attachments or []:
+            if attachment_path and os.path.exists(attachment_path):
+                with open(attachment_path, 'rb') as f:
+                    image = MIMEImage(f.read())
+                    image.add_header('Content-Disposition', 'attachment', filename=attachment_name)
+                    msg.attach(image)
+
+        return msg
+
+    def connect(self) -> smtplib.SMTP:
+        """Open an SMTP connection, upgraded to TLS and logged in as configured"""
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                server.starttls()
+            if self.username:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        return server
@@ -0,0 +1,88 @@
+import io
+import pickle
+import struct
+from typing import Tuple
+import numpy as np
+
+# Fixed-layout embedding blob:
+#   magic (4s) | version (B) | backend (B) | dtype (B) | reserved (B) | dimension (I)
+# followed by `dimension` little-endian float32 or float16 values.
+EMBEDDING_MAGIC = b"FEMB"
+EMBEDDING_FORMAT_VERSION = 1
+EMBEDDING_HEADER = struct.Struct("<4sBBBBI")
+EMBEDDING_HEADER_SIZE = EMBEDDING_HEADER.size
+
+BACKENDS = {"dlib": 1, "opencv": 2}
+BACKEND_NAMES = {code: name for name, code in BACKENDS.items()}
+
+DTYPES = {"float32": 1, "float16": 2}
+DTYPE_NAMES = {code: name for name, code in DTYPES.items()}
+
+def pack_embedding(encoding: np.ndarray, backend: str, dtype: str = "float32") -> bytes:
+    """Pack a face encoding into the versioned binary format"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported embedding dtype: {dtype}")
+
+    values = np.ascontiguousarray(encoding, dtype=np.dtype(dtype).newbyteorder("<")).ravel()
+    header = EMBEDDING_HEADER.pack(
+        EMBEDDING_MAGIC,
+        EMBEDDING_FORMAT_VERSION,
+        BACKENDS[backend],
+        DTYPES[dtype],
+        0,
+        values.shape[0]
+    )
+    return header + values.tobytes()
+
+def is_packed_embedding(data: bytes) -> bool:
+    """Check whether a stored blob uses the binary format (as opposed to legacy pickle)"""
+    return data is not None and bytes(data[:len(EMBEDDING_MAGIC)]) == EMBEDDING_MAGIC
+
+def read_embedding_header(data: bytes) -> Tuple[int, str, str, int]:
+    """Return (version, backend, dtype, dimension) of a packed embedding"""
+    if len(data) < EMBEDDING_HEADER_SIZE:
+        raise ValueError("Embedding blob is shorter than its header")
+
+    magic, version, backend, dtype, _, dimension = EMBEDDING_HEADER.unpack_from(data)
+    if magic != EMBEDDING_MAGIC:
+        raise ValueError("Embedding blob has an unknown format")
+    if version != EMBEDDING_FORMAT_VERSION:
+        raise ValueError(f"Unsupported embedding format version: {version}")
+    if backend not in BACKEND_NAMES or dtype not in DTYPE_NAMES:
+        raise ValueError("Embedding blob has an unknown backend or dtype")
+
+    return version, BACKEND_NAMES[backend], DTYPE_NAMES[dtype], dimension
+
+def unpack_embedding(data: bytes) -> np.ndarray:
+    """Read a packed embedding as a zero-copy, read-only view of the blob"""
+    _, _, dtype, dimension = read_embedding_header(data)
+    values_dtype = np.dtype(dtype).newbyteorder("<")
+
+    if len(data) != EMBEDDING_HEADER_SIZE + dimension * values_dtype.itemsize:
+        raise ValueError("Embedding blob length does not match its header")
+
+    return np.frombuffer(data, dtype=values_dtype, count=dimension, offset=EMBEDDING_HEADER_SIZE)
+
+class _NumpyUnpickler(pickle.Unpickler):
+    """Unpickler that only resolves the numpy globals a pickled ndarray needs"""
+
+    ALLOWED_GLOBALS = {
+        ("numpy.core.multiarray", "_reconstruct"),
+        ("numpy._core.multiarray", "_reconstruct"),
+        ("numpy", "ndarray"),
+        ("numpy", "dtype"),
+    }
+
+    def find_class(self, module, name):
+        if (module, name) in self.ALLOWED_GLOBALS:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"Refusing to load {module}.{name} from an embedding blob")
+
+def load_legacy_embedding(data: bytes) -> np.ndarray:
+    """Load a legacy pickled embedding, allowing only plain numpy arrays"""
+    encoding = _NumpyUnpickler(io.BytesIO(data)).load()
+    if not isinstance(encoding, np.ndarray):
+        raise ValueError("Legacy embedding blob does not contain an array")
+    return encoding
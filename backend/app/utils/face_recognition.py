@@ -3,25 +3,61 @@ try:
     import face_recognition
     import cv2
     import numpy as np
+    import io
+    import multiprocessing
     import os
-    from typing import List, Tuple, Optional
+    import threading
+    from concurrent.futures import ProcessPoolExecutor
+    from typing import Iterable, List, NamedTuple, Tuple, Optional
     from PIL import Image
-    import pickle
+    from .embedding_format import pack_embedding, unpack_embedding, is_packed_embedding, load_legacy_embedding
+    from .video_sampling import VideoFrameSampler
+    from .face_tracking import FaceTracker
+    from ..services.storage import storage
     FACE_RECOGNITION_AVAILABLE = True
 except ImportError:
     import cv2
     import numpy as np
+    import io
+    import multiprocessing
     import os
-    from typing import List, Tuple, Optional
+    import threading
+    from concurrent.futures import ProcessPoolExecutor
+    from typing import Iterable, List, NamedTuple, Tuple, Optional
     from PIL import Image
-    import pickle
+    from .embedding_format import pack_embedding, unpack_embedding, is_packed_embedding, load_legacy_embedding
+    from .video_sampling import VideoFrameSampler
+    from .face_tracking import FaceTracker
+    from ..services.storage import storage
     FACE_RECOGNITION_AVAILABLE = False
     print("Warning: face_recognition library not available, using OpenCV fallback")
 
+class DetectedFace(NamedTuple):
+    """A face found in a decoded sighting frame"""
+    box: Tuple[int, int, int, int]  # (top, right, bottom, left)
+    encoding: Optional[np.ndarray]
+    crop: np.ndarray  # RGB
+    frame_index: int = 0
+    face_index: int = 0
+    quality: float = 0.0
+    track_length: int = 1  # detections collapsed into this face by the video tracker
+    first_frame: int = 0  # sampled frames spanned by the track
+    last_frame: int = 0
+
 class FaceRecognitionService:
     def __init__(self, threshold: float = 0.6):
         self.threshold = float(os.getenv("FACE_MATCH_THRESHOLD", threshold))
         self.min_face_size = int(os.getenv("MIN_FACE_SIZE", 50))
+        self.backend = "dlib" if FACE_RECOGNITION_AVAILABLE else "opencv"
+        self.embedding_dtype = os.getenv("EMBEDDING_DTYPE", "float32")
+        self.video_sampler = VideoFrameSampler()
+        self.video_workers = int(os.getenv("VIDEO_WORKERS", "0"))
+        self.video_parallel_min_frames = int(os.getenv("VIDEO_PARALLEL_MIN_FRAMES", "32"))
+        self.face_tracking = os.getenv("FACE_TRACKING", "true").lower() in ("1", "true", "yes")
+        self.track_iou_threshold = float(os.getenv("FACE_TRACK_IOU", "0.3"))
+        self.track_max_missed = int(os.getenv("FACE_TRACK_MAX_MISSED", "2"))
+        # Joining tracks must be far stricter than matching a case: a wrong join drops a person
+        self.track_merge_threshold = float(os.getenv("FACE_TRACK_MERGE_THRESHOLD", "0.7"))
         
         if not FACE_RECOGNITION_AVAILABLE:
             # Initialize OpenCV face detector as fallback
@@ -89,122 +125,255 @@ class FaceRecognitionService:
             if w < self.min_face_size or h < self.min_face_size:
                 return None
             
-            # Extract face region and resize to standard size
-            face_roi = gray[y:y+h, x:x+w]
-            face_resized = cv2.resize(face_roi, (100, 100))
-            
-            # Create simple feature vector
-            hist = cv2.calcHist([face_resized], [0], None, [256], [0, 256])
-            features = hist.flatten()
-            
-            # Normalize
-            features = features / (np.linalg.norm(features) + 1e-7)
-            
-            return features
+            # Extract face region and build its feature vector
+            return self._encode_face_opencv(gray[y:y+h, x:x+w])
             
         except Exception as e:
             print(f"Error extracting face encoding with OpenCV: {e}")
             return None
     
-    def extract_faces_from_video(self, video_path: str, output_dir: str) -> List[str]:
-        """Extract faces from video frames and save them"""
-        if FACE_RECOGNITION_AVAILABLE:
-            return self._extract_faces_from_video_dlib(video_path, output_dir)
-        else:
-            return self._extract_faces_from_video_opencv(video_path, output_dir)
+    def extract_faces_from_video(self, video_path: str, sighting_id: int) -> List[str]:
+        """Extract faces from video frames and save them in the sighting's crop directory"""
+        output_dir = storage.sighting_dir(sighting_id)
+        os.makedirs(output_dir, exist_ok=True)
+        saved_faces = []
+        for face in self.detect_and_encode_video(video_path, encode=False):
+            face_path = os.path.join(output_dir, f"face_{face.frame_index}_{face.face_index}.jpg")
+            self.save_face_crop(face, face_path)
+            saved_faces.append(face_path)
+        return saved_faces
+    
+    def detect_and_encode(self, file_path: str, file_type: str) -> List[DetectedFace]:
+        """Decode a sighting once and return every face with its box, encoding and crop"""
+        if file_type == "video":
+            return self.detect_and_encode_video(file_path)
+        return self.detect_and_encode_image(file_path)
     
-    def _extract_faces_from_video_dlib(self, video_path: str, output_dir: str) -> List[str]:
-        """Extract faces using dlib (advanced)"""
+    def detect_and_encode_image(self, image_path: str, encode: bool = True) -> List[DetectedFace]:
+        """Detect and encode all faces in an image, decoding it only once"""
         try:
-            cap = cv2.VideoCapture(video_path)
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            frame_interval = max(1, int(fps))  # Sample 1 frame per second
-            
-            frame_count = 0
-            saved_faces = []
-            
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                
-                if frame_count % frame_interval == 0:
-                    # Convert BGR to RGB
-                    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    
-                    # Find faces
-                    face_locations = face_recognition.face_locations(rgb_frame)
-                    
-                    for i, face_location in enumerate(face_locations):
-                        top, right, bottom, left = face_location
-                        
-                        # Check face size
-                        face_width = right - left
-                        face_height = bottom - top
-                        
-                        if face_width >= self.min_face_size and face_height >= self.min_face_size:
-                            # Extract face
-                            face_image = rgb_frame[top:bottom, left:right]
-                            
-                            # Save face
-                            face_filename = f"face_{frame_count}_{i}.jpg"
-                            face_path = os.path.join(output_dir, face_filename)
-                            
-                            # Convert to PIL and save
-                            pil_image = Image.fromarray(face_image)
-                            pil_image.save(face_path)
-                            saved_faces.append(face_path)
-                
-                frame_count += 1
+            image = cv2.imread(image_path)
+            if image is None:
+                return []
             
-            cap.release()
-            return saved_faces
+            return self.detect_faces_in_frame(image, encode=encode)
             
         except Exception as e:
-            print(f"Error extracting faces from video with dlib: {e}")
+            print(f"Error processing sighting image: {e}")
             return []
     
-    def _extract_faces_from_video_opencv(self, video_path: str, output_dir: str) -> List[str]:
-        """Extract faces using OpenCV (fallback)"""
+    def detect_and_encode_video(
+        self,
+        video_path: str,
+        encode: bool = True,
+        sampler: Optional[VideoFrameSampler] = None,
+        parallel: Optional[bool] = None
+    ) -> List[DetectedFace]:
+        """Detect and encode faces in sampled video frames, decoding only the sampled frames.
+        
+        With VIDEO_WORKERS > 1, long videos are split into time segments that are
+        decoded and analysed in a process pool (parallel=None picks this automatically).
+        """
         try:
-            cap = cv2.VideoCapture(video_path)
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            frame_interval = max(1, int(fps))
+            sampler = sampler or self.video_sampler
             
-            frame_count = 0
-            saved_faces = []
+            if parallel is not False and self.video_workers > 1:
+                frame_indices = sampler.plan_video(video_path)
+                if frame_indices and (parallel or len(frame_indices) >= self.video_parallel_min_frames):
+                    return self._detect_and_encode_video_parallel(video_path, frame_indices, encode, sampler)
             
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                
-                if frame_count % frame_interval == 0:
-                    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                    
-                    if self.face_cascade is not None:
-                        faces = self.face_cascade.detectMultiScale(gray, 1.1, 4)
-                        
-                        for i, (x, y, w, h) in enumerate(faces):
-                            if w >= self.min_face_size and h >= self.min_face_size:
-                                # Extract face
-                                face_image = frame[y:y+h, x:x+w]
-                                
-                                # Save face
-                                face_filename = f"face_{frame_count}_{i}.jpg"
-                                face_path = os.path.join(output_dir, face_filename)
-                                cv2.imwrite(face_path, face_image)
-                                saved_faces.append(face_path)
-                
-                frame_count += 1
-            
-            cap.release()
-            return saved_faces
+            detected_faces = self.analyse_video_frames(sampler.iter_frames(video_path), encode)
+            return self._merge_tracks(detected_faces)
             
         except Exception as e:
-            print(f"Error extracting faces from video with OpenCV: {e}")
+            print(f"Error extracting faces from video: {e}")
             return []
     
+    def analyse_video_frames(self, frames: Iterable[Tuple[int, np.ndarray]], encode: bool = True) -> List[DetectedFace]:
+        """Detect faces in (frame_index, frame) pairs, collapsing each tracked face to one representative"""
+        if not self.face_tracking:
+            detected_faces = []
+            for frame_index, frame in frames:
+                detected_faces.extend(self.detect_faces_in_frame(frame, frame_index, encode))
+            return detected_faces
+        
+        # Track on boxes alone, then encode only the best detection of each track
+        tracker = FaceTracker(self.track_iou_threshold, self.track_max_missed)
+        for frame_index, frame in frames:
+            tracker.update(self.detect_faces_in_frame(frame, frame_index, encode=False))
+        
+        representatives = tracker.representatives()
+        if encode:
+            representatives = [face._replace(encoding=self.encode_face_crop(face)) for face in representatives]
+        return representatives
+    
+    def _merge_tracks(self, detected_faces: List[DetectedFace]) -> List[DetectedFace]:
+        """Merge tracks of the same person that do not overlap in time (e.g. someone leaving and returning).
+
+        Each track joins the first group whose founding track it matches at
+        `track_merge_threshold` and none of whose tracks it overlaps, so
+        similar-looking people are never chained together. The OpenCV
+        embeddings do not separate people well enough, so tracks are only
+        merged with the dlib backend.
+        """
+        if not self.face_tracking or self.backend != "dlib" or len(detected_faces) < 2:
+            return detected_faces
+        
+        encoded = [face for face in detected_faces if face.encoding is not None]
+        if len(encoded) < 2:
+            return detected_faces
+        
+        encoded.sort(key=lambda face: (face.first_frame, face.face_index))
+        encodings = np.stack([face.encoding for face in encoded])
+        similarity = self.compare_faces_matrix(encodings, encodings)
+        
+        groups: List[List[int]] = []
+        for i, face in enumerate(encoded):
+            for group in groups:
+                overlaps = any(
+                    face.first_frame <= encoded[j].last_frame and encoded[j].first_frame <= face.last_frame
+                    for j in group
+                )
+                if not overlaps and similarity[i, group[0]] >= self.track_merge_threshold:
+                    group.append(i)
+                    break
+            else:
+                groups.append([i])
+        
+        # Keep the best-quality face of each group
+        merged = []
+        for group in groups:
+            faces = [encoded[j] for j in group]
+            best = max(faces, key=lambda face: face.quality)
+            merged.append(best._replace(
+                track_length=sum(face.track_length for face in faces),
+                first_frame=min(face.first_frame for face in faces),
+                last_frame=max(face.last_frame for face in faces)
+            ))
+        
+        unencoded = [face for face in detected_faces if face.encoding is None]
+        return sorted(merged + unencoded, key=lambda face: (face.frame_index, face.face_index))
+    
+    def _detect_and_encode_video_parallel(
+        self,
+        video_path: str,
+        frame_indices: List[int],
+        encode: bool,
+        sampler: VideoFrameSampler
+    ) -> List[DetectedFace]:
+        """Analyse contiguous segments of the sampled frames in worker processes"""
+        # A few segments per worker keeps the pool busy when segments finish unevenly
+        segment_count = min(len(frame_indices), self.video_workers * 2)
+        segments = [segment.tolist() for segment in np.array_split(np.asarray(frame_indices), segment_count)]
+        
+        pool = _get_video_pool(self.video_workers)
+        results = pool.map(
+            _detect_video_segment,
+            [video_path] * len(segments),
+            segments,
+            [encode] * len(segments),
+            [sampler.seek_threshold] * len(segments)
+        )
+        
+        # map() preserves segment order, so faces come back in frame order
+        detected_faces = []
+        for segment_faces in results:
+            detected_faces.extend(segment_faces)
+        
+        # Tracks are per segment, so join the ones that continue across segment boundaries
+        return self._merge_tracks(detected_faces)
+    
+    def detect_faces_in_frame(self, frame: np.ndarray, frame_index: int = 0, encode: bool = True) -> List[DetectedFace]:
+        """Detect faces in a decoded BGR frame and encode them from the in-memory boxes"""
+        if FACE_RECOGNITION_AVAILABLE:
+            return self._detect_faces_in_frame_dlib(frame, frame_index, encode)
+        else:
+            return self._detect_faces_in_frame_opencv(frame, frame_index, encode)
+    
+    def _detect_faces_in_frame_dlib(self, frame: np.ndarray, frame_index: int, encode: bool) -> List[DetectedFace]:
+        """Detect and encode faces using dlib (advanced)"""
+        # Convert BGR to RGB
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        
+        # Find faces, keeping only those large enough to match reliably
+        face_locations = [
+            (i, location)
+            for i, location in enumerate(face_recognition.face_locations(rgb_frame))
+            if location[1] - location[3] >= self.min_face_size and location[2] - location[0] >= self.min_face_size
+        ]
+        if not face_locations:
+            return []
+        
+        # Encode all faces of the frame in one call, straight from the detected boxes
+        if encode:
+            face_encodings = face_recognition.face_encodings(rgb_frame, [location for _, location in face_locations])
+        else:
+            face_encodings = [None] * len(face_locations)
+        
+        detected_faces = []
+        for (i, (top, right, bottom, left)), face_encoding in zip(face_locations, face_encodings):
+            detected_faces.append(DetectedFace(
+                box=(top, right, bottom, left),
+                encoding=face_encoding,
+                crop=rgb_frame[top:bottom, left:right].copy(),
+                frame_index=frame_index,
+                face_index=i
+            ))
+        
+        return detected_faces
+    
+    def _detect_faces_in_frame_opencv(self, frame: np.ndarray, frame_index: int, encode: bool) -> List[DetectedFace]:
+        """Detect and encode faces using OpenCV (fallback)"""
+        if self.face_cascade is None:
+            return []
+        
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = self.face_cascade.detectMultiScale(gray, 1.1, 4)
+        
+        detected_faces = []
+        for i, (x, y, w, h) in enumerate(faces):
+            if w >= self.min_face_size and h >= self.min_face_size:
+                detected_faces.append(DetectedFace(
+                    box=(int(y), int(x + w), int(y + h), int(x)),
+                    encoding=self._encode_face_opencv(gray[y:y+h, x:x+w]) if encode else None,
+                    crop=cv2.cvtColor(frame[y:y+h, x:x+w], cv2.COLOR_BGR2RGB),
+                    frame_index=frame_index,
+                    face_index=i
+                ))
+        
+        return detected_faces
+    
+    def _encode_face_opencv(self, face_roi: np.ndarray) -> np.ndarray:
+        """Build the histogram feature vector for a grayscale face region"""
+        # Resize to standard size
+        face_resized = cv2.resize(face_roi, (100, 100))
+        
+        # Create simple feature vector
+        hist = cv2.calcHist([face_resized], [0], None, [256], [0, 256])
+        features = hist.flatten()
+        
+        # Normalize
+        return features / (np.linalg.norm(features) + 1e-7)
+    
+    def encode_face_crop(self, face: DetectedFace) -> Optional[np.ndarray]:
+        """Encode a face from its in-memory crop (the crop is the detected box)"""
+        if FACE_RECOGNITION_AVAILABLE:
+            height, width = face.crop.shape[:2]
+            face_encodings = face_recognition.face_encodings(face.crop, [(0, width, height, 0)])
+            return face_encodings[0] if face_encodings else None
+        else:
+            return self._encode_face_opencv(cv2.cvtColor(face.crop, cv2.COLOR_RGB2GRAY))
+    
+    def save_face_crop(self, face: DetectedFace, face_path: str):
+        """Write a detected face crop to disk as an image file"""
+        Image.fromarray(face.crop).save(face_path)
+    
+    def encode_crop_jpeg(self, face: DetectedFace) -> bytes:
+        """JPEG bytes of a detected face crop, for crop packs"""
+        buffer = io.BytesIO()
+        Image.fromarray(face.crop).save(buffer, format="JPEG")
+        return buffer.getvalue()
+    
     def compare_faces(self, known_encoding: np.ndarray, unknown_encoding: np.ndarray) -> float:
         """Compare two face encodings and return similarity score"""
         if FACE_RECOGNITION_AVAILABLE:
@@ -249,90 +418,145 @@ class FaceRecognitionService:
             print(f"Error comparing faces with OpenCV: {e}")
             return 0.0
     
+    def compare_faces_many(self, known_encodings: np.ndarray, unknown_encoding: np.ndarray) -> np.ndarray:
+        """Compare one face encoding against a matrix of known encodings (one row per face)"""
+        known_encodings = np.asarray(known_encodings, dtype=np.float32)
+        unknown_encoding = np.asarray(unknown_encoding, dtype=np.float32)
+
+        if known_encodings.shape[0] == 0:
+            return np.empty(0, dtype=np.float32)
+
+        if FACE_RECOGNITION_AVAILABLE:
+            # Same metric as face_recognition.face_distance, for all rows at once
+            face_distances = np.linalg.norm(known_encodings - unknown_encoding, axis=1)
+            return 1 - face_distances
+
+        # Cosine similarity mapped to 0-1 range, zero-norm rows score 0
+        norms = np.linalg.norm(known_encodings, axis=1) * np.linalg.norm(unknown_encoding)
+        dot_products = known_encodings @ unknown_encoding
+        similarity = np.divide(dot_products, norms, out=np.full_like(dot_products, -1.0), where=norms > 0)
+        return (similarity + 1) / 2
+
+    def compare_faces_matrix(self, known_encodings: np.ndarray, unknown_encodings: np.ndarray) -> np.ndarray:
+        """Compare many face encodings against many known encodings, returns a faces x known score matrix"""
+        known_encodings = np.asarray(known_encodings, dtype=np.float32)
+        unknown_encodings = np.atleast_2d(np.asarray(unknown_encodings, dtype=np.float32))
+
+        if known_encodings.shape[0] == 0 or unknown_encodings.shape[0] == 0:
+            return np.empty((unknown_encodings.shape[0], known_encodings.shape[0]), dtype=np.float32)
+
+        if FACE_RECOGNITION_AVAILABLE:
+            # ||a - b||^2 = ||a||^2 + ||b||^2 - 2ab, with the cross term done in one matrix multiply
+            squared_distances = (
+                np.einsum("ij,ij->i", unknown_encodings, unknown_encodings)[:, None]
+                + np.einsum("ij,ij->i", known_encodings, known_encodings)[None, :]
+                - 2 * (unknown_encodings @ known_encodings.T)
+            )
+            return 1 - np.sqrt(np.maximum(squared_distances, 0))
+
+        # Cosine similarity on row-normalised encodings, zero-norm rows score 0
+        known_norms = np.linalg.norm(known_encodings, axis=1)
+        unknown_norms = np.linalg.norm(unknown_encodings, axis=1)
+        known_normed = np.divide(known_encodings, known_norms[:, None], out=np.zeros_like(known_encodings), where=known_norms[:, None] > 0)
+        unknown_normed = np.divide(unknown_encodings, unknown_norms[:, None], out=np.zeros_like(unknown_encodings), where=unknown_norms[:, None] > 0)
+        similarity = unknown_normed @ known_normed.T
+        similarity[unknown_norms == 0, :] = -1
+        similarity[:, known_norms == 0] = -1
+        return (similarity + 1) / 2
+
+    def match_faces_batch(
+        self,
+        face_encodings: np.ndarray,
+        known_encodings: np.ndarray,
+        known_ids: np.ndarray,
+        top_k: int = 5,
+        known_mask: Optional[np.ndarray] = None
+    ) -> Tuple[List[List[Tuple[int, float]]], List[Tuple[int, int, float]]]:
+        """Match every face of a sighting against all known encodings in one call.
+
+        Returns the top-k (known_id, score) pairs per face and every
+        (face_index, known_id, score) pair above the match threshold.
+        Known rows where `known_mask` is False are ignored.
+        """
+        scores = self.compare_faces_matrix(known_encodings, face_encodings)
+        known_ids = np.asarray(known_ids)
+        if known_mask is not None:
+            scores[:, ~np.asarray(known_mask, dtype=bool)] = -np.inf
+
+        top_matches = []
+        if scores.shape[1] > 0:
+            k = min(top_k, scores.shape[1])
+            top_columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for face_index, columns in enumerate(top_columns):
+                columns = columns[np.argsort(-scores[face_index, columns])]
+                top_matches.append([
+                    (int(known_ids[c]), float(scores[face_index, c]))
+                    for c in columns
+                    if np.isfinite(scores[face_index, c])
+                ])
+        else:
+            top_matches = [[] for _ in range(scores.shape[0])]
+
+        face_indices, columns = np.nonzero(scores >= self.threshold)
+        matched_pairs = [
+            (int(face_index), int(known_ids[column]), float(scores[face_index, column]))
+            for face_index, column in zip(face_indices, columns)
+        ]
+
+        return top_matches, matched_pairs
+
     def is_match(self, similarity_score: float) -> bool:
         """Determine if similarity score indicates a match"""
         return similarity_score >= self.threshold
     
     def serialize_encoding(self, encoding: np.ndarray) -> bytes:
-        """Serialize face encoding for database storage"""
-        return pickle.dumps(encoding)
+        """Serialize face encoding for database storage (versioned binary format)"""
+        return pack_embedding(encoding, self.backend, self.embedding_dtype)
     
     def deserialize_encoding(self, encoded_data: bytes) -> np.ndarray:
         """Deserialize face encoding from database"""
-        return pickle.loads(encoded_data)
-    
-    def process_sighting_image(self, image_path: str, output_dir: str) -> List[str]:
-        """Process a sighting image and extract all faces"""
-        if FACE_RECOGNITION_AVAILABLE:
-            return self._process_sighting_image_dlib(image_path, output_dir)
-        else:
-            return self._process_sighting_image_opencv(image_path, output_dir)
+        if is_packed_embedding(encoded_data):
+            return unpack_embedding(encoded_data)
+        # Rows written before the binary format, see app.scripts.migrate_embeddings
+        return load_legacy_embedding(encoded_data)
     
-    def _process_sighting_image_dlib(self, image_path: str, output_dir: str) -> List[str]:
-        """Process sighting using dlib (advanced)"""
-        try:
-            # Load image
-            image = face_recognition.load_image_file(image_path)
-            
-            # Find face locations
-            face_locations = face_recognition.face_locations(image)
-            
-            saved_faces = []
-            
-            for i, face_location in enumerate(face_locations):
-                top, right, bottom, left = face_location
-                
-                # Check face size
-                face_width = right - left
-                face_height = bottom - top
-                
-                if face_width >= self.min_face_size and face_height >= self.min_face_size:
-                    # Extract face
-                    face_image = image[top:bottom, left:right]
-                    
-                    # Save face
-                    face_filename = f"sighting_face_{i}.jpg"
-                    face_path = os.path.join(output_dir, face_filename)
-                    
-                    # Convert to PIL and save
-                    pil_image = Image.fromarray(face_image)
-                    pil_image.save(face_path)
-                    saved_faces.append(face_path)
-            
-            return saved_faces
-            
-        except Exception as e:
-            print(f"Error processing sighting image with dlib: {e}")
-            return []
+    def process_sighting_image(self, image_path: str, sighting_id: int) -> List[str]:
+        """Process a sighting image and extract all faces into the sighting's crop directory"""
+        output_dir = storage.sighting_dir(sighting_id)
+        os.makedirs(output_dir, exist_ok=True)
+        saved_faces = []
+        for face in self.detect_and_encode_image(image_path, encode=False):
+            face_path = os.path.join(output_dir, f"sighting_face_{face.face_index}.jpg")
+            self.save_face_crop(face, face_path)
+            saved_faces.append(face_path)
+        return saved_faces
+
+# Process pool for segmented video analysis, created on first use
+_video_pool = None
+_video_pool_lock = threading.Lock()
+_worker_face_service = None
+
+def _get_video_pool(workers: int) -> ProcessPoolExecutor:
+    global _video_pool
+    with _video_pool_lock:
+        if _video_pool is None:
+            # Never fork the threaded API or sighting worker process
+            _video_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_video_worker
+            )
+        return _video_pool
+
+def _init_video_worker():
+    # Each worker owns one core, so keep OpenCV from spawning its own threads
+    cv2.setNumThreads(1)
+
+def _detect_video_segment(video_path: str, frame_indices: List[int], encode: bool, seek_threshold: int) -> List[DetectedFace]:
+    """Worker entry point: open the video, seek to the segment and analyse its frames"""
+    global _worker_face_service
+    if _worker_face_service is None:
+        _worker_face_service = FaceRecognitionService()
     
-    def _process_sighting_image_opencv(self, image_path: str, output_dir: str) -> List[str]:
-        """Process sighting using OpenCV (fallback)"""
-        try:
-            image = cv2.imread(image_path)
-            if image is None:
-                return []
-            
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            if self.face_cascade is None:
-                return []
-            
-            faces = self.face_cascade.detectMultiScale(gray, 1.1, 4)
-            saved_faces = []
-            
-            for i, (x, y, w, h) in enumerate(faces):
-                if w >= self.min_face_size and h >= self.min_face_size:
-                    # Extract face
-                    face_image = image[y:y+h, x:x+w]
-                    
-                    # Save face
-                    face_filename = f"sighting_face_{i}.jpg"
-                    face_path = os.path.join(output_dir, face_filename)
-                    cv2.imwrite(face_path, face_image)
-                    saved_faces.append(face_path)
-            
-            return saved_faces
-            
-        except Exception as e:
-            print(f"Error processing sighting image with OpenCV: {e}")
-            return []
\ No newline at end of file
+    sampler = VideoFrameSampler(seek_threshold=seek_threshold)
+    return _worker_face_service.analyse_video_frames(sampler.iter_frame_indices(video_path, frame_indices), encode)
\ No newline at end of file
@@ -3,7 +3,9 @@ import numpy as np
 import os
 from typing import List, Tuple, Optional
 from PIL import Image
-import pickle
+from .embedding_format import pack_embedding, unpack_embedding, is_packed_embedding, load_legacy_embedding
+from .video_sampling import VideoFrameSampler
+from ..services.storage import storage
 
 class SimpleFaceRecognitionService:
     """Fallback face recognition service using OpenCV when dlib is not available"""
@@ -11,6 +13,9 @@ class SimpleFaceRecognitionService:
     def __init__(self, threshold: float = 0.6):
         self.threshold = float(os.getenv("FACE_MATCH_THRESHOLD", threshold))
         self.min_face_size = int(os.getenv("MIN_FACE_SIZE", 50))
+        self.backend = "opencv"
+        self.embedding_dtype = os.getenv("EMBEDDING_DTYPE", "float32")
+        self.video_sampler = VideoFrameSampler()
         
         # Load OpenCV face detector
         try:
@@ -67,41 +72,31 @@ class SimpleFaceRecognitionService:
             print(f"Error extracting face encoding: {e}")
             return None
     
-    def extract_faces_from_video(self, video_path: str, output_dir: str) -> List[str]:
+    def extract_faces_from_video(self, video_path: str, sighting_id: int) -> List[str]:
         """Extract faces from video frames"""
         try:
-            cap = cv2.VideoCapture(video_path)
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            frame_interval = max(1, int(fps))  # Sample 1 frame per second
-            
-            frame_count = 0
+            output_dir = storage.sighting_dir(sighting_id)
+            os.makedirs(output_dir, exist_ok=True)
             saved_faces = []
             
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
+            # Only sampled frames are decoded, skipped ones are grabbed
+            for frame_count, frame in self.video_sampler.iter_frames(video_path):
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
                 
-                if frame_count % frame_interval == 0:
-                    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                if self.face_cascade is not None:
+                    faces = self.face_cascade.detectMultiScale(gray, 1.1, 4)
                     
-                    if self.face_cascade is not None:
-                        faces = self.face_cascade.detectMultiScale(gray, 1.1, 4)
-                        
-                        for i, (x, y, w, h) in enumerate(faces):
-                            if w >= self.min_face_size and h >= self.min_face_size:
-                                # Extract face
-                                face_image = frame[y:y+h, x:x+w]
-                                
-                                # Save face
-                                face_filename = f"face_{frame_count}_{i}.jpg"
-                                face_path = os.path.join(output_dir, face_filename)
-                                cv2.imwrite(face_path, face_image)
-                                saved_faces.append(face_path)
-                
-                frame_count += 1
+                    for i, (x, y, w, h) in enumerate(faces):
+                        if w >= self.min_face_size and h >= self.min_face_size:
+                            # Extract face
+                            face_image = frame[y:y+h, x:x+w]
+                            
+                            # Save face
+                            face_filename = f"face_{frame_count}_{i}.jpg"
+                            face_path = os.path.join(output_dir, face_filename)
+                            cv2.imwrite(face_path, face_image)
+                            saved_faces.append(face_path)
             
-            cap.release()
             return saved_faces
             
         except Exception as e:
@@ -135,16 +130,20 @@ class SimpleFaceRecognitionService:
         return similarity_score >= self.threshold
     
     def serialize_encoding(self, encoding: np.ndarray) -> bytes:
-        """Serialize face encoding for database storage"""
-        return pickle.dumps(encoding)
+        """Serialize face encoding for database storage (versioned binary format)"""
+        return pack_embedding(encoding, self.backend, self.embedding_dtype)
     
     def deserialize_encoding(self, encoded_data: bytes) -> np.ndarray:
         """Deserialize face encoding from database"""
-        return pickle.loads(encoded_data)
+        if is_packed_embedding(encoded_data):
+            return unpack_embedding(encoded_data)
+        return load_legacy_embedding(encoded_data)
     
-    def process_sighting_image(self, image_path: str, output_dir: str) -> List[str]:
+    def process_sighting_image(self, image_path: str, sighting_id: int) -> List[str]:
         """Process a sighting image and extract all faces"""
         try:
+            output_dir = storage.sighting_dir(sighting_id)
+            os.makedirs(output_dir, exist_ok=True)
             image = cv2.imread(image_path)
             if image is None:
                 return []
@@ -0,0 +1,105 @@
+import cv2
+import numpy as np
+from typing import List, Tuple
+
+def box_iou(box_a: Tuple[int, int, int, int], box_b: Tuple[int, int, int, int]) -> float:
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top = max(box_a[0], box_b[0])
+    right = min(box_a[1], box_b[1])
+    bottom = min(box_a[2], box_b[2])
+    left = max(box_a[3], box_b[3])
+
+    intersection = max(0, right - left) * max(0, bottom - top)
+    if intersection == 0:
+        return 0.0
+
+    area_a = (box_a[1] - box_a[3]) * (box_a[2] - box_a[0])
+    area_b = (box_b[1] - box_b[3]) * (box_b[2] - box_b[0])
+    return intersection / float(area_a + area_b - intersection)
+
+def face_quality(crop: np.ndarray) -> float:
+    """Score a face crop by size and sharpness (variance of the Laplacian)"""
+    if crop.size == 0:
+        return 0.0
+    gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY) if crop.ndim == 3 else crop
+    sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
+    return float(gray.shape[0] * gray.shape[1] * (1.0 + sharpness))
+
+class FaceTrack:
+    """Detections of one face across consecutive sampled frames"""
+
+    def __init__(self, face, quality: float):
+        self.box = face.box
+        self.best = face._replace(quality=quality, track_length=1)
+        self.length = 1
+        self.missed = 0
+        self.first_frame = face.frame_index
+        self.last_frame = face.frame_index
+
+    def add(self, face, quality: float):
+        self.box = face.box
+        self.length += 1
+        self.missed = 0
+        self.last_frame = face.frame_index
+        if quality > self.best.quality:
+            self.best = face._replace(quality=quality)
+
+    def representative(self):
+        return self.best._replace(track_length=self.length, first_frame=self.first_frame, last_frame=self.last_frame)
+
+class FaceTracker:
+    """Greedy IoU tracker over the sampled frames of a video.
+
+    Each sampled frame's detections are linked to the live track whose last
+    box overlaps them most (at least `iou_threshold`). A track ends after
+    `max_missed` sampled frames without a detection. Only the best-quality
+    detection of each track is kept as its representative.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_missed: int = 2):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self._active: List[FaceTrack] = []
+        self._finished: List[FaceTrack] = []
+
+    def update(self, faces: list):
+        """Feed the detections of the next sampled frame"""
+        pairs = sorted(
+            (
+                (box_iou(track.box, face.box), track_index, face_index)
+                for track_index, track in enumerate(self._active)
+                for face_index, face in enumerate(faces)
+            ),
+            reverse=True
+        )
+
+        matched_tracks = set()
+        matched_faces = set()
+        for iou, track_index, face_index in pairs:
+            if iou < self.iou_threshold:
+                break
+            if track_index in matched_tracks or face_index in matched_faces:
+                continue
+            face = faces[face_index]
+            self._active[track_index].add(face, face_quality(face.crop))
+            matched_tracks.add(track_index)
+            matched_faces.add(face_index)
+
+        still_active = []
+        for track_index, track in enumerate(self._active):
+            if track_index not in matched_tracks:
+                track.missed += 1
+            if track.missed > self.max_missed:
+                self._finished.append(track)
+            else:
+                still_active.append(track)
+        self._active = still_active
+
+        for face_index, face in enumerate(faces):
+            if face_index not in matched_faces:
+                self._active.append(FaceTrack(face, face_quality(face.crop)))
+
+    def representatives(self) -> list:
+        """Best detection of every track, in order of appearance"""
+        tracks = self._finished + self._active
+        return sorted((track.representative() for track in tracks), key=lambda face: (face.frame_index, face.face_index))
@@ -0,0 +1,69 @@
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional
+from fastapi import HTTPException, Response, status
+from sqlalchemy import Select, String, and_, or_, type_coerce
+from sqlalchemy.ext.asyncio import AsyncSession
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(value: str, row_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value, row_id]).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(value), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+async def paginate(
+    db: AsyncSession,
+    stmt: Select,
+    sort_column,
+    id_column,
+    cursor: Optional[str],
+    limit: int,
+    response: Response
+) -> List:
+    """Return one page of `stmt`, newest first, using keyset pagination on (sort_column, id).
+
+    The cursor for the next page is sent in the X-Next-Cursor header and is
+    absent on the last page. A select of a single entity returns the
+    entities, a column projection returns its rows.
+    """
+    # SQLite stores timestamps as text, compare with the stored text so equal times match exactly
+    sqlite = db.bind.dialect.name == "sqlite"
+    key = type_coerce(sort_column, String) if sqlite else sort_column
+
+    if cursor:
+        value, last_id = decode_cursor(cursor)
+        if not sqlite:
+            try:
+                value = datetime.fromisoformat(value)
+            except ValueError:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid cursor"
+                )
+        stmt = stmt.where(or_(key < value, and_(key == value, id_column < last_id)))
+
+    single = len(stmt.column_descriptions) == 1
+    result = await db.execute(stmt.add_columns(
+        key.label("cursor_key"),
+        id_column.label("cursor_id")
+    ).order_by(sort_column.desc(), id_column.desc()).limit(limit + 1))
+    rows = result.all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        value = rows[-1].cursor_key
+        if not sqlite:
+            value = value.isoformat()
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(value, rows[-1].cursor_id)
+
+    return [row[0] for row in rows] if single else rows
@@ -0,0 +1,137 @@
+import cv2
+import os
+import numpy as np
+from typing import Iterator, List, Optional, Tuple
+
+class VideoFrameSampler:
+    """Decode only the video frames that will actually be analysed.
+
+    Skipped frames are advanced with `grab()`, which demuxes but does not
+    decode or colour-convert them. When the gap to the next sampled frame is
+    longer than `seek_threshold` frames the reader seeks instead, which lets
+    the container jump straight to the nearest keyframe on long files.
+
+    Sampling is controlled by:
+      - sample_fps: frames analysed per second of video
+      - max_frames: cap on analysed frames, spread evenly over the video (0 = no cap)
+      - time_windows: optional (start, end) ranges in seconds to restrict sampling to
+    """
+
+    def __init__(
+        self,
+        sample_fps: Optional[float] = None,
+        max_frames: Optional[int] = None,
+        seek_threshold: Optional[int] = None,
+        time_windows: Optional[List[Tuple[float, float]]] = None
+    ):
+        self.sample_fps = sample_fps if sample_fps is not None else float(os.getenv("VIDEO_SAMPLE_FPS", "1"))
+        self.max_frames = max_frames if max_frames is not None else int(os.getenv("VIDEO_MAX_FRAMES", "0"))
+        self.seek_threshold = seek_threshold if seek_threshold is not None else int(os.getenv("VIDEO_SEEK_THRESHOLD_FRAMES", "300"))
+        self.time_windows = time_windows if time_windows is not None else parse_time_windows(os.getenv("VIDEO_TIME_WINDOWS", ""))
+
+    def plan(self, fps: float, frame_count: int) -> List[int]:
+        """Return the indices of the frames to analyse for a video of known length"""
+        interval = self._interval(fps)
+        indices = [i for i in range(0, frame_count, interval) if self._in_windows(i, fps)]
+
+        if self.max_frames and len(indices) > self.max_frames:
+            # Keep coverage of the whole video instead of only its beginning
+            positions = np.linspace(0, len(indices) - 1, self.max_frames).round().astype(int)
+            indices = [indices[p] for p in np.unique(positions)]
+
+        return indices
+
+    def plan_video(self, video_path: str) -> Optional[List[int]]:
+        """Plan the sampled frames of a video file, or None if its length is unknown"""
+        cap = cv2.VideoCapture(video_path)
+        try:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        finally:
+            cap.release()
+
+        if frame_count <= 0:
+            return None
+        return self.plan(fps, frame_count)
+
+    def iter_frame_indices(self, video_path: str, indices: List[int]) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield (frame_index, BGR frame) for an explicit, ascending list of frame indices"""
+        cap = cv2.VideoCapture(video_path)
+        try:
+            yield from self._iter_planned(cap, indices)
+        finally:
+            cap.release()
+
+    def iter_frames(self, video_path: str) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield (frame_index, BGR frame) for every sampled frame of a video"""
+        cap = cv2.VideoCapture(video_path)
+        try:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+            if frame_count > 0:
+                yield from self._iter_planned(cap, self.plan(fps, frame_count))
+            else:
+                yield from self._iter_stream(cap, fps)
+        finally:
+            cap.release()
+
+    def _iter_planned(self, cap: cv2.VideoCapture, indices: List[int]) -> Iterator[Tuple[int, np.ndarray]]:
+        position = 0
+        for index in indices:
+            gap = index - position
+            if gap > self.seek_threshold:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            else:
+                # Advance without decoding the frames in between
+                for _ in range(gap):
+                    if not cap.grab():
+                        return
+
+            ret, frame = cap.read()
+            if not ret:
+                return
+            position = index + 1
+            yield index, frame
+
+    def _iter_stream(self, cap: cv2.VideoCapture, fps: float) -> Iterator[Tuple[int, np.ndarray]]:
+        """Fallback for containers that do not report a frame count"""
+        interval = self._interval(fps)
+        index = 0
+        sampled = 0
+
+        while not self.max_frames or sampled < self.max_frames:
+            if index % interval == 0 and self._in_windows(index, fps):
+                ret, frame = cap.read()
+                if not ret:
+                    return
+                sampled += 1
+                yield index, frame
+            elif not cap.grab():
+                return
+            index += 1
+
+    def _interval(self, fps: float) -> int:
+        if not fps or fps <= 0 or self.sample_fps <= 0:
+            return 1
+        return max(1, int(fps / self.sample_fps))
+
+    def _in_windows(self, index: int, fps: float) -> bool:
+        if not self.time_windows or not fps or fps <= 0:
+            return True
+        seconds = index / fps
+        return any(start <= seconds < end for start, end in self.time_windows)
+
+def parse_time_windows(value: str) -> List[Tuple[float, float]]:
+    """Parse windows like "0-30,120-180" (seconds) into (start, end) pairs"""
+    windows = []
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            start, end = part.split("-", 1)
+            windows.append((float(start), float(end)))
+        except ValueError:
+            print(f"Ignoring invalid video time window: {part}")
+    return windows
@@ -0,0 +1,70 @@
+"""Standalone sighting processing worker.
+
+Claims jobs from the `processing_jobs` table and processes them, so ingest
+can be scaled independently of the API. Run one or more of these next to an
+API started with SIGHTING_DISPATCH=worker:
+
+    python -m app.worker [--poll-interval 2] [--once]
+"""
+import argparse
+import os
+import signal
+import socket
+import threading
+from .models.database import SessionLocal, engine
+from .models.schema import upgrade_schema
+from .services.background_tasks import BackgroundTaskService
+from .services.case_index import case_index
+from .services.job_queue import job_queue
+from .services.email_outbox import email_outbox
+from .services.alert_coalescer import alert_coalescer
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued sightings")
+    parser.add_argument("--poll-interval", type=float, default=float(os.getenv("JOB_POLL_INTERVAL", "2")),
+                        help="Seconds to wait when the queue is empty")
+    parser.add_argument("--once", action="store_true", help="Exit once the queue is empty")
+    args = parser.parse_args()
+
+    upgrade_schema(engine)
+
+    worker_id = f"worker-{socket.gethostname()}-{os.getpid()}"
+    service = BackgroundTaskService()
+
+    db = SessionLocal()
+    try:
+        case_index.ensure_loaded(db)
+    finally:
+        db.close()
+
+    # Finish the current job on SIGTERM/SIGINT instead of abandoning its lease
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+
+    # Match alerts raised here are delivered from the outbox by this process too
+    email_outbox.start()
+    alert_coalescer.start()
+    
+    print(f"Sighting worker {worker_id} started")
+    processed = 0
+    while not stop.is_set():
+        try:
+            found = job_queue.run_next(worker_id, service.process_sighting)
+        except Exception as e:
+            print(f"Error claiming processing job: {e}")
+            found = False
+
+        if found:
+            processed += 1
+        elif args.once:
+            break
+        else:
+            stop.wait(args.poll_interval)
+
+    alert_coalescer.stop()
+    email_outbox.stop()
+    print(f"Sighting worker {worker_id} stopped after {processed} jobs")
+
+if __name__ == "__main__":
+    main()
@@ -6,15 +6,21 @@ import os
 from dotenv import load_dotenv
 
 from app.routes import auth, cases, sightings, admin
-from app.models.database import engine, Base, SessionLocal
+from app.models.database import engine, async_engine, SessionLocal
+from app.models.schema import upgrade_schema
 from app.models.models import User
 from app.utils.auth import get_password_hash
+from app.services.processing_executor import processing_executor
+from app.services.enrolment_executor import enrolment_executor
+from app.services.job_queue import job_queue
+from app.services.email_outbox import email_outbox
+from app.services.alert_coalescer import alert_coalescer
 
 # Load environment variables
 load_dotenv()
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Create database tables, and columns and indexes added since they were created
+upgrade_schema(engine)
 
 # Create default admin user
 def create_default_admin():
@@ -77,6 +83,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Retry-After"],
 )
 
 # Mount static files
@@ -88,6 +95,35 @@ app.include_router(cases.router, prefix="/cases", tags=["Cases"])
 app.include_router(sightings.router, prefix="/sightings", tags=["Sightings"])
 app.include_router(admin.router, prefix="/admin", tags=["Admin"])
 
+@app.on_event("startup")
+def recover_processing_jobs():
+    # Pick up sightings a previous process never finished
+    db = SessionLocal()
+    try:
+        recovered = job_queue.recover(db)
+        if recovered:
+            print(f"Re-queued {recovered} unfinished sightings")
+    except Exception as e:
+        print(f"Error recovering processing jobs: {e}")
+    finally:
+        db.close()
+    job_queue.start_dispatcher()
+    email_outbox.start()
+    alert_coalescer.start()
+
+@app.on_event("shutdown")
+def shutdown_processing_executor():
+    job_queue.stop_dispatcher()
+    alert_coalescer.stop()
+    email_outbox.stop()
+    # Let queued sightings and enrolments finish before the workers go away
+    processing_executor.shutdown(wait=True)
+    enrolment_executor.shutdown(wait=True)
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    await async_engine.dispose()
+
 @app.get("/")
 async def root():
     return {"message": "Missing Person Detection System API"}
@@ -0,0 +1,46 @@
+import asyncio
+import io
+import os
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import Headers
+from app.routes import cases
+from app.services.enrolment_executor import CaseEnrolmentExecutor
+
+def _photo(content: bytes = b"photo") -> UploadFile:
+    return UploadFile(io.BytesIO(content), filename="p.jpg", headers=Headers({"content-type": "image/jpeg"}))
+
+def _create(photo: UploadFile):
+    return asyncio.run(cases.create_missing_person_case(
+        name="n", address=None, aadhaar_number=None, email=None, phone=None,
+        photo=photo, current_user=SimpleNamespace(id=1), db=None
+    ))
+
+def _stored_files(root):
+    return [name for _, _, names in os.walk(root) for name in names]
+
+def test_full_queue_rejects_before_storing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(cases, "enrolment_executor", CaseEnrolmentExecutor(workers=1, max_queue_depth=0))
+
+    with pytest.raises(HTTPException) as error:
+        _create(_photo())
+    assert error.value.status_code == 503
+    assert _stored_files(tmp_path) == []
+
+def test_rejected_enrolment_removes_stored_photo(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    executor = CaseEnrolmentExecutor(workers=1, max_queue_depth=1)
+    monkeypatch.setattr(cases, "enrolment_executor", executor)
+
+    # The queue fills up while the photo is being stored
+    async def fill_then_run(fn, *args):
+        executor.max_queue_depth = 0
+        return await CaseEnrolmentExecutor.run(executor, fn, *args)
+    monkeypatch.setattr(executor, "run", fill_then_run)
+
+    with pytest.raises(HTTPException) as error:
+        _create(_photo())
+    assert error.value.status_code == 503
+    assert _stored_files(tmp_path) == []
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models.database import Base
+from app.models.models import MissingPersonCase
+from app.services.embedding_store import SharedEmbeddingStore
+
+def unit(seed):
+    vector = np.random.default_rng(seed).standard_normal(128).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cases.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+def add_case(db, store, case_id, seed):
+    db.add(MissingPersonCase(
+        id=case_id,
+        name=f"case {case_id}",
+        photo_path="photo.jpg",
+        face_embedding=store.face_service.serialize_encoding(unit(seed))
+    ))
+    db.commit()
+
+def test_store_picks_up_cases_changed_behind_its_back(db, tmp_path):
+    store = SharedEmbeddingStore(str(tmp_path / "store"))
+    add_case(db, store, 1, 1)
+    add_case(db, store, 2, 2)
+    store.ensure_loaded(db)
+    assert len(store) == 2
+
+    # Written while no process kept the store in sync
+    add_case(db, store, 3, 3)
+    db.query(MissingPersonCase).filter(MissingPersonCase.id == 1).update({MissingPersonCase.is_found: True})
+    db.commit()
+
+    case_ids, scores = store.search(db, unit(3))
+    assert sorted(case_ids.tolist()) == [2, 3]
+    assert case_ids[np.argmax(scores)] == 3
+
+    # A new photo for a case that is already in the store
+    case = db.query(MissingPersonCase).filter(MissingPersonCase.id == 2).one()
+    case.face_embedding = store.face_service.serialize_encoding(unit(9))
+    db.commit()
+
+    case_ids, scores = store.search(db, unit(9))
+    assert sorted(case_ids.tolist()) == [2, 3]
+    assert case_ids[np.argmax(scores)] == 2 and scores.max() > 0.99
+
+    # A fresh process sees the reconciled store without another pass
+    other = SharedEmbeddingStore(str(tmp_path / "store"))
+    manifest = other._refresh()
+    assert manifest["signature"] == other._signature(db)
+    assert len(other) == 2
+
+def test_previous_generation_stays_readable(db, tmp_path):
+    store = SharedEmbeddingStore(str(tmp_path / "store"))
+    add_case(db, store, 1, 1)
+    store.ensure_loaded(db)
+
+    # A reader read this manifest just before a writer switched generations
+    old_manifest = store._read_manifest()
+    store.rebuild(db)
+    assert store._read_manifest()["generation"] == old_manifest["generation"] + 1
+
+    embeddings, case_ids, active = store._open(old_manifest, "r")
+    assert case_ids[0] == 1
+
+    store.rebuild(db)
+    with pytest.raises(FileNotFoundError):
+        store._open(old_manifest, "r")
@@ -0,0 +1,46 @@
+from fastapi import HTTPException
+import pytest
+from app.services.job_queue import SightingJobQueue
+from app.services.processing_executor import processing_executor
+
+def test_dispatch_leaves_committed_job_when_pool_is_full(monkeypatch):
+    def saturated(sighting_id):
+        raise HTTPException(status_code=503, detail="full")
+    monkeypatch.setattr(processing_executor, "submit", saturated)
+
+    # Must not fail the request, the dispatcher retries the job
+    SightingJobQueue(dispatch_mode="executor").dispatch(1)
+
+def test_dispatch_raises_other_errors(monkeypatch):
+    def broken(sighting_id):
+        raise HTTPException(status_code=500, detail="broken")
+    monkeypatch.setattr(processing_executor, "submit", broken)
+
+    with pytest.raises(HTTPException):
+        SightingJobQueue(dispatch_mode="executor").dispatch(1)
+
+def test_claim_and_retry_use_utc(tmp_path):
+    from datetime import datetime, timedelta, timezone
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.models.database import Base
+    from app.models.models import Sighting
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    queue = SightingJobQueue(dispatch_mode="worker", lease_seconds=300, retry_backoff=60)
+
+    db.add(Sighting(id=1, file_path="a.jpg", file_type="image"))
+    queue.enqueue(db, 1)
+    db.commit()
+
+    job = queue.claim(db, "worker-1")
+    assert job is not None and job.attempts == 1
+    # SQLite keeps UTC wall-clock times without an offset
+    lease = job.lease_expires_at.replace(tzinfo=timezone.utc)
+    assert abs(lease - datetime.now(timezone.utc) - timedelta(seconds=300)) < timedelta(seconds=5)
+
+    queue.fail(db, job, "boom")
+    assert queue.claim(db, "worker-1") is None  # backing off
+    db.close()
@@ -0,0 +1,35 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models.database import Base
+from app.models.models import LocationHistory, Match, MissingPersonCase, Sighting, SightingFace
+from app.services.background_tasks import BackgroundTaskService
+from app.services.crop_pack import crop_packs
+
+def test_matches_are_upserted_per_case_and_sighting(tmp_path, monkeypatch):
+    monkeypatch.setattr(crop_packs, "match_files", False)
+    engine = create_engine(f"sqlite:///{tmp_path / 'matches.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    case = MissingPersonCase(id=1, name="case", photo_path="photo.jpg")
+    sighting = Sighting(id=1, file_path="a.jpg", file_type="image", latitude=1.0, longitude=2.0)
+    faces = [
+        SightingFace(id=i, sighting_id=1, crop_path="pack", crop_offset=i * 100, crop_length=100)
+        for i in (1, 2)
+    ]
+    db.add_all([case, sighting, *faces])
+    db.commit()
+
+    service = BackgroundTaskService()
+    assert len(service._write_matches(db, [(case, sighting, 0.7, faces[0])])) == 1
+    db.commit()
+
+    # A second worker matching the same pair adds nothing, a better face only updates the match
+    assert service._write_matches(db, [(case, sighting, 0.65, faces[1])]) == []
+    assert service._write_matches(db, [(case, sighting, 0.8, faces[1])]) == []
+    db.commit()
+
+    match = db.query(Match).one()
+    assert (match.confidence_score, match.matched_face_offset) == (0.8, 200)
+    assert db.query(LocationHistory).count() == 1
+    db.close()
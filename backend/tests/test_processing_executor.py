@@ -0,0 +1,23 @@
+import threading
+import time
+from app.services import processing_executor as executor_module
+from app.services.processing_executor import SightingProcessingExecutor
+
+def test_worker_processes_are_spawned():
+    executor = SightingProcessingExecutor(workers=1)
+    try:
+        assert executor._get_pool()._mp_context.get_start_method() == "spawn"
+    finally:
+        executor.shutdown()
+
+def test_shutdown_waits_for_running_sightings(monkeypatch):
+    monkeypatch.setattr(executor_module, "_process_sighting", lambda sighting_id: time.sleep(0.2))
+    executor = SightingProcessingExecutor(workers=0)
+    executor.submit(1)
+
+    stopper = threading.Thread(target=executor.shutdown)
+    stopper.start()
+    stopper.join(timeout=5)
+
+    assert not stopper.is_alive()
+    assert executor._pending == 0
@@ -0,0 +1,80 @@
+from sqlalchemy import create_engine, inspect, text
+from app.models.schema import upgrade_schema
+
+# Tables as created by earlier versions of the app
+LEGACY_TABLES = [
+    """CREATE TABLE sightings (
+        id INTEGER PRIMARY KEY,
+        file_path VARCHAR NOT NULL,
+        file_type VARCHAR NOT NULL,
+        latitude FLOAT,
+        longitude FLOAT,
+        location_name VARCHAR,
+        uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        processed BOOLEAN
+    )""",
+    """CREATE TABLE sighting_faces (
+        id INTEGER PRIMARY KEY,
+        sighting_id INTEGER NOT NULL REFERENCES sightings(id),
+        frame_index INTEGER,
+        face_index INTEGER,
+        box_top INTEGER,
+        box_right INTEGER,
+        box_bottom INTEGER,
+        box_left INTEGER,
+        crop_path VARCHAR,
+        embedding BLOB,
+        quality FLOAT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE matches (
+        id INTEGER PRIMARY KEY,
+        case_id INTEGER,
+        sighting_id INTEGER REFERENCES sightings(id),
+        confidence_score FLOAT NOT NULL,
+        matched_face_path VARCHAR,
+        verified BOOLEAN,
+        verified_by INTEGER,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""",
+]
+
+def _columns(engine, table):
+    return {column["name"] for column in inspect(engine).get_columns(table)}
+
+def test_upgrade_adds_missing_columns(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as connection:
+        for ddl in LEGACY_TABLES:
+            connection.execute(text(ddl))
+        connection.execute(text("INSERT INTO sightings (file_path, file_type, processed) VALUES ('a.jpg', 'image', 1)"))
+
+    upgrade_schema(engine)
+    # Running it again on an up to date database changes nothing
+    upgrade_schema(engine)
+
+    assert {"matched_at", "content_hash", "duplicate_of"} <= _columns(engine, "sightings")
+    assert "ix_sightings_content_hash" in {index["name"] for index in inspect(engine).get_indexes("sightings")}
+    with engine.connect() as connection:
+        rows = connection.execute(text("SELECT file_path, matched_at, content_hash, duplicate_of FROM sightings")).all()
+        assert rows == [("a.jpg", None, None, None)]
+    assert {"crop_offset", "crop_length"} <= _columns(engine, "sighting_faces")
+    assert {"matched_face_offset", "matched_face_length"} <= _columns(engine, "matches")
+
+def test_upgrade_keeps_one_match_per_case_and_sighting(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as connection:
+        for ddl in LEGACY_TABLES:
+            connection.execute(text(ddl))
+        connection.execute(text("INSERT INTO sightings (id, file_path, file_type, processed) VALUES (1, 'a.jpg', 'image', 1)"))
+        connection.execute(text(
+            "INSERT INTO matches (id, case_id, sighting_id, confidence_score, verified) VALUES "
+            "(1, 7, 1, 0.7, 0), (2, 7, 1, 0.9, 0), (3, 7, 1, 0.65, 1), (4, 8, 1, 0.7, 0), (5, 8, 1, 0.7, 0)"
+        ))
+
+    upgrade_schema(engine)
+
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT id FROM matches ORDER BY id")).scalars().all() == [3, 4]
+    indexes = {index["name"]: index for index in inspect(engine).get_indexes("matches")}
+    assert indexes["ix_matches_case_id_sighting_id"]["unique"]
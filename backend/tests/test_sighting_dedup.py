@@ -0,0 +1,8 @@
+from app.services.sighting_dedup import SightingDeduplicator
+
+def test_perceptual_dedup_is_opt_in(monkeypatch):
+    monkeypatch.delenv("SIGHTING_DEDUP", raising=False)
+    assert SightingDeduplicator().mode == "exact"
+
+    monkeypatch.setenv("SIGHTING_DEDUP", "perceptual")
+    assert SightingDeduplicator().mode == "perceptual"
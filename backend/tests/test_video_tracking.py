@@ -0,0 +1,106 @@
+import numpy as np
+from app.utils import face_recognition as face_module
+from app.utils.face_recognition import DetectedFace, FaceRecognitionService
+
+class FakeSampler:
+    def __init__(self, frames):
+        self.frames = frames
+
+    def iter_frames(self, video_path):
+        return iter(self.frames)
+
+def _crop(seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    # Very different intensity ranges so the two people do not merge
+    low, high = (0, 90) if seed == 0 else (160, 256)
+    return rng.integers(low, high, size=(60, 60, 3), dtype=np.uint8)
+
+def test_tracked_video_faces_get_embeddings(monkeypatch):
+    monkeypatch.setenv("FACE_TRACKING", "true")
+    monkeypatch.setenv("VIDEO_WORKERS", "0")
+    monkeypatch.setattr(face_module, "FACE_RECOGNITION_AVAILABLE", False)
+    service = FaceRecognitionService()
+
+    boxes = [(0, 60, 60, 0), (0, 260, 60, 200)]
+    crops = [_crop(0), _crop(1)]
+
+    def detect(frame, frame_index=0, encode=True):
+        return [
+            DetectedFace(box=box, encoding=None, crop=crop, frame_index=frame_index, face_index=i)
+            for i, (box, crop) in enumerate(zip(boxes, crops))
+        ]
+    monkeypatch.setattr(service, "detect_faces_in_frame", detect)
+
+    frames = [(index, np.zeros((100, 300, 3), dtype=np.uint8)) for index in range(3)]
+    faces = service.detect_and_encode_video("video.mp4", sampler=FakeSampler(frames), parallel=False)
+
+    assert len(faces) == 2
+    for face in faces:
+        assert isinstance(face.encoding, np.ndarray)
+        assert face.encoding.dtype.kind == "f"
+        assert face.track_length == 3
+        # The stored form round-trips
+        assert service.deserialize_encoding(service.serialize_encoding(face.encoding)).shape == face.encoding.shape
+
+def test_crop_jpeg_is_separate_from_embedding():
+    service = FaceRecognitionService()
+    face = DetectedFace(box=(0, 60, 60, 0), encoding=None, crop=_crop(0))
+    assert service.encode_crop_jpeg(face)[:3] == b"\xff\xd8\xff"
+
+def test_two_people_one_after_another_stay_separate(monkeypatch):
+    monkeypatch.setenv("FACE_TRACKING", "true")
+    monkeypatch.setenv("VIDEO_WORKERS", "0")
+    monkeypatch.setattr(face_module, "FACE_RECOGNITION_AVAILABLE", False)
+    service = FaceRecognitionService()
+
+    # Two different people in front of a fixed camera, the second after the first has left
+    rng = np.random.default_rng(7)
+    people = [rng.integers(0, 256, size=(60, 60, 3), dtype=np.uint8) for _ in range(2)]
+    visible = {0: 0, 1: 0, 5: 1, 6: 1}
+
+    def detect(frame, frame_index=0, encode=True):
+        if frame_index not in visible:
+            return []
+        return [DetectedFace(box=(0, 60, 60, 0), encoding=None, crop=people[visible[frame_index]], frame_index=frame_index)]
+    monkeypatch.setattr(service, "detect_faces_in_frame", detect)
+
+    frames = [(index, np.zeros((100, 300, 3), dtype=np.uint8)) for index in range(7)]
+    faces = service.detect_and_encode_video("video.mp4", sampler=FakeSampler(frames), parallel=False)
+
+    # OpenCV embeddings of different people score above the case threshold
+    assert service.compare_faces(faces[0].encoding, faces[1].encoding) >= service.threshold
+    assert len(faces) == 2
+    assert [(face.first_frame, face.last_frame) for face in faces] == [(0, 1), (5, 6)]
+
+def _track(encoding, first_frame, last_frame, quality=1.0):
+    return DetectedFace(
+        box=(0, 60, 60, 0), encoding=np.asarray(encoding, dtype=np.float32), crop=_crop(0),
+        frame_index=first_frame, quality=quality, first_frame=first_frame, last_frame=last_frame
+    )
+
+def test_dlib_tracks_merge_against_the_group_without_chaining(monkeypatch):
+    monkeypatch.setenv("FACE_TRACKING", "true")
+    monkeypatch.setattr(face_module, "FACE_RECOGNITION_AVAILABLE", True)
+    service = FaceRecognitionService()
+    service.backend = "dlib"
+
+    a = np.zeros(128)
+    b = a.copy(); b[0] = 0.25  # 0.25 from A: same person
+    c = a.copy(); c[0] = 0.5   # 0.25 from B but 0.5 from A: someone else
+    faces = service._merge_tracks([_track(a, 0, 2), _track(b, 5, 6, quality=2.0), _track(c, 9, 10)])
+
+    assert len(faces) == 2
+    assert faces[0].encoding[0] == 0.25 and faces[0].track_length == 2
+    assert (faces[0].first_frame, faces[0].last_frame) == (0, 6)
+    assert faces[1].encoding[0] == 0.5
+
+    # Tracks visible at the same time are different people however alike they look
+    assert len(service._merge_tracks([_track(a, 0, 4), _track(a, 3, 6)])) == 2
+
+def test_video_pool_is_spawned(monkeypatch):
+    monkeypatch.setattr(face_module, "_video_pool", None)
+    pool = face_module._get_video_pool(1)
+    try:
+        assert pool._mp_context.get_start_method() == "spawn"
+    finally:
+        pool.shutdown()